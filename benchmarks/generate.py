@@ -0,0 +1,115 @@
+"""
+Generate reproducible synthetic operator data for the benchmarks
+
+The same seed, rows and operators always give the same files.
+"""
+import os
+import sys
+import random
+import itertools
+import argparse
+
+# rows are written this many at a time
+CHUNK_ROWS = 10000
+
+
+def gen_rows(rng, rows, max_extension_length=7):
+    """Yield random "extension,price" lines
+
+    Arguments:
+        rng {obj} -- random.Random
+        rows {int} -- number of lines
+
+    Keyword Arguments:
+        max_extension_length {int} -- longest extension (default: {7})
+    """
+    for _ in xrange(rows):
+        length = rng.randint(1, max_extension_length)
+        yield "{},0.{:04d}\n".format(
+            rng.randint(10 ** (length - 1), 10 ** length - 1),
+            rng.randint(0, 9999)
+        )
+
+
+def gen_phonenos(seed, count, length=10):
+    """Yield random phone numbers
+
+    Arguments:
+        seed {int} -- random seed
+        count {int} -- number of phone numbers
+
+    Keyword Arguments:
+        length {int} -- digits per phone number (default: {10})
+    """
+    rng = random.Random(seed)
+    for _ in xrange(count):
+        yield str(rng.randint(10 ** (length - 1), 10 ** length - 1))
+
+
+def generate(outdir, rows, operators, seed=0):
+    """Write rows lines spread over operators operator files in outdir
+
+    Arguments:
+        outdir {str} -- directory to write to, created if needed
+        rows {int} -- total number of lines
+        operators {int} -- number of operator files
+
+    Keyword Arguments:
+        seed {int} -- random seed (default: {0})
+
+    Returns:
+        list -- paths of the files written
+    """
+    if not os.path.isdir(outdir):
+        os.makedirs(outdir)
+    file_paths = []
+    for operator in xrange(operators):
+        # one generator per operator, so each file only depends on
+        # the seed and its own number of rows
+        rng = random.Random("{}-{}".format(seed, operator))
+        operator_rows = rows // operators + (operator < rows % operators)
+        file_path = os.path.join(
+            outdir, "operator{:04d}.operator".format(operator)
+        )
+        with open(file_path, "w") as operator_file:
+            lines = gen_rows(rng, operator_rows)
+            while True:
+                chunk = "".join(itertools.islice(lines, CHUNK_ROWS))
+                if not chunk:
+                    break
+                operator_file.write(chunk)
+        file_paths.append(file_path)
+    return file_paths
+
+
+def parse(args):
+    """Parse command line arguments
+
+    Arguments:
+        args {list} -- list of arguments/values
+
+    Returns:
+        dict -- parsed arguments
+    """
+    parser = argparse.ArgumentParser(
+        description="Generate reproducible synthetic operator files."
+    )
+    parser.add_argument("outdir", metavar="<path>", help="Directory to write to.")
+    parser.add_argument(
+        "--rows", "-r", metavar="<rows>", type=int, default=100000,
+        help="Total number of lines."
+    )
+    parser.add_argument(
+        "--operators", "-o", metavar="<operators>", type=int, default=8,
+        help="Number of operator files."
+    )
+    parser.add_argument(
+        "--seed", "-s", metavar="<seed>", type=int, default=0,
+        help="Random seed."
+    )
+    return vars(parser.parse_args(args))
+
+
+if __name__ == "__main__":
+    PARSED = parse(sys.argv[1:])
+    generate(PARSED["outdir"], PARSED["rows"], PARSED["operators"], PARSED["seed"])
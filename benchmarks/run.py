@@ -0,0 +1,284 @@
+"""
+Run the benchmarks and write the results as json
+
+Each case runs in its own process, so its peak RSS is its own.
+A dataset is generated with benchmarks.generate unless one is given.
+
+    $ python -m benchmarks.run --rows 100000 --operators 8 -o bench.json
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+import collections
+
+from cheap_caller import helpers
+from cheap_caller import index
+from cheap_caller import shared
+from cheap_caller import store
+from cheap_caller import vectorized
+from benchmarks import generate
+
+
+def _file_paths(args):
+    return list(helpers.gen_find("*.operator", args["data"]))
+
+
+def _phonenos(args):
+    return list(generate.gen_phonenos(args["seed"], args["lookups"]))
+
+
+def case_ingest(args):
+    """Parse and index all the operator files"""
+    prefix_index = index.build_index_in_pool(_file_paths(args))
+    return {"count": len(prefix_index)}
+
+
+def case_ingest_workers(args):
+    """Parse and index all the operator files in a process pool"""
+    prefix_index = index.build_index_in_pool(
+        _file_paths(args), workers=args["workers"]
+    )
+    return {"count": len(prefix_index), "workers": args["workers"]}
+
+
+def case_compile(args):
+    """Compile all the operator files into an index file"""
+    store.compile_index(args["index"], _file_paths(args))
+    return {"count": 1}
+
+
+def case_single_lookup_legacy(args):
+    """One lookup with the original linear scan over every line"""
+    phoneno = _phonenos(args)[0]
+    dictseq = helpers.map_from_fileobj_to_lines(
+        helpers.open_files(_file_paths(args))
+    )
+    helpers.get_cheapest_per_operator(dictseq, helpers.gen_right_triangle(phoneno))
+    return {"count": 1}
+
+
+def case_single_lookup(args):
+    """One lookup, indexing only the lines starting with its first digit"""
+    phoneno = _phonenos(args)[0]
+    index.build_index_in_pool(_file_paths(args), phoneno[0]).lookup(phoneno)
+    return {"count": 1}
+
+
+def case_single_lookup_stored(args):
+    """One lookup in a precompiled index file, including the stale check"""
+    phoneno = _phonenos(args)[0]
+    store.open_index(args["index"], _file_paths(args)).lookup(phoneno)
+    return {"count": 1}
+
+
+def _timed_lookups(prefix_index, phonenos, batch):
+    """Look up phonenos in a loaded index, timing only the lookups"""
+    start = time.time()
+    if batch:
+        for chunk in helpers.gen_chunks(phonenos, 10000):
+            prefix_index.lookup_many(chunk)
+    else:
+        for phoneno in phonenos:
+            prefix_index.lookup(phoneno)
+    return {"count": len(phonenos), "lookup_seconds": time.time() - start}
+
+
+def _table_bytes(prefix_index):
+    """Bytes held by the key and price columns of the rate tables"""
+    return sum(
+        len(table) * (table.keys.itemsize + table.prices.itemsize)
+        for _, table in prefix_index.tables()
+    )
+
+
+def case_lookups(args):
+    """Many lookups one at a time in a loaded index"""
+    prefix_index = index.build_index_in_pool(_file_paths(args))
+    return _timed_lookups(prefix_index, _phonenos(args), False)
+
+
+def case_batch_lookups(args):
+    """Many lookups in chunks with lookup_many(), vectorized if possible"""
+    prefix_index = index.build_index_in_pool(_file_paths(args))
+    result = _timed_lookups(prefix_index, _phonenos(args), True)
+    result["vectorized"] = vectorized.available()
+    result["index_bytes"] = _table_bytes(prefix_index)
+    return result
+
+
+def case_batch_lookups_shared(args):
+    """Many lookups in chunks with the rate tables merged into a SharedIndex"""
+    prefix_index = index.build_index_in_pool(_file_paths(args))
+    table_bytes = _table_bytes(prefix_index)
+    shared_index = shared.SharedIndex.from_tables(prefix_index.tables())
+    del prefix_index
+    result = _timed_lookups(shared_index, _phonenos(args), True)
+    result["index_bytes"] = shared_index.nbytes()
+    result["table_bytes"] = table_bytes
+    return result
+
+
+def case_batch_lookups_stored(args):
+    """Many lookups in chunks in a precompiled index file"""
+    prefix_index = store.open_index(args["index"], _file_paths(args))
+    result = _timed_lookups(prefix_index, _phonenos(args), True)
+    result["vectorized"] = vectorized.available()
+    return result
+
+
+CASES = collections.OrderedDict([
+    ("ingest", case_ingest),
+    ("ingest-workers", case_ingest_workers),
+    ("compile", case_compile),
+    ("single-lookup-legacy", case_single_lookup_legacy),
+    ("single-lookup", case_single_lookup),
+    ("single-lookup-stored", case_single_lookup_stored),
+    ("lookups", case_lookups),
+    ("batch-lookups", case_batch_lookups),
+    ("batch-lookups-stored", case_batch_lookups_stored),
+    ("batch-lookups-shared", case_batch_lookups_shared),
+])
+
+
+def run_case(args):
+    """Run one case in this process and print its result as json
+
+    Arguments:
+        args {dict} -- parsed command line arguments
+    """
+    start = time.time()
+    result = CASES[args["case"]](args)
+    result["seconds"] = time.time() - start
+    result["peak_rss_kb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    sys.stdout.write(json.dumps(result) + "\n")
+
+
+def run_cases(args):
+    """Run every selected case in a child process
+
+    Arguments:
+        args {dict} -- parsed command line arguments
+
+    Returns:
+        list -- one result dict per case
+    """
+    results = []
+    for case in args["cases"]:
+        command = [
+            sys.executable, "-m", "benchmarks.run", "--case", case,
+            "--data", args["data"], "--index", args["index"],
+            "--lookups", str(args["lookups"]), "--seed", str(args["seed"]),
+            "--workers", str(args["workers"]),
+        ]
+        output = subprocess.check_output(command)
+        result = json.loads(output.splitlines()[-1])
+        result["case"] = case
+        if "lookup_seconds" in result:
+            result["per_second"] = result["count"] / max(result["lookup_seconds"], 1e-9)
+        sys.stderr.write("{case}: {seconds:.3f}s\n".format(**result))
+        results.append(result)
+    return results
+
+
+def parse(args):
+    """Parse command line arguments
+
+    Arguments:
+        args {list} -- list of arguments/values
+
+    Returns:
+        dict -- parsed arguments
+    """
+    parser = argparse.ArgumentParser(
+        description="Benchmark the CheapCaller lookup pipeline."
+    )
+    parser.add_argument(
+        "--data", "-d", metavar="<path>", default=None,
+        help="Directory of operator files, generated if not given."
+    )
+    parser.add_argument(
+        "--rows", "-r", metavar="<rows>", type=int, default=100000,
+        help="Total number of lines of the generated operator files."
+    )
+    parser.add_argument(
+        "--operators", metavar="<operators>", type=int, default=8,
+        help="Number of generated operator files."
+    )
+    parser.add_argument(
+        "--lookups", "-n", metavar="<lookups>", type=int, default=10000,
+        help="Number of phone numbers looked up."
+    )
+    parser.add_argument(
+        "--seed", "-s", metavar="<seed>", type=int, default=0,
+        help="Random seed of the generated data and phone numbers."
+    )
+    parser.add_argument(
+        "--workers", "-w", metavar="<workers>", type=int,
+        default=max(2, os.sysconf("SC_NPROCESSORS_ONLN")),
+        help="Number of worker processes of the ingest-workers case."
+    )
+    parser.add_argument(
+        "--cases", "-c", metavar="<case>", nargs="+",
+        default=list(CASES), choices=list(CASES),
+        help="Cases to run, all by default."
+    )
+    parser.add_argument(
+        "--output", "-o", metavar="<file>", default="-",
+        help="File to write the json results to, - for stdout."
+    )
+    parser.add_argument("--case", choices=list(CASES), help=argparse.SUPPRESS)
+    parser.add_argument("--index", help=argparse.SUPPRESS)
+    return vars(parser.parse_args(args))
+
+
+def main(args):
+    """Generate the dataset if needed, run the cases and write the results
+
+    Arguments:
+        args {dict} -- parsed command line arguments
+    """
+    if args["case"]:
+        run_case(args)
+        return
+    tmpdir = tempfile.mkdtemp(prefix="cheap_caller_bench")
+    try:
+        if not args["data"]:
+            args["data"] = os.path.join(tmpdir, "data")
+            generate.generate(
+                args["data"], args["rows"], args["operators"], args["seed"]
+            )
+        args["index"] = os.path.join(tmpdir, "bench.index")
+        report = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "numpy": vectorized.available(),
+            "dataset": {
+                "data": args["data"],
+                "rows": args["rows"],
+                "operators": args["operators"],
+                "bytes": sum(os.path.getsize(path) for path in _file_paths(args)),
+                "seed": args["seed"],
+            },
+            "lookups": args["lookups"],
+            "results": run_cases(args),
+        }
+    finally:
+        shutil.rmtree(tmpdir)
+    encoded = json.dumps(report, indent=4, sort_keys=True)
+    if args["output"] == "-":
+        sys.stdout.write(encoded + "\n")
+    else:
+        with open(args["output"], "w") as output:
+            output.write(encoded + "\n")
+
+
+if __name__ == "__main__":
+    main(parse(sys.argv[1:]))
@@ -1,24 +1,157 @@
 """
 This is the runner, entrypoint to CheapCaller application
 """
+import os
 import sys
 import json
+import errno
+import signal
 
 from cheap_caller import parser
+from cheap_caller import discovery
 from cheap_caller import helpers
+from cheap_caller import index
+from cheap_caller import store
+from cheap_caller import stats
 
+# the modules of the other commands are imported by them,
+# a single lookup only imports what it runs
 
-def main():
-    """The main function which gets called when this script is invoked
+
+def find_files(args):
+    """Find the operator files matching the pattern and include patterns,
+    but no exclude pattern
+
+    Arguments:
+        args {dict} -- parsed command line arguments
+
+    Returns:
+        list -- sorted full paths of the operator files
     """
-    args = parser.parse(sys.argv[1:])
-    # Read the logging conf file
-    helpers.read_logging_conf_file()
-    # Configure the logger
-    logger = helpers.configure_logger(
-        "cheap_caller",
-        args.get("log_level"),
+    return discovery.find(
+        args.get("operatordir"),
+        [args.get("pattern")] + args.get("include", []),
+        args.get("exclude", []),
+        args.get("manifest"),
+        args.get("scan_threads", 1)
     )
+
+
+def get_index_path(args):
+    """Get the index file to use, None if there is none
+
+    Arguments:
+        args {dict} -- parsed command line arguments
+
+    Returns:
+        str -- path to the index file
+    """
+    if args.get("index"):
+        return args.get("index")
+    index_path = store.default_index_path(args.get("operatordir"))
+    if os.path.exists(index_path):
+        return index_path
+    return None
+
+
+def get_memory_budget(args):
+    """Get the memory budget of an index compilation in bytes
+
+    Arguments:
+        args {dict} -- parsed command line arguments
+
+    Returns:
+        int -- memory budget in bytes, None for no limit
+    """
+    if args.get("memory_budget") is None:
+        return None
+    return args.get("memory_budget") << 20
+
+
+def share_index(args, prefix_index):
+    """Merge the rate tables of an index into a SharedIndex if asked to,
+    the one of an index file is kept next to it
+
+    Arguments:
+        args {dict} -- parsed command line arguments
+        prefix_index {obj} -- PrefixIndex, or StoredIndex if there is
+                              an index file
+
+    Returns:
+        obj -- SharedIndex, or prefix_index as is
+    """
+    if not args.get("shared"):
+        return prefix_index
+    from cheap_caller import shared
+    with stats.timer("share"):
+        if get_index_path(args):
+            return shared.open_shared(prefix_index)
+        return shared.SharedIndex.from_tables(prefix_index.tables())
+
+
+def load_index(args, prefix=""):
+    """Run the operator data processing pipeline and build a PrefixIndex,
+    or open the precompiled index file if there is one
+
+    Arguments:
+        args {dict} -- parsed command line arguments
+
+    Keyword Arguments:
+        prefix {str} -- only index the lines starting with it (default: {""})
+
+    Returns:
+        obj -- PrefixIndex, StoredIndex or SharedIndex
+    """
+    # find all the operator files
+    with stats.timer("find"):
+        filepaths = find_files(args)
+    index_path = get_index_path(args)
+    if index_path:
+        # recompiled if stale
+        with stats.timer("open_index"):
+            prefix_index = store.open_index(
+                index_path, filepaths, args.get("workers"),
+                get_memory_budget(args)
+            )
+    else:
+        # each file is parsed and indexed, in worker processes if asked to,
+        # the stats of the workers are added to the ones of this process
+        with stats.timer("index"):
+            prefix_index = index.build_index_in_pool(
+                filepaths, prefix, args.get("workers")
+            )
+    return share_index(args, prefix_index)
+
+
+def lookup_top(prefix_index, phoneno, top, logger):
+    """Find the top cheapest operators for a single phone number
+
+    Arguments:
+        prefix_index {obj} -- PrefixIndex or StoredIndex
+        phoneno {str} -- sanitized phone number
+        top {int} -- number of operators to rank
+        logger {obj} -- logger
+    """
+    with stats.timer("lookup"):
+        ranked = prefix_index.lookup_top(phoneno, top)
+    if not ranked:
+        logger.error("No match for given number in any operators, exiting")
+        sys.exit(1)
+    for rank, (operator, extension, price) in enumerate(ranked, 1):
+        logger.info(
+            "Cheapest %s for no: %s is operator: %s"
+            " and price: %s (extension: %s)",
+            rank, phoneno, operator, price, extension
+        )
+
+
+def lookup(args, logger):
+    """Find the cheapest operator for a single phone number
+
+    Arguments:
+        args {dict} -- parsed command line arguments
+        logger {obj} -- logger
+    """
     # Sanitize phone number(strip +, 00, -)
     # Exit if invalid
     try:
@@ -35,25 +168,14 @@ def main():
             "%s is not valid, exiting", args.get("phoneno")
         )
         sys.exit(1)
-    # Get all the extensions starting from the full phonenumber
-    # working backwards to the first digit in phone number
-    extensions = helpers.gen_right_triangle(phoneno)
-    # Operator data processing pipeline
-    # find all the operator files
-    filepaths = helpers.gen_find(
-        args.get("pattern"),
-        args.get("operatordir")
-    )
-    # dictseq is a generator which yields a sequence of dicts
-    # each dict has two items {"name": operator name, "source": sequence of fileobj}
-    dictseq = helpers.open_files(filepaths)
-    # each dict now has two items {"name": operator name, "source": sequence of lines}
-    dictseq = helpers.map_from_fileobj_to_lines(dictseq)
-    # We get the cheapest per operator
-    cheapest_per_operator = helpers.get_cheapest_per_operator(
-        dictseq,
-        extensions
-    )
+    # Build a prefix index of the lines starting with the first digit
+    # then get the cheapest per operator with a longest prefix match
+    prefix_index = load_index(args, phoneno[0])
+    if args.get("top"):
+        lookup_top(prefix_index, phoneno, args.get("top"), logger)
+        return
+    with stats.timer("lookup"):
+        cheapest_per_operator = prefix_index.lookup(phoneno)
     if not cheapest_per_operator:
         logger.error("No match for given number in any operators, exiting")
         sys.exit(1)
@@ -70,5 +192,332 @@ def main():
     )
 
 
+def log_cache_info(cached_index, logger):
+    """Log the counters of a lookup result cache,
+    also added to the stats if enabled
+
+    Arguments:
+        cached_index {obj} -- CachedIndex
+        logger {obj} -- logger
+    """
+    info = cached_index.info()
+    logger.info("Result cache: %s", json.dumps(info, sort_keys=True))
+    for name in ("hits", "misses", "evictions"):
+        stats.count("cache_" + name, info[name])
+
+
+def batch_lookup(args, logger):
+    """Find the cheapest operator for each phone number in a file or stdin
+    and stream the results to stdout
+
+    Arguments:
+        args {dict} -- parsed command line arguments
+        logger {obj} -- logger
+    """
+    from cheap_caller import batch
+    from cheap_caller import cache
+    # The operator data is loaded and indexed once for all the numbers
+    prefix_index = load_index(args)
+    logger.info("Indexed %s operators", len(prefix_index))
+    if args.get("cache_size"):
+        prefix_index = cache.CachedIndex(prefix_index, args.get("cache_size"))
+    if args.get("input") == "-":
+        source = sys.stdin
+    else:
+        source = open(args.get("input"))
+    with source, stats.timer("batch"):
+        results = batch.gen_results(
+            prefix_index,
+            batch.gen_numbers(source),
+            top=args.get("top")
+        )
+        if args.get("format") == "jsonl":
+            batch.write_jsonl(results, sys.stdout)
+        else:
+            batch.write_csv(results, sys.stdout, ranked=bool(args.get("top")))
+    if args.get("cache_size"):
+        log_cache_info(prefix_index, logger)
+
+
+def price_calls(args, logger):
+    """Sum the cost of the calls in a file or stdin on each operator
+    and with the cheapest operator of each call, written to stdout
+
+    Arguments:
+        args {dict} -- parsed command line arguments
+        logger {obj} -- logger
+    """
+    from cheap_caller import cdr
+    prefix_index = load_index(args)
+    logger.info("Indexed %s operators", len(prefix_index))
+    if args.get("input") == "-":
+        source = sys.stdin
+    else:
+        source = open(args.get("input"))
+    with source, stats.timer("cdr"):
+        totals = cdr.aggregate(prefix_index.tables(), cdr.gen_calls(source))
+    logger.info(
+        "Priced %s calls, %s invalid, %s unmatched",
+        totals["calls"], totals["invalid"], totals["unmatched"]
+    )
+    cdr.write_json(totals, sys.stdout, args.get("unit"))
+
+
+def compile_index(args, logger):
+    """Compile the operator files into an index file
+
+    Arguments:
+        args {dict} -- parsed command line arguments
+        logger {obj} -- logger
+    """
+    index_path = args.get("index") or store.default_index_path(
+        args.get("operatordir")
+    )
+    filepaths = find_files(args)
+    with stats.timer("compile"):
+        store.compile_index(
+            index_path, filepaths, args.get("workers"), get_memory_budget(args)
+        )
+    logger.info("Compiled index: %s", index_path)
+    if args.get("shared"):
+        # merged now, not on the first load of the index
+        from cheap_caller import shared
+        stored_index = store.StoredIndex(index_path)
+        stored_index.apply_deltas()
+        with stats.timer("share"):
+            shared.open_shared(stored_index)
+        stored_index.close()
+        logger.info(
+            "Merged shared index: %s%s", index_path, shared.SHARED_SUFFIX
+        )
+
+
+def write_routes(args, logger):
+    """Write the least cost routing table of the operator files as csv
+
+    Arguments:
+        args {dict} -- parsed command line arguments
+        logger {obj} -- logger
+    """
+    from cheap_caller import lcr
+    prefix_index = load_index(args)
+    if args.get("output") == "-":
+        out = sys.stdout
+    else:
+        out = open(args.get("output"), "wb")
+    try:
+        with out, stats.timer("lcr"):
+            count = lcr.write_csv(lcr.gen_routes(prefix_index.tables()), out)
+    except IOError as error:
+        # the reader stopped reading, e.g. lcr | head
+        if error.errno != errno.EPIPE:
+            raise
+        return
+    logger.info(
+        "Wrote %s routes of %s operators", count, len(prefix_index)
+    )
+
+
+def summarize(args, logger):
+    """Write a summary next to each operator file
+
+    Arguments:
+        args {dict} -- parsed command line arguments
+        logger {obj} -- logger
+    """
+    from cheap_caller import summary
+    # compressed files can not be read from the middle
+    filepaths = (
+        filepath for filepath in find_files(args)
+        if not helpers.is_compressed(filepath)
+    )
+    with stats.timer("summarize"):
+        summaries = list(helpers.map_in_pool(
+            summary.write_summary, filepaths, args.get("workers")
+        ))
+    logger.info("Summarized %s operator files", len(summaries))
+
+
+def compact(args, logger):
+    """Apply the delta files of each operator file to it
+    and remove them
+
+    Arguments:
+        args {dict} -- parsed command line arguments
+        logger {obj} -- logger
+    """
+    from cheap_caller import delta
+    delta_paths = delta.find_deltas(find_files(args))
+    with stats.timer("compact"):
+        compacted = [
+            count for count in helpers.map_in_pool(
+                delta.compact, sorted(delta_paths), args.get("workers")
+            )
+            if count is not None
+        ]
+    logger.info("Compacted the deltas of %s operator files", len(compacted))
+    if len(compacted) < len(delta_paths):
+        logger.error(
+            "Left the deltas of %s operator files, see the errors above",
+            len(delta_paths) - len(compacted)
+        )
+
+
+def serve(args, logger):
+    """Load the operator data once and answer lookups over a socket
+    until interrupted, reloading the operator data if asked to watch it
+
+    Arguments:
+        args {dict} -- parsed command line arguments
+        logger {obj} -- logger
+    """
+    from cheap_caller import cache
+    from cheap_caller import reloader
+    from cheap_caller import server
+    index_path = get_index_path(args)
+    if index_path:
+        index_reloader = reloader.StoredIndexReloader(
+            args.get("pattern"), args.get("operatordir"), index_path,
+            get_memory_budget(args), workers=args.get("workers"),
+            find=lambda: find_files(args)
+        )
+    else:
+        index_reloader = reloader.IndexReloader(
+            args.get("pattern"), args.get("operatordir"), args.get("workers"),
+            lambda: find_files(args)
+        )
+    index_reloader.reload()
+    prefix_index = share_index(args, index_reloader.prefix_index)
+    if not args.get("watch"):
+        # not reloaded, only the index looked up in is kept
+        index_reloader = None
+    address = args.get("socket") or (server.DEFAULT_HOST, args.get("port"))
+    cached_index = None
+    if args.get("cache_size"):
+        cached_index = cache.CachedIndex(prefix_index, args.get("cache_size"))
+    lookup_server = server.make_server(cached_index or prefix_index, address)
+    logger.info(
+        "Serving lookups of %s operators on: %s", len(prefix_index), address
+    )
+    if args.get("watch"):
+        def on_reload(reloaded_index):
+            """Swap the index the server looks up in,
+            the cached results are dropped"""
+            reloaded_index = share_index(args, reloaded_index)
+            if cached_index is not None:
+                cached_index.swap(reloaded_index)
+            else:
+                lookup_server.prefix_index = reloaded_index
+            logger.info("Reloaded %s operators", len(reloaded_index))
+        reloader.Watcher(index_reloader, args.get("watch"), on_reload).start()
+    # exit cleanly on SIGTERM too, e.g. when stopped by a service manager
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        lookup_server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("Interrupted, exiting")
+    finally:
+        lookup_server.server_close()
+        if cached_index is not None:
+            log_cache_info(cached_index, logger)
+        if args.get("socket"):
+            os.remove(args.get("socket"))
+
+
+def split_shards(args, logger):
+    """Split the operator files into one directory per shard
+
+    Arguments:
+        args {dict} -- parsed command line arguments
+        logger {obj} -- logger
+    """
+    from cheap_caller import shard
+    filepaths = find_files(args)
+    try:
+        with stats.timer("shard"):
+            counts = shard.split(
+                filepaths, args.get("operatordir"), args.get("output"),
+                args.get("shards"), args.get("workers")
+            )
+    except ValueError as error:
+        logger.error("Failed to split: %s", str(error))
+        sys.exit(1)
+    for position, count in enumerate(counts):
+        logger.info(
+            "Wrote %s lines of %s operator files to: %s", count,
+            len(filepaths), shard.shard_path(args.get("output"), position)
+        )
+
+
+def route(args, logger):
+    """Answer lookups over a socket by forwarding them to the shard
+    servers, until interrupted
+
+    Arguments:
+        args {dict} -- parsed command line arguments
+        logger {obj} -- logger
+    """
+    from cheap_caller import server
+    from cheap_caller import shard
+    address = args.get("socket") or (server.DEFAULT_HOST, args.get("port"))
+    try:
+        router = shard.make_router(
+            args.get("shards"), address, args.get("timeout")
+        )
+    except ValueError as error:
+        logger.error("Invalid shards: %s", str(error))
+        sys.exit(1)
+    logger.info(
+        "Routing lookups to %s shards on: %s", len(args.get("shards")), address
+    )
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        router.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("Interrupted, exiting")
+    finally:
+        router.server_close()
+        if args.get("socket"):
+            os.remove(args.get("socket"))
+
+
+COMMANDS = {
+    "lookup": lookup,
+    "batch": batch_lookup,
+    "cdr": price_calls,
+    "compact": compact,
+    "compile": compile_index,
+    "lcr": write_routes,
+    "route": route,
+    "serve": serve,
+    "shard": split_shards,
+    "summarize": summarize,
+}
+
+
+def main():
+    """The main function which gets called when this script is invoked
+    """
+    args = parser.parse(sys.argv[1:])
+    # Read the logging conf file,
+    # debug.log is only written to at the debug log level
+    helpers.read_logging_conf_file(
+        file_handlers=args.get("log_level") == "debug"
+    )
+    # Configure the logger
+    logger = helpers.configure_logger(
+        "cheap_caller",
+        args.get("log_level"),
+    )
+    if args.get("profile"):
+        stats.enable()
+    try:
+        COMMANDS[args.get("command")](args, logger)
+    finally:
+        # also on sys.exit(), e.g. when nothing matched
+        if stats.ENABLED:
+            stats.write_summary(sys.stderr)
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,172 @@
+"""
+Library interface, for embedding CheapCaller in another process
+
+The operator data is loaded once and looked up from any number of
+threads. A reload builds the new index on the side and swaps it in with
+a single assignment, a lookup uses the index it started with. Nothing
+here configures logging or exits the process, errors are raised.
+"""
+
+import logging
+import threading
+
+from cheap_caller import cache
+from cheap_caller import helpers
+from cheap_caller import normalize
+from cheap_caller import reloader
+
+
+LOGGER = logging.getLogger(__name__)
+
+# keyword arguments of CheapCaller and their defaults
+_OPTIONS = {
+    "workers": 1,
+    "index_path": None,
+    "cache_size": 0,
+}
+
+
+class CheapCaller(object):
+    """Cheapest operators of phone numbers, from the operator files
+    found in a directory tree
+
+    Arguments:
+        operatordir {str} -- directory to look for operator files in
+
+    Keyword Arguments:
+        pattern {str} -- operator file pattern (default: {"*.operator"})
+        workers {int} -- number of worker processes parsing files (default: {1})
+        index_path {str} -- precompiled index file to use, compiled if
+                            missing or stale, None to index in memory
+                            (default: {None})
+        cache_size {int} -- number of matched prefixes whose results are
+                            cached, 0 for no cache (default: {0})
+
+    Raises:
+        TypeError -- if given another keyword argument
+    """
+
+    def __init__(self, operatordir, pattern="*.operator", **options):
+        unknown = sorted(set(options) - set(_OPTIONS))
+        if unknown:
+            raise TypeError(
+                "Unexpected keyword arguments: {}".format(", ".join(unknown))
+            )
+        options = dict(_OPTIONS, **options)
+        if options["index_path"]:
+            self._reloader = reloader.StoredIndexReloader(
+                pattern, operatordir, options["index_path"],
+                workers=options["workers"]
+            )
+        else:
+            self._reloader = reloader.IndexReloader(
+                pattern, operatordir, options["workers"]
+            )
+        # reloads one at a time, lookups never wait for it
+        self._lock = threading.Lock()
+        self._reloader.reload()
+        self._cached_index = None
+        if options["cache_size"]:
+            self._cached_index = cache.CachedIndex(
+                self._reloader.prefix_index, options["cache_size"]
+            )
+
+    def __len__(self):
+        return len(self.prefix_index)
+
+    @property
+    def prefix_index(self):
+        """The index lookups currently go to
+
+        Returns:
+            obj -- PrefixIndex, StoredIndex or CachedIndex
+        """
+        if self._cached_index is not None:
+            return self._cached_index
+        return self._reloader.prefix_index
+
+    def reload(self):
+        """Reload the added, changed and removed operator files,
+        nothing is done if no file changed
+
+        Returns:
+            bool -- True if new operator data was swapped in
+        """
+        with self._lock:
+            if not self._reloader.reload():
+                return False
+            if self._cached_index is not None:
+                self._cached_index.swap(self._reloader.prefix_index)
+            LOGGER.info("Reloaded %s operators", len(self._reloader.prefix_index))
+            return True
+
+    def watch(self, interval):
+        """Reload every interval seconds in a daemon thread
+
+        Arguments:
+            interval {float} -- seconds between polls
+
+        Returns:
+            obj -- the started reloader.Watcher, stop() it when done
+        """
+        # reload() swaps the data itself
+        watcher = reloader.Watcher(self, interval, lambda prefix_index: None)
+        watcher.start()
+        return watcher
+
+    def lookup(self, number):
+        """Get the cheapest call rate per operator for a phone number
+
+        Arguments:
+            number {str} -- phone number, may have a leading + or 00 and -
+
+        Raises:
+            ValueError -- if the phone number is not valid
+
+        Returns:
+            dict -- key = operator name; value = [extension, price],
+                    empty if no operator matches
+        """
+        return self.prefix_index.lookup(
+            helpers.sanitize_and_validate_phoneno(number)
+        )
+
+    def lookup_many(self, numbers):
+        """Get the cheapest call rate per operator for many phone numbers,
+        all looked up in the same operator data
+
+        Arguments:
+            numbers {list} -- phone numbers
+
+        Returns:
+            list -- one dict per phone number, same as lookup(),
+                    None if the phone number is not valid
+        """
+        phonenos = [
+            phoneno for phoneno, _ in normalize.gen_normalized(numbers)
+        ]
+        found = iter(self.prefix_index.lookup_many(
+            [phoneno for phoneno in phonenos if phoneno is not None]
+        ))
+        return [
+            next(found) if phoneno is not None else None
+            for phoneno in phonenos
+        ]
+
+    def cheapest(self, number):
+        """Get the cheapest operator for a phone number
+
+        Arguments:
+            number {str} -- phone number, may have a leading + or 00 and -
+
+        Raises:
+            ValueError -- if the phone number is not valid
+
+        Returns:
+            list -- [operator name, extension, price],
+                    None if no operator matches
+        """
+        ranked = self.prefix_index.lookup_top(
+            helpers.sanitize_and_validate_phoneno(number), 1
+        )
+        return ranked[0] if ranked else None
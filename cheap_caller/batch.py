@@ -0,0 +1,199 @@
+"""
+Batch lookup of many phone numbers against one loaded PrefixIndex
+"""
+
+import csv
+import json
+import logging
+
+from cheap_caller import helpers
+from cheap_caller import normalize
+from cheap_caller import stats
+
+
+LOGGER = logging.getLogger(__name__)
+
+INVALID_PHONENO = "Phone number can only have +(only leading), - and digits"
+NO_MATCH = "No match for given number in any operators"
+
+CSV_FIELDS = ("number", "operator", "extension", "price", "error")
+RANKED_CSV_FIELDS = ("number", "rank", "operator", "extension", "price", "error")
+
+CHUNK_SIZE = 10000
+
+
+def gen_numbers(source):
+    """Strip each line from an open fileobj and yield non empty ones
+
+    Arguments:
+        source {obj} -- an open fileobj, one phone number per line
+    """
+    for line in source:
+        line = line.strip()
+        if line:
+            yield line
+
+
+def _fill_result(result, cheapest_per_operator):
+    """Fill a result dict with the cheapest operator overall
+
+    Arguments:
+        result {dict} -- result dict, see gen_results()
+        cheapest_per_operator {dict} -- dict returned by PrefixIndex.lookup()
+    """
+    if not cheapest_per_operator:
+        result["error"] = NO_MATCH
+        return
+    operator, price = helpers.get_cheapest(cheapest_per_operator)
+    result["operator"] = operator
+    result["extension"] = cheapest_per_operator[operator][0]
+    result["price"] = price
+    result["per_operator"] = cheapest_per_operator
+
+
+def _fill_ranked_result(result, ranked):
+    """Fill a result dict with the top cheapest operators
+
+    Arguments:
+        result {dict} -- result dict, see gen_results()
+        ranked {list} -- list returned by PrefixIndex.lookup_top()
+    """
+    if not ranked:
+        result["error"] = NO_MATCH
+        return
+    result["operator"], result["extension"], result["price"] = ranked[0]
+    result["top"] = ranked
+
+
+def _new_result(number, top):
+    """Result dict of a phone number before it is looked up,
+    see gen_results()
+
+    Arguments:
+        number {str} -- phone number as given
+        top {int} -- rank the top cheapest operators, None for all
+
+    Returns:
+        dict -- result dict with no match
+    """
+    result = {
+        "number": number,
+        "operator": None,
+        "extension": None,
+        "price": None,
+        "error": None,
+    }
+    if top:
+        result["top"] = []
+    else:
+        result["per_operator"] = {}
+    return result
+
+
+def _lookup_chunk(prefix_index, chunk, top):
+    """Look up a chunk of phone numbers at once, see gen_results()
+
+    Arguments:
+        prefix_index {obj} -- PrefixIndex or StoredIndex
+        chunk {list} -- phone numbers
+        top {int} -- rank the top cheapest operators, None for all
+
+    Returns:
+        list -- result dicts in the order of chunk
+    """
+    results = []
+    pending = []
+    for number, (phoneno, reason) in zip(chunk, normalize.gen_normalized(chunk)):
+        result = _new_result(number, top)
+        results.append(result)
+        if phoneno is None:
+            LOGGER.debug("Invalid phone number: %s, %s", number, reason)
+            result["error"] = INVALID_PHONENO
+            continue
+        pending.append((result, phoneno))
+    phonenos = [phoneno for _, phoneno in pending]
+    with stats.timer("lookup"):
+        if top:
+            lookups = prefix_index.lookup_top_many(phonenos, top)
+        else:
+            lookups = prefix_index.lookup_many(phonenos)
+    fill_result = _fill_ranked_result if top else _fill_result
+    for (result, _), lookup in zip(pending, lookups):
+        fill_result(result, lookup)
+    stats.count("numbers", len(chunk))
+    stats.count("invalid_numbers", len(chunk) - len(pending))
+    return results
+
+
+def gen_results(prefix_index, numbers, chunk_size=CHUNK_SIZE, top=None):
+    """Look up each phone number in the index and yield a result dict
+    per number, invalid or unmatched numbers yield a dict with an error
+
+    Each dict has items:
+        number = phone number as given
+        operator, extension, price = cheapest overall, None if error
+        per_operator = dict returned by PrefixIndex.lookup()
+        error = error message, None if no error
+
+    If top is given, per_operator is replaced by:
+        top = list returned by PrefixIndex.lookup_top(), cheapest first
+
+    Numbers are looked up chunk_size at a time with lookup_many(),
+    so at most a chunk of results is held in memory
+
+    Arguments:
+        prefix_index {obj} -- PrefixIndex or StoredIndex
+        numbers {obj} -- sequence of phone numbers
+
+    Keyword Arguments:
+        chunk_size {int} -- number of phone numbers looked up at once
+                            (default: {CHUNK_SIZE})
+        top {int} -- rank the top cheapest operators (default: {None})
+    """
+    for chunk in helpers.gen_chunks(numbers, chunk_size):
+        for result in _lookup_chunk(prefix_index, chunk, top):
+            yield result
+
+
+def write_csv(results, out, ranked=False):
+    """Write a sequence of result dicts as csv rows, one row per result,
+    or one row per ranked operator if ranked
+
+    Arguments:
+        results {obj} -- sequence of dicts yielded by gen_results()
+        out {obj} -- an open fileobj to write to
+
+    Keyword Arguments:
+        ranked {bool} -- results have the top operators (default: {False})
+    """
+    if not ranked:
+        writer = csv.DictWriter(out, CSV_FIELDS, extrasaction="ignore")
+        writer.writeheader()
+        for result in results:
+            writer.writerow(result)
+        return
+    writer = csv.writer(out)
+    writer.writerow(RANKED_CSV_FIELDS)
+    for result in results:
+        if result["error"]:
+            writer.writerow(
+                (result["number"], None, None, None, None, result["error"])
+            )
+            continue
+        for rank, (operator, extension, price) in enumerate(result["top"], 1):
+            writer.writerow(
+                (result["number"], rank, operator, extension, price, None)
+            )
+
+
+def write_jsonl(results, out):
+    """Write a sequence of result dicts as json, one line per result,
+    the top operators if ranked are a list in each line
+
+    Arguments:
+        results {obj} -- sequence of dicts yielded by gen_results()
+        out {obj} -- an open fileobj to write to
+    """
+    for result in results:
+        out.write(json.dumps(result, sort_keys=True))
+        out.write("\n")
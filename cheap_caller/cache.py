@@ -0,0 +1,259 @@
+"""
+Bounded LRU cache of lookup results keyed by matched prefix
+
+The result of a lookup only depends on the longest prefix of the phone
+number that is an extension of any operator, so numbers sharing that
+prefix share a cache entry. That prefix is found with one search in the
+merged keys of all the operators instead of one search per operator.
+"""
+
+import array
+import logging
+import threading
+import collections
+
+from cheap_caller import helpers
+from cheap_caller import rates
+from cheap_caller import vectorized
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+class LRUCache(object):
+    """Thread safe mapping of at most maxsize entries,
+    the least recently used entries are evicted first
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get_many(self, keys):
+        """Get the values of many keys, marking them as recently used
+
+        Arguments:
+            keys {list} -- keys to look up
+
+        Returns:
+            list -- value of each key, None if not cached
+        """
+        values = []
+        with self._lock:
+            for key in keys:
+                value = self._entries.pop(key, None)
+                if value is None:
+                    self.misses += 1
+                else:
+                    self._entries[key] = value
+                    self.hits += 1
+                values.append(value)
+        return values
+
+    def put_many(self, items):
+        """Add or replace many entries, evicting the least recently used
+        entries beyond maxsize
+
+        Arguments:
+            items {list} -- list of (key, value), value not None
+        """
+        with self._lock:
+            for key, value in items:
+                self._entries.pop(key, None)
+                self._entries[key] = value
+            evicted = max(len(self._entries) - self.maxsize, 0)
+            for _ in xrange(evicted):
+                self._entries.popitem(last=False)
+            self.evictions += evicted
+
+    def clear(self):
+        """Remove all the entries, the counters are kept
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def info(self):
+        """Get the counters
+
+        Returns:
+            dict -- hits, misses, evictions, size and maxsize
+        """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+        }
+
+
+def merge_keys(operators):
+    """Merge the keys of all the operators into one table,
+    its longest match is the longest prefix any operator knows
+
+    Arguments:
+        operators {list} -- list of (operator name, table)
+
+    Returns:
+        obj -- RateTable with all the keys and zero prices
+    """
+    keys = set()
+    for _, table in operators:
+        keys.update(rates.table_columns(table)[0])
+    keys = array.array(rates.KEY_TYPECODE, sorted(keys))
+    prices = array.array(rates.PRICE_TYPECODE, [0]) * len(keys)
+    return rates.RateTable(keys, prices)
+
+
+def _matched_prefixes(prefixes, phonenos):
+    """Longest prefix of each phone number any operator knows
+
+    Arguments:
+        prefixes {obj} -- RateTable returned by merge_keys()
+        phonenos {list} -- sanitized phone numbers
+
+    Returns:
+        list -- prefix of each phone number, None if no operator matches
+    """
+    if vectorized.available() and len(phonenos) >= vectorized.MIN_BATCH_SIZE:
+        valid, matches = vectorized.match([(None, prefixes)], phonenos)
+        lengths = matches[0][1].tolist()
+        valid = valid.tolist()
+    else:
+        lengths = valid = [False] * len(phonenos)
+    matched = []
+    for position, phoneno in enumerate(phonenos):
+        if valid[position]:
+            length = lengths[position]
+            matched.append(phoneno[:length] if length else None)
+            continue
+        match = prefixes.longest_match(phoneno)
+        matched.append(match[0] if match is not None else None)
+    return matched
+
+
+class CachedIndex(object):
+    """PrefixIndex, StoredIndex or SharedIndex with an LRU cache of lookup results
+    in front of it, it answers lookups the same way
+
+    The cached dicts are shared, they must not be modified
+    """
+
+    def __init__(self, prefix_index, maxsize):
+        self.cache = LRUCache(maxsize)
+        self._state = None
+        self.swap(prefix_index)
+
+    def __len__(self):
+        return len(self._state[0])
+
+    def swap(self, prefix_index):
+        """Look up in another index from now on, e.g. a reloaded one,
+        the cached results of the previous index are dropped
+
+        Arguments:
+            prefix_index {obj} -- PrefixIndex, StoredIndex or SharedIndex
+        """
+        if hasattr(prefix_index, "merge_keys"):
+            # a SharedIndex has them merged already
+            prefixes = prefix_index.merge_keys()
+        else:
+            prefixes = merge_keys(prefix_index.tables())
+        generation = self._state[2] + 1 if self._state else 0
+        # one assignment, a lookup in flight keeps the state it started
+        # with and its results are cached under the old generation
+        self._state = (prefix_index, prefixes, generation)
+        self.cache.clear()
+        LOGGER.debug(
+            "Merged %s prefixes of %s operators",
+            len(prefixes), len(prefix_index)
+        )
+
+    def tables(self):
+        """Get the rate tables of the index
+
+        Returns:
+            list -- list of (operator name, table)
+        """
+        return self._state[0].tables()
+
+    def lookup(self, phoneno):
+        """Get cheapest call rate per operator for a given phoneno
+
+        Arguments:
+            phoneno {str} -- sanitized phone number
+
+        Returns:
+            dict -- same as PrefixIndex.lookup()
+        """
+        return self.lookup_many([phoneno])[0]
+
+    def lookup_many(self, phonenos):
+        """Get cheapest call rate per operator for many phone numbers,
+        each prefix not cached is looked up once in the index
+
+        Arguments:
+            phonenos {list} -- sanitized phone numbers
+
+        Returns:
+            list -- one dict per phone number, same as lookup()
+        """
+        prefix_index, prefixes, generation = self._state
+        matched = _matched_prefixes(prefixes, phonenos)
+        # hits and misses count the distinct prefixes of each call
+        keys = list(set(
+            (generation, prefix) for prefix in matched if prefix is not None
+        ))
+        cached = dict(zip(keys, self.cache.get_many(keys)))
+        missing = [key for key, value in cached.iteritems() if value is None]
+        if missing:
+            found = prefix_index.lookup_many([prefix for _, prefix in missing])
+            self.cache.put_many(zip(missing, found))
+            cached.update(zip(missing, found))
+        return [
+            cached[(generation, prefix)] if prefix is not None else {}
+            for prefix in matched
+        ]
+
+    def lookup_top(self, phoneno, top):
+        """Get the top cheapest operators for a given phoneno
+
+        Arguments:
+            phoneno {str} -- sanitized phone number
+            top {int} -- number of operators to keep
+
+        Returns:
+            list -- same as PrefixIndex.lookup_top()
+        """
+        return self.lookup_top_many([phoneno], top)[0]
+
+    def lookup_top_many(self, phonenos, top):
+        """Get the top cheapest operators for many phone numbers,
+        ranked from the cached results
+
+        Arguments:
+            phonenos {list} -- sanitized phone numbers
+            top {int} -- number of operators to keep
+
+        Returns:
+            list -- one list per phone number, same as lookup_top()
+        """
+        return [
+            helpers.get_top(result.iteritems(), top)
+            for result in self.lookup_many(phonenos)
+        ]
+
+    def info(self):
+        """Get the cache counters
+
+        Returns:
+            dict -- same as LRUCache.info()
+        """
+        return self.cache.info()
@@ -0,0 +1,305 @@
+"""
+Cost of call detail records (CDRs) on every operator
+
+Each call, a phone number and a duration in seconds, is priced on every
+operator by the longest prefix match, the price being per unit of time,
+a minute by default, prorated to the second. The costs are summed per
+operator, over the calls the operator can route, and for the least cost
+routing of each call to its cheapest operator.
+
+Calls are priced a chunk at a time, by the vectorized engine if
+available, so the memory is bounded by the chunk size whatever the
+number of calls. Costs are summed exactly, in micro-units times
+milliseconds, and rounded once at the end.
+"""
+
+import json
+import logging
+import collections
+
+from cheap_caller import helpers
+from cheap_caller import index
+from cheap_caller import normalize
+from cheap_caller import rates
+from cheap_caller import stats
+from cheap_caller import vectorized
+
+
+LOGGER = logging.getLogger(__name__)
+
+CHUNK_SIZE = 100000
+
+# seconds per unit of time the prices are for
+DEFAULT_UNIT = 60
+
+_MILLIS = 1000
+
+
+def parse_duration(duration):
+    """Parse a call duration in seconds into milliseconds
+
+    Arguments:
+        duration {str} -- duration in seconds, e.g. "61.5"
+
+    Raises:
+        ValueError -- if duration is not a finite positive number or zero
+
+    Returns:
+        int -- duration in milliseconds
+    """
+    try:
+        millis = int(round(float(duration) * _MILLIS))
+    except OverflowError:
+        raise ValueError("Duration is not finite: {}".format(duration))
+    if millis < 0:
+        raise ValueError("Duration is negative: {}".format(duration))
+    return millis
+
+
+def gen_calls(source):
+    """Parse the comma separated number and duration of each line from
+    an open fileobj, any other field is ignored, so is a header line
+
+    Arguments:
+        source {obj} -- an open fileobj
+
+    Yields:
+        tuple -- (sanitized phone number, duration in milliseconds),
+                 None for an invalid line
+    """
+    for line in source:
+        fields = line.split(",", 2)
+        if len(fields) < 2:
+            if line.strip():
+                yield None
+            continue
+        number = fields[0].strip()
+        try:
+            millis = parse_duration(fields[1])
+        except ValueError as error:
+            if fields[1].strip().lower() == "duration":
+                continue
+            LOGGER.debug("Invalid call: %s, %s", line.strip(), str(error))
+            yield None
+            continue
+        # phone numbers are mostly digits already
+        if not number.isdigit() or number[0] == "0":
+            number, reason = normalize.normalize(number)
+            if number is None:
+                LOGGER.debug("Invalid call: %s, %s", line.strip(), reason)
+                yield None
+                continue
+        yield number, millis
+
+
+def new_totals(names):
+    """Totals of no call
+
+    Arguments:
+        names {list} -- operator names
+
+    Returns:
+        dict -- {"calls", "invalid", "unmatched", "millis",
+                 "operators": {name: {"calls", "cost"}},
+                 "least_cost": {"calls", "cost"}}, costs in
+                micro-units times milliseconds
+    """
+    return {
+        "calls": 0,
+        "invalid": 0,
+        "unmatched": 0,
+        "millis": 0,
+        "operators": collections.OrderedDict(
+            (name, {"calls": 0, "cost": 0}) for name in names
+        ),
+        "least_cost": {"calls": 0, "cost": 0},
+    }
+
+
+def _dot(prices, millis):
+    """Exact sum of prices times durations
+
+    Arguments:
+        prices {obj} -- int64 array of prices in micro-units
+        millis {obj} -- int64 array of durations in milliseconds
+
+    Returns:
+        int -- sum of the products
+    """
+    numpy = vectorized.numpy
+    if not prices.size:
+        return 0
+    bound = int(numpy.abs(prices).max()) * int(millis.max()) * len(prices)
+    if bound < 2 ** 63:
+        return int(numpy.dot(prices, millis))
+    # would overflow int64
+    return sum(
+        price * duration
+        for price, duration in zip(prices.tolist(), millis.tolist())
+    )
+
+
+def _add_vectorized(totals, operators, phonenos, millis):
+    """Price calls with the vectorized engine and add them to the totals
+
+    Arguments:
+        totals {dict} -- returned by new_totals()
+        operators {list} -- list of (operator name, table)
+        phonenos {list} -- sanitized phone numbers
+        millis {list} -- durations in milliseconds
+
+    Returns:
+        list -- positions of the calls this engine can not price
+    """
+    numpy = vectorized.numpy
+    valid, matches = vectorized.match(operators, phonenos)
+    millis = numpy.array(millis, numpy.int64)
+    matched = numpy.zeros(len(phonenos), bool)
+    cheapest = numpy.zeros(len(phonenos), numpy.int64)
+    for name, lengths, prices in matches:
+        hits = (lengths > 0) & valid
+        if not hits.any():
+            continue
+        operator = totals["operators"][name]
+        operator["calls"] += int(numpy.count_nonzero(hits))
+        operator["cost"] += _dot(prices[hits], millis[hits])
+        # first match of a call, or cheaper than the cheapest so far
+        cheaper = hits & (~matched | (prices < cheapest))
+        cheapest[cheaper] = prices[cheaper]
+        matched |= hits
+    totals["least_cost"]["calls"] += int(numpy.count_nonzero(matched))
+    totals["least_cost"]["cost"] += _dot(cheapest[matched], millis[matched])
+    totals["unmatched"] += int(numpy.count_nonzero(valid & ~matched))
+    return numpy.flatnonzero(~valid).tolist()
+
+
+def _add_calls(totals, operators, phonenos, millis):
+    """Price calls one at a time and add them to the totals
+
+    Arguments:
+        totals {dict} -- returned by new_totals()
+        operators {list} -- list of (operator name, table)
+        phonenos {list} -- sanitized phone numbers
+        millis {list} -- durations in milliseconds
+    """
+    for phoneno, duration in zip(phonenos, millis):
+        cheapest = None
+        for name, match in index.gen_matches(operators, phoneno):
+            cost = rates.parse_price(match[1]) * duration
+            operator = totals["operators"][name]
+            operator["calls"] += 1
+            operator["cost"] += cost
+            if cheapest is None or cost < cheapest:
+                cheapest = cost
+        if cheapest is None:
+            totals["unmatched"] += 1
+            continue
+        totals["least_cost"]["calls"] += 1
+        totals["least_cost"]["cost"] += cheapest
+
+
+def _add_chunk(totals, operators, chunk, use_vectorized):
+    """Price a chunk of calls and add them to the totals
+
+    Arguments:
+        totals {dict} -- returned by new_totals()
+        operators {list} -- list of (operator name, table)
+        chunk {list} -- calls yielded by gen_calls()
+        use_vectorized {bool} -- price large chunks with the vectorized engine
+    """
+    valid_calls = [call for call in chunk if call is not None]
+    totals["calls"] += len(chunk)
+    totals["invalid"] += len(chunk) - len(valid_calls)
+    phonenos = [phoneno for phoneno, _ in valid_calls]
+    millis = [duration for _, duration in valid_calls]
+    totals["millis"] += sum(millis)
+    if use_vectorized and len(valid_calls) >= vectorized.MIN_BATCH_SIZE:
+        with stats.timer("vectorized"):
+            left = _add_vectorized(totals, operators, phonenos, millis)
+        phonenos = [phonenos[position] for position in left]
+        millis = [millis[position] for position in left]
+    _add_calls(totals, operators, phonenos, millis)
+    stats.count("calls", len(chunk))
+
+
+def aggregate(operators, calls, chunk_size=CHUNK_SIZE):
+    """Price each call on every operator and sum the costs
+
+    Arguments:
+        operators {list} -- list of (operator name, table)
+        calls {obj} -- sequence yielded by gen_calls()
+
+    Keyword Arguments:
+        chunk_size {int} -- number of calls priced at once
+                            (default: {CHUNK_SIZE})
+
+    Returns:
+        dict -- returned by new_totals(), with the costs of the calls
+    """
+    totals = new_totals([name for name, _ in operators])
+    use_vectorized = vectorized.available()
+    for chunk in helpers.gen_chunks(calls, chunk_size):
+        _add_chunk(totals, operators, chunk, use_vectorized)
+    return totals
+
+
+def _format_cost(cost, unit):
+    """Format a cost in micro-units times milliseconds as a price
+
+    Arguments:
+        cost {int} -- cost in micro-units times milliseconds
+        unit {int} -- seconds per unit of time the prices are for
+
+    Returns:
+        str -- cost, rounded to micro-units
+    """
+    divisor = unit * _MILLIS
+    # rounded half up, exactly
+    return rates.format_price((cost * 2 + divisor) // (divisor * 2))
+
+
+def format_totals(totals, unit=DEFAULT_UNIT):
+    """Format totals for output
+
+    Arguments:
+        totals {dict} -- returned by aggregate()
+
+    Keyword Arguments:
+        unit {int} -- seconds per unit of time the prices are for
+                      (default: {DEFAULT_UNIT})
+
+    Returns:
+        dict -- same items, costs as prices and durations in seconds
+    """
+    return {
+        "calls": totals["calls"],
+        "invalid": totals["invalid"],
+        "unmatched": totals["unmatched"],
+        "seconds": totals["millis"] / float(_MILLIS),
+        "operators": collections.OrderedDict(
+            (name, {
+                "calls": operator["calls"],
+                "cost": _format_cost(operator["cost"], unit),
+            })
+            for name, operator in totals["operators"].iteritems()
+        ),
+        "least_cost": {
+            "calls": totals["least_cost"]["calls"],
+            "cost": _format_cost(totals["least_cost"]["cost"], unit),
+        },
+    }
+
+
+def write_json(totals, out, unit=DEFAULT_UNIT):
+    """Write totals as json
+
+    Arguments:
+        totals {dict} -- returned by aggregate()
+        out {obj} -- an open fileobj to write to
+
+    Keyword Arguments:
+        unit {int} -- seconds per unit of time the prices are for
+                      (default: {DEFAULT_UNIT})
+    """
+    json.dump(format_totals(totals, unit), out, indent=2, sort_keys=True)
+    out.write("\n")
@@ -0,0 +1,327 @@
+"""
+Delta files, small change sets against a base operator file
+
+The delta files of an operator file are next to it, named after it
+without any compression suffix, then a tag and .delta, e.g.
+operator.0001.delta for operator or operator.gz, applied in the order of
+their names. Each line is one change of an extension:
+
+    add,<extension>,<price>
+    update,<extension>,<price>
+    delete,<extension>
+
+add and update both set the price of the extension, whatever the base
+file has for it, delete removes the extension. The changes are kept in a
+patch, a dict of the changed keys, overlaid on the table of the base file
+so applying them takes time in the size of the deltas. compact() writes
+the base file with the deltas applied and removes the delta files.
+"""
+
+import os
+import array
+import bisect
+import logging
+
+from cheap_caller import helpers
+from cheap_caller import rates
+from cheap_caller import stats
+
+
+LOGGER = logging.getLogger(__name__)
+
+SUFFIX = ".delta"
+
+ADD = "add"
+UPDATE = "update"
+DELETE = "delete"
+OPERATIONS = (ADD, UPDATE, DELETE)
+
+
+def find_deltas(file_paths):
+    """Find the delta files of operator files, each directory is
+    listed once
+
+    Arguments:
+        file_paths {obj} -- a sequence of full paths of operator files
+
+    Returns:
+        dict -- key = operator file path; value = sorted list of
+                the paths of its delta files, only if it has any
+    """
+    by_directory = {}
+    for file_path in file_paths:
+        by_directory.setdefault(os.path.dirname(file_path), []).append(file_path)
+    deltas = {}
+    for directory, paths in by_directory.iteritems():
+        try:
+            names = [name for name in os.listdir(directory or ".")
+                     if name.endswith(SUFFIX)]
+        except OSError:
+            continue
+        for file_path in paths:
+            start = os.path.basename(helpers.split_compression(file_path)[0]) + "."
+            found = sorted(
+                os.path.join(directory, name) for name in names
+                if name.startswith(start)
+            )
+            if found:
+                deltas[file_path] = found
+    return deltas
+
+
+def gen_changes(name, source, prefix=""):
+    """Parse the lines of a delta file, ignoring the invalid ones
+
+    Arguments:
+        name {str} -- delta file name (used only for logging)
+        source {obj} -- an open fileobj
+
+    Keyword Arguments:
+        prefix {str} -- only keep the extensions starting with it (default: {""})
+
+    Yields:
+        tuple -- (key, price in micro-units or None if deleted)
+    """
+    lines = 0
+    try:
+        for line in source:
+            fields = [field.strip() for field in line.split(",")]
+            if fields == [""]:
+                continue
+            lines += 1
+            operation = fields[0].lower()
+            try:
+                if operation not in OPERATIONS or \
+                        len(fields) < (2 if operation == DELETE else 3):
+                    raise ValueError("Not a change")
+                extension = helpers.remove_leading_plus_and_zeros(fields[1])
+                key = rates.encode_extension(extension)
+                if key is None:
+                    raise ValueError("Not an extension")
+                price = None if operation == DELETE else rates.parse_price(fields[2])
+            except ValueError:
+                LOGGER.warning(
+                    "Ignoring %s line in %s, not a valid change",
+                    line.strip(), name
+                )
+                continue
+            if extension.startswith(prefix):
+                yield key, price
+    finally:
+        stats.count("delta_lines", lines)
+
+
+def read_patch(file_path, prefix="", delta_paths=None):
+    """Read all the delta files of an operator file into a patch,
+    a later change of an extension wins
+
+    Arguments:
+        file_path {str} -- full path of the operator file
+
+    Keyword Arguments:
+        prefix {str} -- only keep the extensions starting with it (default: {""})
+        delta_paths {list} -- its delta files if already found,
+                              None to find them (default: {None})
+
+    Returns:
+        dict -- key = encoded extension; value = price in micro-units
+                or None if deleted
+    """
+    if delta_paths is None:
+        delta_paths = find_deltas([file_path]).get(file_path, [])
+    patch = {}
+    for delta_path in delta_paths:
+        try:
+            with open(delta_path) as source:
+                patch.update(gen_changes(delta_path, source, prefix))
+        except IOError as error:
+            LOGGER.error("Failed to read: %s, ignoring, %s", delta_path, str(error))
+            continue
+        stats.count("delta_files")
+    return patch
+
+
+def merge_patch(keys, prices, patch):
+    """Apply a patch to sorted key and price columns
+
+    Only the patched keys are searched, the columns in between are
+    copied as slices
+
+    Arguments:
+        keys {obj} -- sorted keys array
+        prices {obj} -- prices array
+        patch {dict} -- returned by read_patch()
+
+    Returns:
+        tuple -- (keys array, prices array) patched
+    """
+    patched_keys = array.array(rates.KEY_TYPECODE)
+    patched_prices = array.array(rates.PRICE_TYPECODE)
+    start = 0
+    for key in sorted(patch):
+        position = bisect.bisect_left(keys, key, start)
+        patched_keys.extend(keys[start:position])
+        patched_prices.extend(prices[start:position])
+        start = position
+        if start < len(keys) and keys[start] == key:
+            # replaced or deleted
+            start += 1
+        if patch[key] is not None:
+            patched_keys.append(key)
+            patched_prices.append(patch[key])
+    patched_keys.extend(keys[start:])
+    patched_prices.extend(prices[start:])
+    return patched_keys, patched_prices
+
+
+class PatchedTable(object):
+    """RateTable or MappedTable with a patch overlaid on it,
+    it answers lookups the same way
+
+    The patched columns are only built if asked for,
+    by the vectorized engine or the whole table consumers
+    """
+
+    def __init__(self, table, patch):
+        self.table = table
+        self.patch = patch
+        self._columns = None
+
+    def column_buffers(self):
+        """Buffers holding the patched key and price columns
+
+        Returns:
+            tuple -- (keys buffer, keys offset, prices buffer,
+                      prices offset, count)
+        """
+        if self._columns is None:
+            keys, prices = rates.table_columns(self.table)
+            self._columns = merge_patch(keys, prices, self.patch)
+        keys, prices = self._columns
+        return keys, 0, prices, 0, len(keys)
+
+    def longest_match(self, phoneno):
+        """Get the cheapest line of the longest extension matching phoneno
+
+        Arguments:
+            phoneno {str} -- sanitized phone number
+
+        Returns:
+            list -- [extension, price] or None if nothing matches
+        """
+        length = min(len(phoneno), rates.MAX_EXTENSION_LENGTH)
+        while length > 0:
+            match = self.table.longest_match(phoneno[:length])
+            found = len(match[0]) if match is not None else 0
+            # extensions longer than the base match can only be added ones
+            for candidate in xrange(length, found, -1):
+                extension = phoneno[:candidate]
+                price = self.patch.get(rates.encode_extension(extension))
+                if price is not None:
+                    return [extension, rates.format_price(price)]
+            if match is None:
+                return None
+            key = rates.encode_extension(match[0])
+            if key not in self.patch:
+                return match
+            if self.patch[key] is not None:
+                return [match[0], rates.format_price(self.patch[key])]
+            # deleted, look for a shorter one
+            length = found - 1
+        return None
+
+
+def base_table(table):
+    """Get the table a patch is overlaid on
+
+    Arguments:
+        table {obj} -- RateTable, MappedTable or PatchedTable
+
+    Returns:
+        obj -- the table without any patch
+    """
+    if isinstance(table, PatchedTable):
+        return table.table
+    return table
+
+
+def apply_patch(table, patch):
+    """Overlay a patch on a table, replacing any patch it had
+
+    Arguments:
+        table {obj} -- RateTable, MappedTable or PatchedTable
+        patch {dict} -- returned by read_patch()
+
+    Returns:
+        obj -- PatchedTable, the base table if the patch is empty
+    """
+    table = base_table(table)
+    if not patch:
+        return table
+    return PatchedTable(table, patch)
+
+
+def _write_compacted(file_path, table, delta_paths):
+    """Write a table patched with delta files over an operator file,
+    then remove the delta files
+
+    Arguments:
+        file_path {str} -- full path of the operator file
+        table {obj} -- RateTable of the operator file
+        delta_paths {list} -- paths of its delta files
+
+    Returns:
+        int -- number of extensions written
+    """
+    keys, prices = merge_patch(
+        table.keys, table.prices, read_patch(file_path, delta_paths=delta_paths)
+    )
+    lines = sorted(
+        (rates.decode_extension(key), price) for key, price in zip(keys, prices)
+    )
+    tmp_path = "{}.{}.tmp".format(file_path, os.getpid())
+    opener = helpers.OPENERS.get(helpers.split_compression(file_path)[1], open)
+    with opener(tmp_path, "wb") as compacted:
+        for extension, price in lines:
+            compacted.write("{},{}\n".format(extension, rates.format_price(price)))
+    os.rename(tmp_path, file_path)
+    # changes set or delete prices, were the delta files left behind
+    # they would give the same table applied again
+    for delta_path in delta_paths:
+        os.remove(delta_path)
+    return len(lines)
+
+
+def compact(file_path):
+    """Write an operator file with its deltas applied, one line per
+    extension in lexicographic order, then remove its delta files,
+    may run in a worker process
+
+    An operator file with lines the rate table can not hold, e.g. an
+    extension longer than rates.MAX_EXTENSION_LENGTH, is left as it is,
+    as rewriting it would lose them
+
+    Arguments:
+        file_path {str} -- full path of the operator file
+
+    Returns:
+        int -- number of extensions written, None if it can not be opened
+               or has such lines
+    """
+    delta_paths = find_deltas([file_path]).get(file_path, [])
+    for adict in helpers.open_files([file_path]):
+        lines = list(helpers.gen_lines(adict["name"], adict["source"]))
+        records = list(rates.gen_records(lines))
+        if len(records) != len(lines):
+            LOGGER.error(
+                "Not compacting: %s, %s lines can not be indexed",
+                file_path, len(lines) - len(records)
+            )
+            return None
+        table = rates.RateTable.from_records(records)
+        count = _write_compacted(file_path, table, delta_paths)
+        LOGGER.debug(
+            "Compacted %s delta files into: %s", len(delta_paths), file_path
+        )
+        return count
+    return None
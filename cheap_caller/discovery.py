@@ -0,0 +1,391 @@
+"""
+Discovery of the operator files in large directory trees
+
+Directories are listed with scandir, os.scandir or the scandir backport
+if installed, os.listdir and a stat per entry otherwise. With more than
+one thread they are listed concurrently, on a network file system the
+time goes to waiting on the server.
+
+A manifest kept between runs records each directory listed with its
+mtime, its subdirectories and its files. A
+directory whose mtime did not change still has the same entries, it is
+not listed again, so a run stats each directory instead of listing them
+all. A directory changed in the second before it was listed is listed
+again, its mtime may not show a later change.
+
+Patterns are shell patterns matched against the file name, or against
+the path relative to the top directory if they have a /. Compressed
+files match if they do without their compression suffix. A file is found
+if it matches an include pattern and no exclude pattern, a directory
+matching an exclude pattern is not traversed.
+"""
+
+import os
+import re
+import sys
+import json
+import stat
+import time
+import Queue
+import fnmatch
+import logging
+import threading
+
+try:
+    from scandir import scandir
+except ImportError:  # pragma: no cover
+    # python 3.5+ has it built in, the backport is optional
+    scandir = getattr(os, "scandir", None)
+
+from cheap_caller import helpers
+from cheap_caller import stats
+
+
+LOGGER = logging.getLogger(__name__)
+
+VERSION = 2
+
+# a directory listed this soon after its mtime is listed again next time
+RACY_SECONDS = 1.0
+
+# names are kept as the file system gives them, byte strings
+ENCODING = sys.getfilesystemencoding() or "utf-8"
+
+
+class Patterns(object):
+    """Shell patterns compiled to match file and directory names
+
+    Arguments:
+        patterns {list} -- shell patterns, matched against the path
+                           relative to the top directory if they have a /,
+                           against the name otherwise
+    """
+
+    def __init__(self, patterns):
+        self.patterns = list(patterns)
+        self._match_name = self._compile(
+            [pattern for pattern in self.patterns if "/" not in pattern]
+        )
+        self._match_relpath = self._compile(
+            [pattern for pattern in self.patterns if "/" in pattern]
+        )
+        self.by_relpath = self._match_relpath is not None
+
+    @staticmethod
+    def _compile(patterns):
+        """Match function of a regular expression matching any pattern,
+        None if there are none
+        """
+        if not patterns:
+            return None
+        return re.compile(
+            "|".join(fnmatch.translate(pattern) for pattern in patterns)
+        ).match
+
+    @staticmethod
+    def _match(match, target, compressed):
+        """Whether the target matches, or without its compression suffix
+        if compressed
+        """
+        if match is None:
+            return False
+        if match(target):
+            return True
+        if not compressed:
+            return False
+        root, suffix = helpers.split_compression(target)
+        return bool(suffix) and match(root) is not None
+
+    def matches_file(self, name, relpath=None):
+        """Check if a file matches any pattern, with or without
+        its compression suffix
+
+        Arguments:
+            name {str} -- file name
+
+        Keyword Arguments:
+            relpath {str} -- its path relative to the top directory,
+                             needed if by_relpath (default: {None})
+
+        Returns:
+            bool -- True if a pattern matches
+        """
+        return self._match(self._match_name, name, True) or \
+            self._match(self._match_relpath, relpath, True)
+
+    def matches_directory(self, name, relpath=None):
+        """Check if a directory matches any pattern
+
+        Arguments:
+            name {str} -- directory name
+
+        Keyword Arguments:
+            relpath {str} -- its path relative to the top directory,
+                             needed if by_relpath (default: {None})
+
+        Returns:
+            bool -- True if a pattern matches
+        """
+        return self._match(self._match_name, name, False) or \
+            self._match(self._match_relpath, relpath, False)
+
+
+def _scan(path):
+    """List a directory
+
+    Symbolic links to directories are not followed, as by os.walk(),
+    entries that vanish or can not be stat'ed are left out. With scandir
+    the type of an entry usually comes with the listing, files are not
+    stat'ed
+
+    Arguments:
+        path {str} -- directory path
+
+    Returns:
+        tuple -- (list of file names, list of directory names)
+    """
+    files = []
+    dirs = []
+    if scandir is not None:
+        for entry in scandir(path):
+            try:
+                if entry.is_dir():
+                    if not entry.is_symlink():
+                        dirs.append(entry.name)
+                    continue
+            except OSError:
+                continue
+            files.append(entry.name)
+        return files, dirs
+    for name in os.listdir(path):
+        entry_path = os.path.join(path, name)
+        try:
+            entry_stat = os.stat(entry_path)
+        except OSError:
+            continue
+        if stat.S_ISDIR(entry_stat.st_mode):
+            if not os.path.islink(entry_path):
+                dirs.append(name)
+            continue
+        files.append(name)
+    return files, dirs
+
+
+def list_directory(path, cached=None):
+    """List a directory, unless its listing in the manifest is still valid
+
+    Arguments:
+        path {str} -- directory path
+
+    Keyword Arguments:
+        cached {dict} -- its listing in the manifest (default: {None})
+
+    Raises:
+        OSError -- if it can not be listed
+
+    Returns:
+        dict -- listing, {"mtime", "listed", "files", "dirs"}
+    """
+    mtime = os.stat(path).st_mtime
+    if cached is not None and cached["mtime"] == mtime and \
+            cached["listed"] - mtime > RACY_SECONDS:
+        stats.count("directories_cached")
+        return cached
+    listed = time.time()
+    files, dirs = _scan(path)
+    stats.count("directories_listed")
+    return {"mtime": mtime, "listed": listed, "files": files, "dirs": dirs}
+
+
+def _encode(name):
+    """File system name read from json as a byte string"""
+    if isinstance(name, unicode):
+        return name.encode(ENCODING)
+    return name
+
+
+def read_manifest(manifest_path, top):
+    """Read the directory listings of a manifest
+
+    Arguments:
+        manifest_path {str} -- manifest file path
+        top {str} -- top directory it has to be of
+
+    Returns:
+        dict -- key = directory path relative to top; value = listing,
+                empty if missing, unreadable or of another directory
+    """
+    try:
+        with open(manifest_path) as manifest:
+            content = json.load(manifest)
+    except (IOError, ValueError) as error:
+        LOGGER.debug("No manifest: %s, %s", manifest_path, str(error))
+        return {}
+    if (content.get("version"), _encode(content.get("top"))) != (
+            VERSION, os.path.abspath(top)):
+        LOGGER.debug("Ignoring manifest of another directory: %s", manifest_path)
+        return {}
+    return dict(
+        (_encode(relpath), {
+            "mtime": listing["mtime"],
+            "listed": listing["listed"],
+            "files": [_encode(name) for name in listing["files"]],
+            "dirs": [_encode(name) for name in listing["dirs"]],
+        })
+        for relpath, listing in content["directories"].iteritems()
+    )
+
+
+def write_manifest(manifest_path, top, listings):
+    """Write the directory listings to a manifest, a failure is
+    only logged, the next run lists the directories again
+
+    Arguments:
+        manifest_path {str} -- manifest file path
+        top {str} -- top directory
+        listings {dict} -- key = directory path relative to top;
+                           value = listing
+    """
+    tmp_path = "{}.{}.tmp".format(manifest_path, os.getpid())
+    try:
+        with open(tmp_path, "w") as manifest:
+            json.dump({
+                "version": VERSION,
+                "top": os.path.abspath(top),
+                "directories": listings,
+            }, manifest, encoding=ENCODING)
+        os.rename(tmp_path, manifest_path)
+    except (IOError, OSError) as error:
+        LOGGER.warning("Failed to write manifest: %s, %s", manifest_path, str(error))
+
+
+def _walk(top, excludes, cached, threads):
+    """List the directory tree, reusing the valid cached listings
+
+    Arguments:
+        top {str} -- path to start from
+        excludes {Patterns} -- patterns of the directories not to traverse
+        cached {dict} -- listings read from a manifest
+        threads {int} -- number of directories listed concurrently
+
+    Returns:
+        dict -- key = directory path relative to top; value = listing
+    """
+    listings = {}
+
+    def visit(relpath):
+        """List a directory, return its subdirectories to visit"""
+        path = os.path.join(top, relpath) if relpath else top
+        try:
+            listing = list_directory(path, cached.get(relpath))
+        except OSError as error:
+            LOGGER.debug("Failed to list: %s, ignoring, %s", path, str(error))
+            return []
+        listings[relpath] = listing
+        subdirs = []
+        for name in listing["dirs"]:
+            subdir = os.path.join(relpath, name) if relpath else name
+            if not excludes.matches_directory(name, subdir):
+                subdirs.append(subdir)
+        return subdirs
+
+    if threads <= 1:
+        pending = [""]
+        while pending:
+            pending.extend(visit(pending.pop()))
+        return listings
+
+    queue = Queue.Queue()
+    errors = []
+
+    def work():
+        """Visit directories until told to stop"""
+        while True:
+            relpath = queue.get()
+            try:
+                if relpath is None:
+                    return
+                for subdir in visit(relpath):
+                    queue.put(subdir)
+            except Exception as error:  # pylint: disable=broad-except
+                errors.append(error)
+            finally:
+                queue.task_done()
+
+    workers = [threading.Thread(target=work) for _ in xrange(threads)]
+    for worker in workers:
+        worker.daemon = True
+        worker.start()
+    queue.put("")
+    queue.join()
+    for _ in workers:
+        queue.put(None)
+    for worker in workers:
+        worker.join()
+    if errors:
+        raise errors[0]
+    return listings
+
+
+def _match_files(top, listings, included, excluded):
+    """Files of the listings matching the patterns
+
+    Arguments:
+        top {str} -- top directory
+        listings {dict} -- key = directory path relative to top;
+                           value = listing
+        included {Patterns} -- a file has to match one of them
+        excluded {Patterns} -- a file matching one of them is left out
+
+    Returns:
+        list -- sorted full paths of the files found
+    """
+    by_relpath = included.by_relpath or excluded.by_relpath
+    found = []
+    for relpath, listing in listings.iteritems():
+        prefix = os.path.join(top, relpath, "")
+        relprefix = os.path.join(relpath, "")
+        for name in listing["files"]:
+            file_relpath = relprefix + name if by_relpath else None
+            if included.matches_file(name, file_relpath) and \
+                    not excluded.matches_file(name, file_relpath):
+                found.append(prefix + name)
+    found.sort()
+    return found
+
+
+def find(top, includes, excludes=(), manifest_path=None, threads=1):
+    """Find all files in a directory tree matching the patterns
+
+    Arguments:
+        top {str} -- path to start from
+        includes {list} -- patterns, a file has to match one of them
+
+    Keyword Arguments:
+        excludes {list} -- patterns, a file or directory matching one of
+                           them is left out (default: {()})
+        manifest_path {str} -- manifest to reuse the directory listings of
+                               and to update, None for none (default: {None})
+        threads {int} -- number of directories listed concurrently
+                         (default: {1})
+
+    Returns:
+        list -- sorted full paths of the files found
+    """
+    excluded = Patterns(excludes)
+    cached = read_manifest(manifest_path, top) if manifest_path else {}
+    listings = _walk(top, excluded, cached, threads)
+    found = _match_files(top, listings, Patterns(includes), excluded)
+    stats.count("files_found", len(found))
+    LOGGER.debug(
+        "Found %s files matching: %s in %s directories",
+        len(found), ", ".join(includes), len(listings)
+    )
+    # a listing reused from the manifest is the very same object
+    changed = len(listings) != len(cached) or any(
+        listing is not cached.get(relpath)
+        for relpath, listing in listings.iteritems()
+    )
+    if manifest_path and changed:
+        write_manifest(manifest_path, top, listings)
+    return found
@@ -3,28 +3,121 @@ All the helpers functions are here
 """
 
 import os
+import re
+import bz2
+import gzip
 import logging
-import logging.config
-import json
 import fnmatch
+import functools
+import heapq
+import itertools
+
+try:
+    import lzma
+except ImportError:  # pragma: no cover
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+from cheap_caller import normalize
+from cheap_caller import stats
 
 
 LOGGER = logging.getLogger(__name__)
 
-def read_logging_conf_file(conf_file_path=None):
+# compressed operator files are streamed through the opener of their suffix,
+# .xz needs lzma, the backports.lzma package on python 2
+OPENERS = {
+    ".gz": gzip.GzipFile,
+    ".bz2": bz2.BZ2File,
+}
+if lzma is not None:
+    OPENERS[".xz"] = lzma.LZMAFile
+
+# leading 00 and/or +, in the order remove_leading_plus_and_zeros() strips them
+_LEADING_PLUS_AND_ZEROS = re.compile(r"(?:00\+?)?(?:\+(?:00)?)?")
+
+# logging configuration used if none is given
+DEFAULT_LOGGING_CONF = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "logging_conf.json"
+)
+
+# format of the screen handler of the default logging configuration
+DEFAULT_LOG_FORMAT = "%(asctime)s [%(levelname)s] %(name)s: %(message)s"
+
+
+def _without_file_handlers(conf):
+    """Copy of a logging configuration without its file handlers
+
+    Arguments:
+        conf {dict} -- logging configuration
+
+    Returns:
+        dict -- logging configuration
+    """
+    file_handlers = set(
+        name for name, handler in conf.get("handlers", {}).iteritems()
+        if "filename" in handler
+    )
+    conf = dict(conf)
+    conf["handlers"] = dict(
+        (name, handler) for name, handler in conf.get("handlers", {}).iteritems()
+        if name not in file_handlers
+    )
+    conf["loggers"] = dict(
+        (name, dict(
+            logger,
+            handlers=[handler for handler in logger.get("handlers", [])
+                      if handler not in file_handlers]
+        ))
+        for name, logger in conf.get("loggers", {}).iteritems()
+    )
+    return conf
+
+
+def _configure_default_logging():
+    """Apply the default logging configuration without its file handler:
+    the package logs to the screen at the info level and above
+
+    Done by hand as importing logging.config takes longer than a single
+    lookup, the same as logging.config.dictConfig() applies it
+    """
+    handler = logging.StreamHandler()
+    handler.name = "screen"
+    handler.setLevel(logging.INFO)
+    handler.setFormatter(logging.Formatter(DEFAULT_LOG_FORMAT))
+    logger = logging.getLogger("cheap_caller")
+    for old_handler in list(logger.handlers):
+        logger.removeHandler(old_handler)
+        old_handler.close()
+    logger.addHandler(handler)
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
+    logger.disabled = False
+    # the module loggers log through it, even if an earlier
+    # configuration disabled them
+    for name, child in logging.Logger.manager.loggerDict.items():
+        if name.startswith("cheap_caller.") and isinstance(child, logging.Logger):
+            child.disabled = False
+
+
+def read_logging_conf_file(conf_file_path=None, file_handlers=True):
     """Read logging configuration from a file
 
+    logging.config is only imported for a given file or the file
+    handlers of the default one, see _configure_default_logging()
+
     Keyword Arguments:
         conf_file_path {str} -- path to logging conf file (default: {None})
+        file_handlers {bool} -- keep the file handlers, False not to create
+                                their files, e.g. debug.log (default: {True})
     """
-    dafault_conf_file = os.path.abspath(
-        os.path.join(
-            os.path.dirname(__file__),
-            'logging_conf.json'
-        )
-    )
     if not conf_file_path:
-        conf_file_path = dafault_conf_file
+        if not file_handlers:
+            _configure_default_logging()
+            return
+        conf_file_path = DEFAULT_LOGGING_CONF
         LOGGER.debug(
             "Using default logging conf file: %s",
             conf_file_path
@@ -34,12 +127,17 @@ def read_logging_conf_file(conf_file_path=None):
             LOGGER.error(
                 "Could not open given conf file: %s, "
                 "using default: %s",
-                conf_file_path, dafault_conf_file
+                conf_file_path, DEFAULT_LOGGING_CONF
             )
-            conf_file_path = dafault_conf_file
+            conf_file_path = DEFAULT_LOGGING_CONF
 
+    import json
+    import logging.config as logging_config
     with open(conf_file_path) as logging_conf:
-        logging.config.dictConfig(json.load(logging_conf))
+        conf = json.load(logging_conf)
+    if not file_handlers:
+        conf = _without_file_handlers(conf)
+    logging_config.dictConfig(conf)
 
 
 def configure_logger(logger_name, log_level):
@@ -50,7 +148,8 @@ def configure_logger(logger_name, log_level):
     This only changes log level of the stream handler,
     and not the logger itself, which is always debug,
     so the logger is very permissive, stream handler is not.
-    All the debug log lines always get written to debug.log file
+    All the debug log lines get written to debug.log file,
+    if the file handlers were kept
 
     Arguments:
         logger_name {str} -- logger name
@@ -80,12 +179,10 @@ def remove_leading_plus_and_zeros(string_to_be_curated):
         string -- stripped off string(no leading + and 00)
     """
     string_to_be_curated = string_to_be_curated.strip()
-    zipped = zip(["00", "+"], ["+", "00"])
-    for val in zipped:
-        if string_to_be_curated.startswith(val[0]):
-            string_to_be_curated = string_to_be_curated.split(val[0], 1)[-1]
-            if string_to_be_curated.startswith(val[1]):
-                string_to_be_curated = string_to_be_curated.split(val[1], 1)[-1]
+    if string_to_be_curated[:1] in ("0", "+"):
+        string_to_be_curated = string_to_be_curated[
+            _LEADING_PLUS_AND_ZEROS.match(string_to_be_curated).end():
+        ]
     return string_to_be_curated
 
 def gen_right_triangle(input_string):
@@ -111,41 +208,90 @@ def gen_right_triangle(input_string):
     return out[::-1]
 
 def sanitize_and_validate_phoneno(phoneno):
-    """Sanitize a phone number, strips off +, - and 00
+    """Sanitize a phone number, strips off +, - and 00,
+    normalize.gen_normalized() does it for many without raising
 
     Arguments:
         phoneno {str} -- phone number
 
+    Raises:
+        ValueError -- if it is not digits, a leading + or 00 and -
+
     Returns:
         str -- sanitized phone number
     """
-    if not phoneno:
-        raise ValueError("No phoneno provided")
-    # strip leading + and 00
-    phoneno = remove_leading_plus_and_zeros(phoneno)
-    # remove - from the phoneno
-    phoneno = "".join(phoneno.split("-"))
-    float(phoneno)
-    # This will raise ValueError if invalid number
-    return phoneno
+    digits, reason = normalize.normalize(phoneno)
+    if digits is None:
+        raise ValueError(normalize.MESSAGES[reason].format(phoneno))
+    return digits
+
+def split_compression(file_path):
+    """Split the suffix of a compressed file off its path
+
+    Arguments:
+        file_path {str} -- file path
+
+    Returns:
+        tuple -- (path without the suffix, suffix),
+                 the suffix is empty if not compressed
+    """
+    root, suffix = os.path.splitext(file_path)
+    if suffix in OPENERS:
+        return root, suffix
+    return file_path, ""
+
+def is_compressed(file_path):
+    """Whether a file is compressed, judging by its suffix
+
+    Arguments:
+        file_path {str} -- file path
+
+    Returns:
+        bool -- True if it is read through a decompressing opener
+    """
+    return bool(split_compression(file_path)[1])
+
+def open_file(file_path):
+    """Open a file for reading, decompressing it on the fly
+    if compressed
+
+    Arguments:
+        file_path {str} -- file path
+
+    Returns:
+        obj -- an open fileobj
+    """
+    opener = OPENERS.get(split_compression(file_path)[1])
+    if opener is None:
+        return open(file_path)
+    return opener(file_path, "rb")
 
 def gen_find(filepat, top):
-    """Find all files in a directory tree(recursively) matching a pattern
+    """Find all files in a directory tree(recursively) matching a pattern,
+    compressed files match if they do without their compression suffix
 
     Arguments:
         filepat {str} -- file pattern to match
         top {str} -- path to start from
     """
     for path, _, filelist in os.walk(top):
-        for name in fnmatch.filter(filelist, filepat):
+        for name in filelist:
+            if not (fnmatch.fnmatch(name, filepat) or
+                    fnmatch.fnmatch(split_compression(name)[0], filepat)):
+                continue
             LOGGER.debug("Found a file: %s matching: %s", name, filepat)
+            stats.count("files_found")
             yield os.path.join(path, name)
 
 def open_files(file_paths):
     """Open files in the input sequence and
-    yield a sequence of dicts each dict has two items:
+    yield a sequence of dicts each dict has three items:
         name = operatorname
         source = open file object
+        path = file path
+
+    Compressed files are decompressed while read, the operator name
+    does not include the compression suffix
 
     Arguments:
         file_paths {obj} -- a sequence of full file paths
@@ -153,14 +299,19 @@ def open_files(file_paths):
     for file_path in file_paths:
         if not os.path.exists(file_path):
             LOGGER.error("Failed to open: %s, ignoring", file_path)
+            stats.count("files_missing")
             continue
+        stats.count("files_opened")
         name = os.path.splitext(
-            os.path.basename(file_path)
+            os.path.basename(split_compression(file_path)[0])
         )[0]
-        with open(file_path) as opened_file:
+        with stats.timer("open"):
+            opened_file = open_file(file_path)
+        with opened_file:
             yield {
                 "name": name,
-                "source": opened_file
+                "source": opened_file,
+                "path": file_path
             }
 
 def gen_lines(name, source):
@@ -172,34 +323,93 @@ def gen_lines(name, source):
         name {str} -- file name (used only for logging)
         source {obj} -- an open fileobj
     """
-    for line in source:
-        # strip any space in the beginning and end
-        line = line.strip()
-        # We only care about first two values
-        line_splitted = line.split(",")[:2]
-        if not len(line_splitted) == 2:
-            LOGGER.warning(
-                "Ignoring %s line in %s,"
-                " not a comma separated extension and price",
-                line, name
-            )
-            continue
-        line_splitted[0] = remove_leading_plus_and_zeros(
-            line_splitted[0]
-        )
-        # lstrip the second part to remove any leading space
-        line_splitted[1] = line_splitted[1].lstrip()
-        try:
-            [float(val) for val in line_splitted]
-        except ValueError:
-            # To ignore invalid lines
-            LOGGER.warning(
-                "Ignoring %s line in %s,"
-                " not a comma separated extension and price",
-                line, name
+    # counted locally, added to the stats once the source is exhausted
+    read = rejected = 0
+    try:
+        for line in source:
+            read += 1
+            # strip any space in the beginning and end
+            line = line.strip()
+            # We only care about first two values
+            line_splitted = line.split(",")[:2]
+            if not len(line_splitted) == 2:
+                LOGGER.warning(
+                    "Ignoring %s line in %s,"
+                    " not a comma separated extension and price",
+                    line, name
+                )
+                rejected += 1
+                continue
+            line_splitted[0] = remove_leading_plus_and_zeros(
+                line_splitted[0]
             )
-            continue
-        yield line_splitted
+            # lstrip the second part to remove any leading space
+            line_splitted[1] = line_splitted[1].lstrip()
+            try:
+                [float(val) for val in line_splitted]
+            except ValueError:
+                # To ignore invalid lines
+                LOGGER.warning(
+                    "Ignoring %s line in %s,"
+                    " not a comma separated extension and price",
+                    line, name
+                )
+                rejected += 1
+                continue
+            yield line_splitted
+    finally:
+        stats.count("lines_read", read)
+        stats.count("lines_rejected", rejected)
+
+def map_in_pool(function, sequence, workers=1):
+    """Apply function to each item in the input sequence in a process pool
+    and yield the results in the order of the input sequence
+
+    Arguments:
+        function {obj} -- picklable function taking one argument,
+                          i.e. defined at module level
+        sequence {obj} -- sequence of picklable items
+
+    The stats recorded by the workers are added to the ones of this process
+
+    Keyword Arguments:
+        workers {int} -- number of worker processes,
+                         1 to apply function in this process (default: {1})
+    """
+    if workers <= 1:
+        for item in sequence:
+            yield function(item)
+        return
+    import multiprocessing
+    pool = multiprocessing.Pool(workers)
+    try:
+        if not stats.ENABLED:
+            for result in pool.imap(function, sequence):
+                yield result
+        else:
+            for result, recorded in pool.imap(
+                    functools.partial(stats.call_recorded, function), sequence):
+                stats.merge(recorded)
+                yield result
+        pool.close()
+    finally:
+        # no-op if closed, otherwise stops the workers right away
+        pool.terminate()
+        pool.join()
+
+def gen_chunks(sequence, size):
+    """Split a sequence into lists of at most size items
+
+    Arguments:
+        sequence {obj} -- any sequence
+        size {int} -- maximum number of items per list
+    """
+    iterator = iter(sequence)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
 
 def map_from_fileobj_to_lines(dictseq):
     """Map fileobj in "source" item for each dict in dictseq
@@ -264,13 +474,38 @@ def get_cheapest_per_operator(dictseq, extensions):
                     "operator: %s, extension: %s, lines: %s",
                     name, extension, matching
                 )
-                # get the minimum value
+                # get the minimum value, compared as numbers
                 cheapest_per_operator[name] = min(
-                    matching, key=lambda i: i[1]
+                    matching, key=lambda i: float(i[1])
                 )
                 break
     return cheapest_per_operator
 
+def _rank_key(item):
+    """Sort key of an (operator name, [extension, price]) item,
+    by price compared as numbers then by operator name
+    """
+    return float(item[1][1]), item[0]
+
+def get_top(items, top):
+    """Get the top cheapest operators, on equal prices the operator name
+    first in alphabetical order, in a single pass over items keeping
+    at most top items in a heap
+
+    Arguments:
+        items {obj} -- sequence of (operator name, [extension, price]),
+                       e.g. dict.iteritems() of get_cheapest_per_operator()
+        top {int} -- number of operators to keep
+
+    Returns:
+        list -- at most top lists [operator name, extension, price],
+                cheapest first
+    """
+    return [
+        [name, extension, price]
+        for name, (extension, price) in heapq.nsmallest(top, items, key=_rank_key)
+    ]
+
 def get_cheapest(adict):
     """Get cheapest operator and rate for a given phoneno
 
@@ -280,10 +515,6 @@ def get_cheapest(adict):
     Returns:
         tuple -- cheapest operatorname and call rate
     """
-    # get the cheapest prices
-    cheapest_price = min(adict.values(), key=lambda i: i[1])
-    # find that value in the dict
-    # return tuple -- (operator, price)
-    for key, value in adict.iteritems():
-        if value == cheapest_price:
-            return (key, value[1])
+    # single pass, compared as numbers, ties go to the first name
+    name, _, price = get_top(adict.iteritems(), 1)[0]
+    return (name, price)
@@ -0,0 +1,317 @@
+"""
+In-memory prefix index over the operator data
+"""
+
+import logging
+import functools
+
+from cheap_caller import delta
+from cheap_caller import helpers
+from cheap_caller import ingest
+from cheap_caller import rates
+from cheap_caller import stats
+from cheap_caller import summary
+from cheap_caller import vectorized
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+class PrefixIndex(object):
+    """Rate tables of all the operators, in the order they were added
+
+    Each table is kept along with the path of the operator file it was
+    built from, if known, so an index can be rebuilt reusing the tables
+    of unchanged files
+    """
+
+    def __init__(self):
+        self._operators = []
+
+    def __len__(self):
+        return len(self._operators)
+
+    def add_operator(self, name, lines, prefix="", path=None):
+        """Build a rate table from a sequence of lines and add it to the index
+
+        Arguments:
+            name {str} -- operator name
+            lines {obj} -- sequence of lines returned by gen_lines()
+
+        Keyword Arguments:
+            prefix {str} -- only index the lines starting with it (default: {""})
+            path {str} -- path of the operator file (default: {None})
+
+        Returns:
+            obj -- the RateTable built
+        """
+        table = rates.RateTable.from_lines(lines, prefix)
+        LOGGER.debug(
+            "Indexed %s extensions for operator: %s",
+            len(table), name
+        )
+        self.add_table(name, table, path)
+        return table
+
+    def add_table(self, name, table, path=None):
+        """Add an already built rate table to the index
+
+        Arguments:
+            name {str} -- operator name
+            table {obj} -- RateTable
+
+        Keyword Arguments:
+            path {str} -- path of the operator file (default: {None})
+        """
+        self._operators.append((name, table, path))
+
+    def tables_by_path(self):
+        """Get the rate tables built from a known operator file
+
+        Returns:
+            dict -- key = path; value = (operator name, RateTable)
+        """
+        return dict(
+            (path, (name, table))
+            for name, table, path in self._operators
+            if path is not None
+        )
+
+    def lookup(self, phoneno):
+        """Get cheapest call rate per operator for a given phoneno
+
+        Arguments:
+            phoneno {str} -- sanitized phone number
+
+        Returns:
+            dict -- same as get_cheapest_per_operator()
+                    key = operator name; value = [extension, price]
+        """
+        return lookup_tables(self.tables(), phoneno)
+
+    def lookup_many(self, phonenos):
+        """Get cheapest call rate per operator for many phone numbers
+
+        Arguments:
+            phonenos {list} -- sanitized phone numbers
+
+        Returns:
+            list -- one dict per phone number, same as lookup()
+        """
+        return lookup_tables_many(self.tables(), phonenos)
+
+    def lookup_top(self, phoneno, top):
+        """Get the top cheapest operators for a given phoneno
+
+        Arguments:
+            phoneno {str} -- sanitized phone number
+            top {int} -- number of operators to keep
+
+        Returns:
+            list -- same as get_top()
+        """
+        return lookup_tables_top(self.tables(), phoneno, top)
+
+    def lookup_top_many(self, phonenos, top):
+        """Get the top cheapest operators for many phone numbers
+
+        Arguments:
+            phonenos {list} -- sanitized phone numbers
+            top {int} -- number of operators to keep
+
+        Returns:
+            list -- one list per phone number, same as lookup_top()
+        """
+        return lookup_tables_top_many(self.tables(), phonenos, top)
+
+    def tables(self):
+        """Get the rate tables in the order they were added
+
+        Returns:
+            list -- list of (operator name, RateTable)
+        """
+        return [(name, table) for name, table, _ in self._operators]
+
+
+def gen_matches(operators, phoneno):
+    """Yield the longest match of each operator matching phoneno
+
+    Arguments:
+        operators {list} -- list of (operator name, table), table being
+                            a RateTable or anything with longest_match()
+        phoneno {str} -- sanitized phone number
+
+    Yields:
+        tuple -- (operator name, [extension, price])
+    """
+    # longest_match() tries each extension from the longest one down
+    longest = min(len(phoneno), rates.MAX_EXTENSION_LENGTH)
+    tried = 0
+    for name, table in operators:
+        match = table.longest_match(phoneno)
+        if match is None:
+            tried += longest
+            continue
+        tried += longest - len(match[0]) + 1
+        yield name, match
+    stats.count("lookups")
+    stats.count("extensions_tried", tried)
+
+
+def lookup_tables(operators, phoneno):
+    """Get cheapest call rate per operator for a given phoneno
+
+    Arguments:
+        operators {list} -- list of (operator name, table), table being
+                            a RateTable or anything with longest_match()
+        phoneno {str} -- sanitized phone number
+
+    Returns:
+        dict -- same as get_cheapest_per_operator()
+                key = operator name; value = [extension, price]
+    """
+    return dict(gen_matches(operators, phoneno))
+
+
+def lookup_tables_top(operators, phoneno, top):
+    """Get the top cheapest operators for a given phoneno,
+    without building the dict of all the operators
+
+    Arguments:
+        operators {list} -- list of (operator name, table)
+        phoneno {str} -- sanitized phone number
+        top {int} -- number of operators to keep
+
+    Returns:
+        list -- same as get_top()
+    """
+    return helpers.get_top(gen_matches(operators, phoneno), top)
+
+
+def lookup_tables_many(operators, phonenos):
+    """Get cheapest call rate per operator for many phone numbers,
+    with the vectorized engine if NumPy is installed and the batch large
+
+    Arguments:
+        operators {list} -- list of (operator name, table)
+        phonenos {list} -- sanitized phone numbers
+
+    Returns:
+        list -- one dict per phone number, same as lookup_tables()
+    """
+    if not vectorized.available() or len(phonenos) < vectorized.MIN_BATCH_SIZE:
+        return [lookup_tables(operators, phoneno) for phoneno in phonenos]
+    with stats.timer("vectorized"):
+        results = vectorized.lookup_many(operators, phonenos)
+    stats.count("vectorized_lookups", len(phonenos))
+    # the numbers the vectorized engine can not handle are looked up one by one
+    return [
+        lookup_tables(operators, phoneno) if result is None else result
+        for phoneno, result in zip(phonenos, results)
+    ]
+
+
+def lookup_tables_top_many(operators, phonenos, top):
+    """Get the top cheapest operators for many phone numbers,
+    with the vectorized engine if NumPy is installed and the batch large
+
+    Arguments:
+        operators {list} -- list of (operator name, table)
+        phonenos {list} -- sanitized phone numbers
+        top {int} -- number of operators to keep
+
+    Returns:
+        list -- one list per phone number, same as lookup_tables_top()
+    """
+    if not vectorized.available() or len(phonenos) < vectorized.MIN_BATCH_SIZE:
+        return [lookup_tables_top(operators, phoneno, top) for phoneno in phonenos]
+    with stats.timer("vectorized"):
+        results = vectorized.lookup_top_many(operators, phonenos, top)
+    stats.count("vectorized_lookups", len(phonenos))
+    return [
+        lookup_tables_top(operators, phoneno, top) if result is None else result
+        for phoneno, result in zip(phonenos, results)
+    ]
+
+
+def build_index(dictseq, prefix=""):
+    """Build a PrefixIndex from a sequence of dicts
+    as yielded by map_from_fileobj_to_lines()
+
+    Arguments:
+        dictseq {obj} -- sequence of dicts {"name": operator name,
+                                            "source": sequence of lines}
+
+    Keyword Arguments:
+        prefix {str} -- only index the lines starting with it,
+                        e.g. the first digit for a single lookup (default: {""})
+
+    Returns:
+        obj -- PrefixIndex
+    """
+    index = PrefixIndex()
+    for adict in dictseq:
+        lines = adict.get("source")
+        if stats.ENABLED:
+            # parsed up front, so parsing and indexing are timed apart
+            with stats.timer("parse"):
+                lines = list(lines)
+        with stats.timer("index"):
+            index.add_operator(adict.get("name"), lines, prefix, adict.get("path"))
+    return index
+
+
+def _index_file(prefix, file_path):
+    """Parse an operator file and build its rate table, with its delta
+    files overlaid, may run in a worker process
+
+    Arguments:
+        prefix {str} -- only index the lines starting with it
+        file_path {str} -- full path of the operator file
+
+    Returns:
+        tuple -- (operator name, RateTable, path),
+                 None if it can not be opened
+    """
+    for adict in helpers.open_files([file_path]):
+        source = adict["source"]
+        # with a summary only the lines starting with the
+        # first digit of the prefix are read
+        with stats.timer("region"):
+            region = summary.get_region(file_path, prefix[:1]) if prefix else None
+        if region is not None:
+            source = summary.Region(source, *region)
+        table = ingest.build_table(adict["name"], source, prefix)
+        with stats.timer("delta"):
+            table = delta.apply_patch(table, delta.read_patch(file_path, prefix))
+        return adict["name"], table, file_path
+    return None
+
+
+def build_index_in_pool(file_paths, prefix="", workers=1):
+    """Build a PrefixIndex from operator files, parsing and indexing
+    each file in a pool of worker processes
+
+    The tables are added in the order of file_paths,
+    so the index is the same as the one built by build_index()
+
+    Arguments:
+        file_paths {obj} -- a sequence of full file paths
+
+    Keyword Arguments:
+        prefix {str} -- only index the lines starting with it (default: {""})
+        workers {int} -- number of worker processes (default: {1})
+
+    Returns:
+        obj -- PrefixIndex
+    """
+    index = PrefixIndex()
+    results = helpers.map_in_pool(
+        functools.partial(_index_file, prefix),
+        file_paths,
+        workers
+    )
+    for result in results:
+        if result is not None:
+            index.add_table(*result)
+    return index
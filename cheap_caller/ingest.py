@@ -0,0 +1,131 @@
+"""
+Bulk parsing of operator files into encoded rate records
+
+Operator files are read in large chunks and the well formed lines of a
+chunk, digits then a price with up to 6 decimals, are all matched at once
+by one regular expression. The other lines of the chunk go through
+gen_lines() and rates.gen_records(), so the acceptance rules, warnings
+and counters stay exactly the same as parsing line by line.
+"""
+
+import re
+import logging
+import itertools
+
+from cheap_caller import helpers
+from cheap_caller import rates
+from cheap_caller import stats
+
+
+LOGGER = logging.getLogger(__name__)
+
+# bytes read at once, completed up to the end of the line
+CHUNK_SIZE = 1 << 20
+
+# a line gen_lines() accepts and rates.gen_records() can encode exactly:
+# an optional +, an extension without leading zero, a price with at most
+# 9 digits and 6 decimals, so it converts exactly to micro-units,
+# then anything after a comma
+FAST_LINE = re.compile(
+    r"^[ \t]*\+?([1-9][0-9]{0,%d})[ \t]*,[ \t]*([0-9]{1,9})(?:\.([0-9]{0,6}))?"
+    r"[ \t\r]*(?:,[^\n]*)?$" % (rates.MAX_EXTENSION_LENGTH - 1),
+    re.MULTILINE
+)
+
+_DECIMALS = len(str(rates.PRICE_SCALE)) - 1
+
+
+def _read_chunks(source, chunk_size):
+    """Read an open fileobj in chunks of whole lines
+
+    Arguments:
+        source {obj} -- an open fileobj
+        chunk_size {int} -- bytes read at once
+    """
+    while True:
+        chunk = source.read(chunk_size)
+        if not chunk:
+            return
+        if not chunk.endswith("\n"):
+            chunk += source.readline()
+        yield chunk
+
+
+def _gen_record_lists(name, source, prefix, chunk_size):
+    """Parse an open fileobj and yield a list of records per chunk
+
+    Arguments:
+        name {str} -- file name (used only for logging)
+        source {obj} -- an open fileobj
+        prefix {str} -- only keep the lines starting with it
+        chunk_size {int} -- bytes read at once
+    """
+    # bound locally, called twice per record
+    to_int = int
+    for chunk in _read_chunks(source, chunk_size):
+        with stats.timer("parse"):
+            found = FAST_LINE.findall(chunk)
+        lines = chunk.count("\n") + (not chunk.endswith("\n"))
+        # lines not matched are counted by gen_lines()
+        stats.count("lines_read", len(found))
+        if len(found) != lines:
+            with stats.timer("validate"):
+                lines = chunk.split("\n")
+                if chunk.endswith("\n"):
+                    lines.pop()
+                records = list(rates.gen_records(
+                    helpers.gen_lines(
+                        name, (line for line in lines if not FAST_LINE.match(line))
+                    ),
+                    prefix
+                ))
+            yield records
+        if prefix:
+            with stats.timer("filter"):
+                found = [
+                    match for match in found if match[0].startswith(prefix)
+                ]
+        stats.count("candidate_lines", len(found))
+        with stats.timer("extensions"):
+            records = [
+                (to_int("1" + extension), to_int(units + fraction.ljust(_DECIMALS, "0")))
+                for extension, units, fraction in found
+            ]
+        yield records
+
+
+def gen_records(name, source, prefix="", chunk_size=CHUNK_SIZE):
+    """Parse an open fileobj into encoded records,
+    the same ones as rates.gen_records(gen_lines(name, source), prefix)
+    gives, not necessarily in the same order
+
+    Arguments:
+        name {str} -- file name (used only for logging)
+        source {obj} -- an open fileobj
+
+    Keyword Arguments:
+        prefix {str} -- only keep the lines starting with it (default: {""})
+        chunk_size {int} -- bytes read at once (default: {CHUNK_SIZE})
+
+    Returns:
+        obj -- iterator of (key, price in micro-units)
+    """
+    return itertools.chain.from_iterable(
+        _gen_record_lists(name, source, prefix, chunk_size)
+    )
+
+
+def build_table(name, source, prefix=""):
+    """Parse an open fileobj into a rate table
+
+    Arguments:
+        name {str} -- file name (used only for logging)
+        source {obj} -- an open fileobj
+
+    Keyword Arguments:
+        prefix {str} -- only keep the lines starting with it (default: {""})
+
+    Returns:
+        obj -- RateTable
+    """
+    return rates.RateTable.from_records(gen_records(name, source, prefix))
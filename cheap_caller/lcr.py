@@ -0,0 +1,102 @@
+"""
+Least cost routing table, the cheapest operator for every prefix
+
+For every extension of any operator, the cheapest operator and price of
+a phone number whose longest known prefix is that extension, i.e. the
+longest prefix match of each operator resolved up front. It is written
+as csv for a switch, whose lookup is then one longest prefix match in a
+single table.
+
+The extensions are swept in lexicographic order, so the extensions
+matching a prefix are the ones on the path to it, one leading digit at a
+time, which bounds the memory to the extensions starting with that digit.
+"""
+
+import csv
+import bisect
+import logging
+import itertools
+
+from cheap_caller import rates
+
+
+LOGGER = logging.getLogger(__name__)
+
+CSV_FIELDS = ("prefix", "operator", "price")
+
+
+def _gen_partition(columns, digit):
+    """Get the extensions starting with a digit of all the operators,
+    in lexicographic order
+
+    Arguments:
+        columns {list} -- (keys array, prices array) per operator
+        digit {str} -- leading digit
+
+    Returns:
+        list -- list of (extension, operator position, price in micro-units)
+    """
+    entries = []
+    for position, (keys, prices) in enumerate(columns):
+        for length in xrange(1, rates.MAX_EXTENSION_LENGTH + 1):
+            # encoded keys of a length starting with digit are contiguous
+            low = bisect.bisect_left(
+                keys, rates.encode_extension(digit + "0" * (length - 1))
+            )
+            high = bisect.bisect_right(
+                keys, rates.encode_extension(digit + "9" * (length - 1))
+            )
+            entries.extend(
+                (rates.decode_extension(keys[index]), position, prices[index])
+                for index in xrange(low, high)
+            )
+    entries.sort()
+    return entries
+
+
+def gen_routes(operators):
+    """Yield the cheapest operator for each extension of any operator,
+    in lexicographic order of the extensions, ties go to the operator
+    name first in alphabetical order
+
+    Arguments:
+        operators {list} -- list of (operator name, table)
+
+    Yields:
+        tuple -- (extension, operator name, price in micro-units)
+    """
+    names = [name for name, _ in operators]
+    columns = [rates.table_columns(table) for _, table in operators]
+    for digit in "0123456789":
+        # extensions on the path to the current one, each with the
+        # (price, name) of the longest match of each operator
+        path = []
+        entries = _gen_partition(columns, digit)
+        for extension, group in itertools.groupby(entries, lambda entry: entry[0]):
+            while path and not extension.startswith(path[-1][0]):
+                path.pop()
+            matches = list(path[-1][1]) if path else [None] * len(names)
+            for _, position, price in group:
+                matches[position] = (price, names[position])
+            path.append((extension, matches))
+            price, name = min(match for match in matches if match is not None)
+            yield extension, name, price
+
+
+def write_csv(routes, out):
+    """Write routes as csv rows
+
+    Arguments:
+        routes {obj} -- sequence of tuples yielded by gen_routes()
+        out {obj} -- an open fileobj to write to
+
+    Returns:
+        int -- number of routes written
+    """
+    writer = csv.writer(out)
+    writer.writerow(CSV_FIELDS)
+    count = 0
+    for extension, name, price in routes:
+        writer.writerow((extension, name, rates.format_price(price)))
+        count += 1
+    return count
@@ -0,0 +1,73 @@
+"""
+Normalisation of phone numbers in bulk
+
+A phone number may have leading whitespace, a leading 00 and/or +, as
+in 0046 or +0046, and - between its digits, anything else than ascii
+digits makes it invalid, e.g. 1e5, inf or 46 73. It is normalised to
+its digits, the key looked up in the operator data.
+
+Rejected numbers get a reason instead of raising, so millions of them
+can be fed through gen_normalized() to the lookups without a try/except
+per number.
+"""
+
+import re
+
+
+# rejection reasons
+EMPTY = "empty"
+NOT_DIGITS = "not_digits"
+NO_DIGITS = "no_digits"
+
+# error messages of the reasons, formatted with the phone number
+MESSAGES = {
+    EMPTY: "No phoneno provided",
+    NOT_DIGITS: "Not only digits, a leading + or 00 and -: {}",
+    NO_DIGITS: "No digits: {}",
+}
+
+# the prefixes remove_leading_plus_and_zeros() strips, then digits and -
+_PHONENO = re.compile(r"\s*(?:00\+?)?(?:\+(?:00)?)?([0-9-]*)\s*\Z")
+
+
+def _reason(number):
+    """Reason a phone number the pattern did not match is rejected"""
+    if not number or number.isspace():
+        return EMPTY
+    return NOT_DIGITS
+
+
+def normalize(number):
+    """Normalise a phone number
+
+    Arguments:
+        number {str} -- phone number, may have a leading + or 00 and -
+
+    Returns:
+        tuple -- (digits, None), or (None, rejection reason) if not valid
+    """
+    # most are digits already, unicode ones may be other digits
+    if isinstance(number, str) and number.isdigit() and number[0] != "0":
+        return number, None
+    match = _PHONENO.match(number) if number else None
+    if match is None:
+        return None, _reason(number)
+    digits = match.group(1)
+    if "-" in digits:
+        digits = digits.replace("-", "")
+    if not digits:
+        return None, NO_DIGITS if number.strip() else EMPTY
+    return digits, None
+
+
+def gen_normalized(numbers):
+    """Normalise phone numbers one after the other
+
+    Arguments:
+        numbers {obj} -- a sequence of phone numbers
+
+    Yields:
+        tuple -- (digits, None), or (None, rejection reason) if not valid
+    """
+    for number in numbers:
+        yield normalize(number)
@@ -1,30 +1,120 @@
 """
 This module handles the parsing of command line args
+
+argparse is only imported to build a parser, a lookup given only
+a phone number and a directory is parsed without it, see parse()
 """
 import os
-import argparse
 
-def parse(args):
-    """Handles the parsing of command line arguments
 
-    Keyword Arguments:
-        args {list} -- list of arguments/values
+def _new_parser(**kwargs):
+    """Create an argument parser
 
     Returns:
-        dict -- dict containing parsed arguments
+        obj -- argparse.ArgumentParser
+    """
+    import argparse
+    return argparse.ArgumentParser(**kwargs)
+
+
+def _positive_int(value):
+    """Argument type for strictly positive integers
+
+    Arguments:
+        value {str} -- argument value
+
+    Returns:
+        int -- converted value
+    """
+    import argparse
+    converted = int(value)
+    if converted < 1:
+        raise argparse.ArgumentTypeError(
+            "{} is not a positive integer".format(value)
+        )
+    return converted
+
+
+def _non_negative_int(value):
+    """Argument type for positive integers or zero
+
+    Arguments:
+        value {str} -- argument value
+
+    Returns:
+        int -- converted value
+    """
+    import argparse
+    converted = int(value)
+    if converted < 0:
+        raise argparse.ArgumentTypeError(
+            "{} is not a positive integer or zero".format(value)
+        )
+    return converted
+
+
+def _prefix_ranges(value):
+    """Argument type for the prefix ranges of a shard, e.g. 1-3,44
+
+    Arguments:
+        value {str} -- argument value
+
+    Returns:
+        list -- list of (lowest prefix, highest prefix)
+    """
+    import argparse
+    from cheap_caller import shard
+    try:
+        return shard.parse_ranges(value)
+    except ValueError as error:
+        raise argparse.ArgumentTypeError(str(error))
+
+
+def _shard_server(value):
+    """Argument type for a shard server and its prefix ranges,
+    e.g. 127.0.0.1:8643=1-3,44
+
+    Arguments:
+        value {str} -- argument value
+
+    Returns:
+        tuple -- (address, list of (lowest prefix, highest prefix))
+    """
+    import argparse
+    from cheap_caller import shard
+    address, separator, ranges = value.rpartition("=")
+    if not separator or not address:
+        raise argparse.ArgumentTypeError(
+            "{} is not <address>=<ranges>".format(value)
+        )
+    return shard.parse_address(address), _prefix_ranges(ranges)
+
+
+def _add_log_level_argument(parser):
+    """Add the argument selecting the log level to a parser
+
+    Arguments:
+        parser {obj} -- argparse.ArgumentParser
     """
-    parser = argparse.ArgumentParser(
-        description='Find the cheapest operator to call with.'
-    )
     parser.add_argument(
-        "phoneno",
-        metavar="<phonenumber>",
+        "--log-level",
+        "-ll",
+        metavar="<log_level>",
         action="store",
+        default="info",
+        choices=("debug", "info", "warning", "error", "critical"),
         help="""
-            Phone number that you would like to find
-            the cheapest operator for.
+            Log level that will be used when logging to screen.
             """
     )
+
+
+def _add_operator_arguments(parser):
+    """Add the arguments shared by all the commands to a parser
+
+    Arguments:
+        parser {obj} -- argparse.ArgumentParser
+    """
     parser.add_argument(
         "operatordir",
         action="store",
@@ -45,18 +135,558 @@ def parse(args):
             """
     )
     parser.add_argument(
-        "--log-level",
-        "-ll",
-        metavar="<log_level>",
+        "--include",
+        metavar="<pattern>",
+        action="append",
+        default=[],
+        help="""
+            Another pattern of the operator files to look for, can be
+            given many times, a pattern with a / matches the path
+            relative to the operator directory.
+            """
+    )
+    parser.add_argument(
+        "--exclude",
+        metavar="<pattern>",
+        action="append",
+        default=[],
+        help="""
+            Pattern of the files and directories to leave out,
+            can be given many times.
+            """
+    )
+    parser.add_argument(
+        "--manifest",
+        metavar="<file>",
         action="store",
-        default="info",
-        choices=("debug", "info", "warning", "error", "critical"),
+        default=None,
         help="""
-            Log level that will be used when logging to screen.
+            Manifest of the directory listings, kept between runs
+            so only the changed directories are listed again.
+            """
+    )
+    parser.add_argument(
+        "--scan-threads",
+        metavar="<threads>",
+        action="store",
+        type=_positive_int,
+        default=1,
+        help="""
+            Number of directories listed concurrently, e.g. more
+            on a network file system.
+            """
+    )
+    parser.add_argument(
+        "--workers",
+        "-w",
+        metavar="<workers>",
+        action="store",
+        type=_positive_int,
+        default=1,
+        help="""
+            Number of worker processes parsing operator files in parallel.
+            """
+    )
+    _add_log_level_argument(parser)
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="""
+            Write per stage timings and counters as json to stderr,
+            also enabled by the CHEAP_CALLER_PROFILE environment variable.
+            """
+    )
+
+
+def _add_index_argument(parser):
+    """Add the argument selecting a precompiled index file to a parser
+
+    Arguments:
+        parser {obj} -- argparse.ArgumentParser
+    """
+    parser.add_argument(
+        "--index",
+        "-x",
+        metavar="<file>",
+        action="store",
+        default=None,
+        help="""
+            Precompiled index file of the operator files, it is
+            (re)compiled when missing or stale. Defaults to
+            <path>/.cheap_caller.index which is used only if it exists.
+            """
+    )
+    parser.add_argument(
+        "--memory-budget",
+        "-m",
+        metavar="<megabytes>",
+        action="store",
+        type=_positive_int,
+        default=None,
+        help="""
+            Compile the index out of core, holding at most about
+            <megabytes> of operator data in memory and spilling the rest
+            to temporary files next to the index.
+            """
+    )
+
+
+def _add_shared_argument(parser):
+    """Add the argument merging the rate tables once loaded to a parser
+
+    Arguments:
+        parser {obj} -- argparse.ArgumentParser
+    """
+    parser.add_argument(
+        "--shared",
+        action="store_true",
+        default=False,
+        help="""
+            Merge the rates of all the operators once loaded, keeping each
+            extension once for all of them: less memory and faster
+            lookups, longer to load.
+            """
+    )
+
+
+def _add_cache_argument(parser):
+    """Add the argument sizing the lookup result cache to a parser
+
+    Arguments:
+        parser {obj} -- argparse.ArgumentParser
+    """
+    parser.add_argument(
+        "--cache-size",
+        "-c",
+        metavar="<entries>",
+        action="store",
+        type=_non_negative_int,
+        default=0,
+        help="""
+            Cache the results of up to <entries> matched prefixes,
+            least recently used first out, 0 for no cache.
+            """
+    )
+
+
+def _add_top_argument(parser):
+    """Add the argument ranking the top cheapest operators to a parser
+
+    Arguments:
+        parser {obj} -- argparse.ArgumentParser
+    """
+    parser.add_argument(
+        "--top",
+        "-t",
+        metavar="<k>",
+        action="store",
+        type=_positive_int,
+        default=None,
+        help="""
+            Rank the <k> cheapest operators, on equal prices
+            by operator name, e.g. for failover routing.
+            """
+    )
+
+
+def _lookup_parser():
+    """Parser for the default command, a single phone number lookup
+
+    Returns:
+        obj -- argparse.ArgumentParser
+    """
+    parser = _new_parser(
+        description='Find the cheapest operator to call with.',
+        epilog="""
+            Other commands: {}. Run cheap_caller.py <command> -h
+            for help on a command.
+            """.format(", ".join(sorted(_COMMANDS)))
+    )
+    parser.add_argument(
+        "phoneno",
+        metavar="<phonenumber>",
+        action="store",
+        help="""
+            Phone number that you would like to find
+            the cheapest operator for.
+            """
+    )
+    _add_operator_arguments(parser)
+    _add_index_argument(parser)
+    _add_shared_argument(parser)
+    _add_top_argument(parser)
+    return parser
+
+
+def _batch_parser():
+    """Parser for the batch command, many phone numbers lookup
+
+    Returns:
+        obj -- argparse.ArgumentParser
+    """
+    parser = _new_parser(
+        prog="cheap_caller.py batch",
+        description='Find the cheapest operator to call with '
+                    'for many phone numbers.'
+    )
+    _add_operator_arguments(parser)
+    _add_index_argument(parser)
+    _add_shared_argument(parser)
+    parser.add_argument(
+        "--input",
+        "-i",
+        metavar="<file>",
+        action="store",
+        default="-",
+        help="""
+            File with one phone number per line, - for stdin.
+            """
+    )
+    parser.add_argument(
+        "--format",
+        "-f",
+        metavar="<format>",
+        action="store",
+        default="csv",
+        choices=("csv", "jsonl"),
+        help="""
+            Format of the results written to stdout.
+            """
+    )
+    _add_cache_argument(parser)
+    _add_top_argument(parser)
+    return parser
+
+
+def _cdr_parser():
+    """Parser for the cdr command, cost of call detail records
+
+    Returns:
+        obj -- argparse.ArgumentParser
+    """
+    parser = _new_parser(
+        prog="cheap_caller.py cdr",
+        description='Sum the cost of calls on each operator and '
+                    'with the cheapest operator for each call.'
+    )
+    _add_operator_arguments(parser)
+    _add_index_argument(parser)
+    parser.add_argument(
+        "--input",
+        "-i",
+        metavar="<file>",
+        action="store",
+        default="-",
+        help="""
+            File with a comma separated phone number and duration
+            in seconds per line, - for stdin.
+            """
+    )
+    parser.add_argument(
+        "--unit",
+        "-u",
+        metavar="<seconds>",
+        action="store",
+        type=_positive_int,
+        default=60,
+        help="""
+            Seconds per unit of time the prices are for,
+            durations are prorated to the second.
+            """
+    )
+    return parser
+
+
+def _compile_parser():
+    """Parser for the compile command, writes a precompiled index file
+
+    Returns:
+        obj -- argparse.ArgumentParser
+    """
+    parser = _new_parser(
+        prog="cheap_caller.py compile",
+        description='Compile the operator files into an index file.'
+    )
+    _add_operator_arguments(parser)
+    _add_index_argument(parser)
+    _add_shared_argument(parser)
+    return parser
+
+
+def _compact_parser():
+    """Parser for the compact command, applies the delta files
+    to the operator files
+
+    Returns:
+        obj -- argparse.ArgumentParser
+    """
+    parser = _new_parser(
+        prog="cheap_caller.py compact",
+        description='Apply the delta files of each operator file to it '
+                    'and remove them.'
+    )
+    _add_operator_arguments(parser)
+    return parser
+
+
+def _summarize_parser():
+    """Parser for the summarize command, writes a summary per operator file
+
+    Returns:
+        obj -- argparse.ArgumentParser
+    """
+    parser = _new_parser(
+        prog="cheap_caller.py summarize",
+        description='Write a summary next to each operator file, '
+                    'so lookups only read the lines that can match.'
+    )
+    _add_operator_arguments(parser)
+    return parser
+
+
+def _add_address_arguments(parser):
+    """Add the arguments selecting the socket a server listens on
+    to a parser
+
+    Arguments:
+        parser {obj} -- argparse.ArgumentParser
+    """
+    address = parser.add_mutually_exclusive_group()
+    address.add_argument(
+        "--socket",
+        "-s",
+        metavar="<file>",
+        action="store",
+        default=None,
+        help="""
+            Path of the unix socket to listen on.
+            """
+    )
+    address.add_argument(
+        "--port",
+        metavar="<port>",
+        action="store",
+        type=int,
+        default=8642,
+        help="""
+            Localhost tcp port to listen on, used when no socket is given.
+            """
+    )
+
+
+def _serve_parser():
+    """Parser for the serve command, a long running lookup server
+
+    Returns:
+        obj -- argparse.ArgumentParser
+    """
+    parser = _new_parser(
+        prog="cheap_caller.py serve",
+        description='Serve cheapest operator lookups over a socket, '
+                    'one or more phone numbers per request line.'
+    )
+    _add_operator_arguments(parser)
+    _add_index_argument(parser)
+    _add_shared_argument(parser)
+    _add_address_arguments(parser)
+    parser.add_argument(
+        "--watch",
+        metavar="<seconds>",
+        action="store",
+        type=float,
+        default=None,
+        help="""
+            Poll the operator files every <seconds> and reload
+            the added, changed or removed ones.
+            """
+    )
+    _add_cache_argument(parser)
+    return parser
+
+
+def _shard_parser():
+    """Parser for the shard command, splits the operator files
+    by prefix ranges
+
+    Returns:
+        obj -- argparse.ArgumentParser
+    """
+    parser = _new_parser(
+        prog="cheap_caller.py shard",
+        description='Split the operator files into one directory per shard, '
+                    'each holding the lines its prefix ranges can match.'
+    )
+    _add_operator_arguments(parser)
+    parser.add_argument(
+        "--output",
+        "-o",
+        metavar="<path>",
+        action="store",
+        required=True,
+        help="""
+            Directory to write the shards to, shard0, shard1 and so on.
+            """
+    )
+    parser.add_argument(
+        "--shard",
+        "-S",
+        metavar="<ranges>",
+        dest="shards",
+        action="append",
+        type=_prefix_ranges,
+        required=True,
+        help="""
+            Prefix ranges of a shard, e.g. 1-3,44, once per shard.
+            """
+    )
+    return parser
+
+
+def _route_parser():
+    """Parser for the route command, a lookup server forwarding
+    to shard servers
+
+    Returns:
+        obj -- argparse.ArgumentParser
+    """
+    parser = _new_parser(
+        prog="cheap_caller.py route",
+        description='Serve lookups like serve, forwarding each phone number '
+                    'to the shard server owning its prefix.'
+    )
+    parser.add_argument(
+        "--shard",
+        "-S",
+        metavar="<address>=<ranges>",
+        dest="shards",
+        action="append",
+        type=_shard_server,
+        required=True,
+        help="""
+            A shard server and its prefix ranges, once per shard,
+            the address being a unix socket path, <port> or <host>:<port>,
+            e.g. 8643=1-3,44.
+            """
+    )
+    _add_address_arguments(parser)
+    parser.add_argument(
+        "--timeout",
+        metavar="<seconds>",
+        action="store",
+        type=float,
+        default=None,
+        help="""
+            Seconds to wait for a shard server before dropping
+            the client connection.
+            """
+    )
+    _add_log_level_argument(parser)
+    return parser
+
+
+def _lcr_parser():
+    """Parser for the lcr command, writes a least cost routing table
+
+    Returns:
+        obj -- argparse.ArgumentParser
+    """
+    parser = _new_parser(
+        prog="cheap_caller.py lcr",
+        description='Write the cheapest operator and price of every prefix '
+                    'of any operator as csv.'
+    )
+    _add_operator_arguments(parser)
+    _add_index_argument(parser)
+    parser.add_argument(
+        "--output",
+        "-o",
+        metavar="<file>",
+        action="store",
+        default="-",
+        help="""
+            File to write the routing table to, - for stdout.
             """
     )
+    return parser
+
+
+_COMMANDS = {
+    "batch": _batch_parser,
+    "cdr": _cdr_parser,
+    "compact": _compact_parser,
+    "lcr": _lcr_parser,
+    "compile": _compile_parser,
+    "route": _route_parser,
+    "serve": _serve_parser,
+    "shard": _shard_parser,
+    "summarize": _summarize_parser,
+}
+
+
+# what the lookup parser gives for the options not given
+_LOOKUP_DEFAULTS = {
+    "pattern": "*.operator",
+    "include": [],
+    "exclude": [],
+    "manifest": None,
+    "scan_threads": 1,
+    "workers": 1,
+    "log_level": "info",
+    "profile": False,
+    "index": None,
+    "memory_budget": None,
+    "shared": False,
+    "top": None,
+}
+
+
+def _parse_plain_lookup(args):
+    """Parse a lookup given only a phone number and an existing
+    directory, the most common command line, without argparse
+
+    Keyword Arguments:
+        args {list} -- list of arguments/values
+
+    Returns:
+        dict -- same as parse(), None if args are anything else
+    """
+    if len(args) != 2 or args[0] in _COMMANDS or \
+            any(arg.startswith("-") for arg in args) or not os.path.exists(args[1]):
+        return None
+    parsed = dict(_LOOKUP_DEFAULTS, phoneno=args[0], operatordir=args[1])
+    parsed["command"] = "lookup"
+    return parsed
+
+
+def parse(args):
+    """Handles the parsing of command line arguments
+
+    The first argument selects a command if it is one of the
+    known commands, otherwise a single phone number lookup is parsed
+
+    Keyword Arguments:
+        args {list} -- list of arguments/values
+
+    Returns:
+        dict -- dict containing parsed arguments,
+                "command" item being the selected command
+    """
+    parsed = _parse_plain_lookup(args)
+    if parsed is not None:
+        return parsed
+    command = "lookup"
+    if args and args[0] in _COMMANDS:
+        command = args[0]
+        parser = _COMMANDS[command]()
+        args = args[1:]
+    else:
+        parser = _lookup_parser()
     parsed = parser.parse_args(args)
     parsed = vars(parsed)
-    if not os.path.exists(parsed["operatordir"]):
+    parsed["command"] = command
+    # the route command reads no operator files
+    if "operatordir" in parsed and not os.path.exists(parsed["operatordir"]):
         parser.error("operatordir has to be a valid directory")
+    if parsed.get("input", "-") != "-" and not os.path.isfile(parsed["input"]):
+        parser.error("input has to be a valid file")
     return parsed
@@ -0,0 +1,252 @@
+"""
+Compact numeric representation of the rates of an operator
+
+Extensions are encoded as integers and prices as integer fixed-point
+micro-units, parsed once at ingest and kept in sorted array columns,
+16 bytes per extension instead of two python strings in a list.
+"""
+
+import array
+import bisect
+import logging
+
+from cheap_caller import stats
+
+
+LOGGER = logging.getLogger(__name__)
+
+# prices are kept in micro-units, i.e. rounded to 6 decimals
+PRICE_SCALE = 1000000
+# longest extension that fits in an uint64 once encoded
+MAX_EXTENSION_LENGTH = 18
+# array typecodes of the key and price columns, 8 bytes each on LP64
+KEY_TYPECODE = "L"
+PRICE_TYPECODE = "l"
+# largest price in micro-units that fits in the price column
+MAX_PRICE = 2 ** 63 - 1
+
+
+def encode_extension(extension):
+    """Encode an extension as an integer, a leading 1 keeps leading zeros
+
+    Arguments:
+        extension {str} -- extension, e.g. "046"
+
+    Returns:
+        int -- encoded extension, e.g. 1046, None if it can not be encoded
+    """
+    if not extension.isdigit() or len(extension) > MAX_EXTENSION_LENGTH:
+        return None
+    return int("1" + extension)
+
+
+def decode_extension(key):
+    """Decode an integer returned by encode_extension()
+
+    Arguments:
+        key {int} -- encoded extension
+
+    Returns:
+        str -- extension
+    """
+    return str(key)[1:]
+
+
+def parse_price(price):
+    """Parse a price into micro-units
+
+    Arguments:
+        price {str} -- price, e.g. "0.9"
+
+    Raises:
+        ValueError -- if price is not a finite number
+                      or does not fit in the price column
+
+    Returns:
+        int -- price in micro-units, e.g. 900000
+    """
+    try:
+        micro = int(round(float(price) * PRICE_SCALE))
+    except OverflowError:
+        raise ValueError("Price is not finite: {}".format(price))
+    if abs(micro) > MAX_PRICE:
+        raise ValueError("Price is too large: {}".format(price))
+    return micro
+
+
+def format_price(micro):
+    """Format micro-units as a decimal price, without trailing zeros
+
+    Arguments:
+        micro {int} -- price in micro-units, e.g. 900000
+
+    Returns:
+        str -- price, e.g. "0.9"
+    """
+    sign = "-" if micro < 0 else ""
+    units, fraction = divmod(abs(micro), PRICE_SCALE)
+    return "{}{}.{}".format(
+        sign, units, "{:06d}".format(fraction).rstrip("0") or "0"
+    )
+
+
+def gen_records(lines, prefix=""):
+    """Encode the extension and price of each line,
+    ignoring the lines that can not be encoded
+
+    Arguments:
+        lines {obj} -- sequence of lines returned by gen_lines()
+
+    Keyword Arguments:
+        prefix {str} -- only keep the lines starting with it (default: {""})
+
+    Yields:
+        tuple -- (key, price in micro-units)
+    """
+    candidates = 0
+    try:
+        for extension, price in lines:
+            if not extension.startswith(prefix):
+                continue
+            candidates += 1
+            key = encode_extension(extension)
+            if key is None:
+                LOGGER.warning(
+                    "Ignoring extension %s, only up to %s digits can be indexed",
+                    extension, MAX_EXTENSION_LENGTH
+                )
+                continue
+            try:
+                price = parse_price(price)
+            except ValueError:
+                LOGGER.warning(
+                    "Ignoring extension %s, price %s is not finite or too large",
+                    extension, price
+                )
+                continue
+            yield key, price
+    finally:
+        stats.count("candidate_lines", candidates)
+
+
+def table_columns(table):
+    """Copy the key and price columns of a table into arrays
+
+    Arguments:
+        table {obj} -- RateTable or MappedTable
+
+    Returns:
+        tuple -- (keys array, prices array)
+    """
+    keys, keys_offset, prices, prices_offset, count = table.column_buffers()
+    keys_column = array.array(KEY_TYPECODE)
+    keys_column.fromstring(
+        str(buffer(keys, keys_offset, count * keys_column.itemsize))
+    )
+    prices_column = array.array(PRICE_TYPECODE)
+    prices_column.fromstring(
+        str(buffer(prices, prices_offset, count * prices_column.itemsize))
+    )
+    return keys_column, prices_column
+
+
+class RateTable(object):
+    """Cheapest price per extension of one operator,
+    in two columns sorted by encoded extension
+    """
+
+    __slots__ = ("keys", "prices")
+
+    def __init__(self, keys=None, prices=None):
+        self.keys = keys if keys is not None else array.array(KEY_TYPECODE)
+        self.prices = prices if prices is not None else array.array(PRICE_TYPECODE)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __getstate__(self):
+        # sent back from worker processes
+        return self.keys.tostring(), self.prices.tostring()
+
+    def __setstate__(self, state):
+        self.keys = array.array(KEY_TYPECODE)
+        self.keys.fromstring(state[0])
+        self.prices = array.array(PRICE_TYPECODE)
+        self.prices.fromstring(state[1])
+
+    @classmethod
+    def from_lines(cls, lines, prefix=""):
+        """Build a table from a sequence of lines, keeping the
+        cheapest price per extension, the first one seen on a tie
+
+        Arguments:
+            lines {obj} -- sequence of lines returned by gen_lines()
+
+        Keyword Arguments:
+            prefix {str} -- only keep the lines starting with it (default: {""})
+
+        Returns:
+            obj -- RateTable
+        """
+        return cls.from_records(gen_records(lines, prefix))
+
+    @classmethod
+    def from_records(cls, records):
+        """Build a table from a sequence of encoded records,
+        keeping the cheapest price per key
+
+        Arguments:
+            records {obj} -- sequence of (key, price in micro-units)
+
+        Returns:
+            obj -- RateTable
+        """
+        cheapest = {}
+        for key, price in records:
+            if key not in cheapest or price < cheapest[key]:
+                cheapest[key] = price
+        keys = array.array(KEY_TYPECODE, sorted(cheapest))
+        prices = array.array(PRICE_TYPECODE, (cheapest[key] for key in keys))
+        return cls(keys, prices)
+
+    def column_buffers(self):
+        """Buffers holding the key and price columns
+
+        Returns:
+            tuple -- (keys buffer, keys offset, prices buffer,
+                      prices offset, count)
+        """
+        return self.keys, 0, self.prices, 0, len(self.keys)
+
+    def find(self, key):
+        """Binary search for an encoded extension
+
+        Arguments:
+            key {int} -- encoded extension
+
+        Returns:
+            int -- position of the key, -1 if not found
+        """
+        position = bisect.bisect_left(self.keys, key)
+        if position < len(self.keys) and self.keys[position] == key:
+            return position
+        return -1
+
+    def longest_match(self, phoneno):
+        """Get the cheapest line of the longest extension matching phoneno
+
+        Arguments:
+            phoneno {str} -- sanitized phone number
+
+        Returns:
+            list -- [extension, price] or None if nothing matches
+        """
+        for length in xrange(min(len(phoneno), MAX_EXTENSION_LENGTH), 0, -1):
+            extension = phoneno[:length]
+            key = encode_extension(extension)
+            if key is None:
+                continue
+            position = self.find(key)
+            if position >= 0:
+                return [extension, format_price(self.prices[position])]
+        return None
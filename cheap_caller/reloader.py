@@ -0,0 +1,233 @@
+"""
+Reload of the operator data for long running processes
+
+The operator files are polled for added, changed or removed files,
+by path, size and mtime. A new index is built on the side and swapped
+in with a single assignment, so lookups in flight keep using the
+index they started with and never see a half built one. When only the
+delta files of an operator file changed, they are overlaid again on its
+table without parsing the operator file.
+"""
+
+import os
+import logging
+import threading
+
+from cheap_caller import delta
+from cheap_caller import helpers
+from cheap_caller import index
+from cheap_caller import store
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+def stat_files(file_paths):
+    """Get size and mtime of each file in the input sequence,
+    files that vanished are left out
+
+    Arguments:
+        file_paths {obj} -- a sequence of full file paths
+
+    Returns:
+        list -- list of (path, (size, mtime)) in the input order
+    """
+    stats = []
+    for file_path in file_paths:
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            LOGGER.debug("File vanished: %s, ignoring", file_path)
+            continue
+        stats.append((file_path, (stat.st_size, stat.st_mtime)))
+    return stats
+
+
+def stat_deltas(delta_paths):
+    """Get size and mtime of the delta files of each operator file
+
+    Arguments:
+        delta_paths {dict} -- returned by delta.find_deltas()
+
+    Returns:
+        dict -- key = operator file path; value = list returned by
+                stat_files() for its delta files
+    """
+    return dict(
+        (file_path, stat_files(paths))
+        for file_path, paths in delta_paths.iteritems()
+    )
+
+
+class Reloader(object):  # pylint: disable=too-few-public-methods
+    """Finding of the operator files shared by IndexReloader and
+    StoredIndexReloader, their reload() keeps the index up to date,
+    the current index is the prefix_index attribute
+
+    Arguments:
+        pattern {str} -- operator file pattern
+        top {str} -- directory of the operator files
+
+    Keyword Arguments:
+        workers {int} -- number of worker processes parsing files (default: {1})
+        find {obj} -- called to find the operator files instead of
+                      the pattern, e.g. discovery.find() with the
+                      command line options (default: {None})
+    """
+
+    def __init__(self, pattern, top, workers=1, find=None):
+        self.pattern = pattern
+        self.top = top
+        self.workers = workers
+        self.find = find
+        self.prefix_index = None
+
+    def find_files(self):
+        """Find the operator files, with the find function if given
+
+        Returns:
+            obj -- a sequence of full paths of operator files
+        """
+        if self.find is not None:
+            return self.find()
+        return helpers.gen_find(self.pattern, self.top)
+
+
+class IndexReloader(Reloader):
+    """Keep a PrefixIndex up to date with the operator files,
+    re-parsing only the added or changed files, see Reloader
+    """
+
+    def __init__(self, pattern, top, workers=1, find=None):
+        super(IndexReloader, self).__init__(pattern, top, workers, find)
+        self.prefix_index = index.PrefixIndex()
+        self._stats = []
+        self._delta_stats = {}
+
+    def reload(self):
+        """Reload the added, changed and removed operator files,
+        nothing is done if no file changed
+
+        Returns:
+            bool -- True if a new index was swapped in
+        """
+        stats = stat_files(self.find_files())
+        delta_paths = delta.find_deltas(file_path for file_path, _ in stats)
+        delta_stats = stat_deltas(delta_paths)
+        if stats == self._stats and delta_stats == self._delta_stats:
+            return False
+        known = dict(self._stats)
+        changed = [
+            file_path for file_path, stat in stats
+            if known.get(file_path) != stat
+        ]
+        # parsed again with their delta files anyway
+        changed_deltas = [
+            file_path for file_path, stat in stats
+            if known.get(file_path) == stat and
+            delta_stats.get(file_path) != self._delta_stats.get(file_path)
+        ]
+        LOGGER.info(
+            "Reloading %s of %s operator files, %s with changed deltas only",
+            len(changed), len(stats), len(changed_deltas)
+        )
+        tables = self.prefix_index.tables_by_path()
+        rebuilt = index.build_index_in_pool(changed, workers=self.workers)
+        tables.update(rebuilt.tables_by_path())
+        for file_path in changed_deltas:
+            if file_path not in tables:
+                continue
+            name, table = tables[file_path]
+            tables[file_path] = name, delta.apply_patch(table, delta.read_patch(
+                file_path, delta_paths=delta_paths.get(file_path, [])
+            ))
+        prefix_index = index.PrefixIndex()
+        for file_path, _ in stats:
+            # a changed file may have vanished before it was parsed
+            if file_path in tables:
+                name, table = tables[file_path]
+                prefix_index.add_table(name, table, file_path)
+        # single assignment, lookups see either the old or the new index
+        self.prefix_index = prefix_index
+        self._stats = stats
+        self._delta_stats = delta_stats
+        return True
+
+
+class StoredIndexReloader(Reloader):
+    """Keep a StoredIndex up to date with the operator files,
+    the index file is recompiled when stale and reopened with the
+    delta files overlaid again when only they changed, see Reloader
+
+    Arguments:
+        pattern {str} -- operator file pattern
+        top {str} -- directory of the operator files
+        index_path {str} -- path to the index file
+
+    Keyword Arguments:
+        memory_budget {int} -- bytes of records held in memory while
+                               compiling, None for no limit (default: {None})
+        workers {int} -- number of worker processes parsing files (default: {1})
+        find {obj} -- called to find the operator files (default: {None})
+    """
+
+    def __init__(self, pattern, top, index_path, memory_budget=None, **kwargs):
+        super(StoredIndexReloader, self).__init__(pattern, top, **kwargs)
+        self.index_path = index_path
+        self.memory_budget = memory_budget
+        self._delta_stats = {}
+
+    def reload(self):
+        """Recompile and reopen the index file if stale,
+        nothing is done if no file changed
+
+        Returns:
+            bool -- True if a new index was swapped in
+        """
+        file_paths = list(self.find_files())
+        delta_stats = stat_deltas(delta.find_deltas(file_paths))
+        if self.prefix_index is not None:
+            try:
+                self.prefix_index.check(file_paths)
+                if delta_stats == self._delta_stats:
+                    return False
+            except store.StaleIndexError:
+                pass
+        self._delta_stats = delta_stats
+        # the old index is unmapped once no lookup refers to it anymore
+        self.prefix_index = store.open_index(
+            self.index_path, file_paths, self.workers, self.memory_budget
+        )
+        return True
+
+
+class Watcher(threading.Thread):
+    """Daemon thread polling for operator file changes
+
+    Arguments:
+        reloader {obj} -- IndexReloader or StoredIndexReloader
+        interval {float} -- seconds between polls
+        on_reload {obj} -- called with the new index after each swap
+    """
+
+    def __init__(self, reloader, interval, on_reload):
+        super(Watcher, self).__init__(name="cheap_caller-watcher")
+        self.daemon = True
+        self.reloader = reloader
+        self.interval = interval
+        self.on_reload = on_reload
+        self._stopped = threading.Event()
+
+    def stop(self):
+        """Stop polling, the thread exits after the current poll
+        """
+        self._stopped.set()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                if self.reloader.reload():
+                    self.on_reload(self.reloader.prefix_index)
+            except Exception:  # pylint: disable=broad-except
+                # keep serving the current index
+                LOGGER.exception("Reload failed, keeping the current index")
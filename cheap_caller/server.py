@@ -0,0 +1,185 @@
+"""
+Long running lookup server answering over a unix or a localhost tcp socket
+
+The protocol is line based, a request line holds one or more phone numbers
+separated by whitespace and gets one json line per phone number back,
+in the same order, each being a result dict yielded by batch.gen_results().
+Clients can pipeline requests, they are answered in order.
+"""
+
+import os
+import json
+import socket
+import logging
+import SocketServer
+
+from cheap_caller import batch
+
+
+LOGGER = logging.getLogger(__name__)
+
+DEFAULT_HOST = "127.0.0.1"
+
+
+class LookupHandler(SocketServer.StreamRequestHandler):
+    """Answer the request lines of one client connection
+    """
+
+    def handle(self):
+        for line in iter(self.rfile.readline, ""):
+            numbers = line.split()
+            if not numbers:
+                continue
+            # the index is read once per request line, so a request
+            # is answered from one index even if it is swapped meanwhile
+            results = batch.gen_results(self.server.prefix_index, numbers)
+            self.wfile.write(
+                "".join(
+                    json.dumps(result, sort_keys=True) + "\n"
+                    for result in results
+                )
+            )
+
+
+class ThreadingTCPServer(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+    """TCP server handling each client in a thread
+
+    Arguments:
+        prefix_index {obj} -- index to look up in, can be swapped
+        address {tuple} -- (host, port)
+        handler {obj} -- request handler class
+    """
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, prefix_index, address, handler):
+        SocketServer.TCPServer.__init__(self, address, handler)
+        self.prefix_index = prefix_index
+
+
+class ThreadingUnixServer(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    """Unix socket server handling each client in a thread
+
+    Arguments:
+        prefix_index {obj} -- index to look up in, can be swapped
+        address {str} -- path to the unix socket
+        handler {obj} -- request handler class
+    """
+    daemon_threads = True
+
+    def __init__(self, prefix_index, address, handler):
+        SocketServer.UnixStreamServer.__init__(self, address, handler)
+        self.prefix_index = prefix_index
+
+
+def make_server(prefix_index, address, handler=LookupHandler):
+    """Create a lookup server, not yet serving
+
+    Arguments:
+        prefix_index {obj} -- PrefixIndex or StoredIndex to look up in
+        address {str|tuple} -- path to a unix socket or (host, port)
+
+    Keyword Arguments:
+        handler {obj} -- request handler class (default: {LookupHandler})
+
+    Returns:
+        obj -- server, its prefix_index attribute can be swapped
+               to serve another index
+    """
+    if isinstance(address, tuple):
+        server = ThreadingTCPServer(prefix_index, address, handler)
+    else:
+        if os.path.exists(address):
+            # left behind by a previous server
+            os.remove(address)
+        server = ThreadingUnixServer(prefix_index, address, handler)
+    LOGGER.debug("Lookup server bound to: %s", server.server_address)
+    return server
+
+
+class Client(object):
+    """Client of a lookup server
+    """
+
+    def __init__(self, address, timeout=None):
+        if isinstance(address, tuple):
+            self._socket = socket.create_connection(address, timeout)
+        else:
+            self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._socket.settimeout(timeout)
+            self._socket.connect(address)
+        self._rfile = self._socket.makefile("rb")
+
+    def close(self):
+        """Close the connection
+        """
+        self._rfile.close()
+        self._socket.close()
+
+    def lookup_many(self, numbers):
+        """Look up phone numbers in one request
+
+        Arguments:
+            numbers {list} -- phone numbers, without whitespace
+
+        Returns:
+            list -- result dicts, one per phone number
+        """
+        if not numbers:
+            return []
+        self.send(numbers)
+        return self.receive(len(numbers))
+
+    def send(self, numbers):
+        """Send a request without waiting for its answer,
+        requests are answered in order
+
+        Arguments:
+            numbers {list} -- phone numbers, without whitespace
+        """
+        self._socket.sendall(" ".join(numbers) + "\n")
+
+    def receive_lines(self, count):
+        """Read the answer to sent requests as the server wrote it
+
+        Arguments:
+            count {int} -- number of phone numbers to read the results of
+
+        Raises:
+            IOError -- if the server closed the connection
+
+        Returns:
+            list -- json lines, one per phone number
+        """
+        lines = []
+        for _ in xrange(count):
+            line = self._rfile.readline()
+            if not line:
+                raise IOError("Lookup server closed the connection")
+            lines.append(line)
+        return lines
+
+    def receive(self, count):
+        """Read the answer to sent requests
+
+        Arguments:
+            count {int} -- number of phone numbers to read the results of
+
+        Raises:
+            IOError -- if the server closed the connection
+
+        Returns:
+            list -- result dicts, one per phone number
+        """
+        return [json.loads(line) for line in self.receive_lines(count)]
+
+    def lookup(self, number):
+        """Look up a phone number
+
+        Arguments:
+            number {str} -- phone number
+
+        Returns:
+            dict -- result dict
+        """
+        return self.lookup_many([number])[0]
@@ -0,0 +1,510 @@
+"""
+Sharding of the operator data by leading prefix ranges
+
+A shard owns ranges of prefixes of equal length, e.g. 1-3 or 44 or
+200-219, and holds the lines of every operator file whose extension
+can match a phone number starting with one of its prefixes: the ones
+starting with it and the shorter ones it starts with, the latter are
+then in every shard they can match a number of. So the lookup of a
+phone number only needs the shard owning it, which answers for all the
+operators.
+
+split() writes each shard as a directory of operator files, served like
+any other with the serve command. A router answers the lookups of the
+serve protocol by forwarding each phone number to its shard server.
+"""
+
+import os
+import json
+import logging
+import SocketServer
+
+from cheap_caller import batch
+from cheap_caller import delta
+from cheap_caller import helpers
+from cheap_caller import index
+from cheap_caller import normalize
+from cheap_caller import server
+
+
+LOGGER = logging.getLogger(__name__)
+
+MANIFEST_NAME = "shard.json"
+
+
+def parse_ranges(spec):
+    """Parse comma separated prefix ranges, e.g. "1-3,44"
+
+    Arguments:
+        spec {str} -- ranges, each a prefix or two prefixes of the
+                      same length separated by -
+
+    Raises:
+        ValueError -- if a range is not valid
+
+    Returns:
+        list -- list of (lowest prefix, highest prefix)
+    """
+    ranges = []
+    for part in spec.split(","):
+        bounds = part.strip().split("-")
+        low, high = bounds[0], bounds[-1]
+        if len(bounds) > 2 or not (low.isdigit() and high.isdigit()
+                                   and len(low) == len(high) and low <= high):
+            raise ValueError("Not a prefix range: {}".format(part))
+        ranges.append((low, high))
+    return ranges
+
+
+def format_ranges(ranges):
+    """Format prefix ranges as parsed by parse_ranges()
+
+    Arguments:
+        ranges {list} -- list of (lowest prefix, highest prefix)
+
+    Returns:
+        str -- ranges, e.g. "1-3,44"
+    """
+    return ",".join(
+        low if low == high else "{}-{}".format(low, high)
+        for low, high in ranges
+    )
+
+
+def parse_address(address):
+    """Parse a shard server address
+
+    Arguments:
+        address {str} -- path to a unix socket, a port or host:port
+
+    Returns:
+        str|tuple -- socket path or (host, port)
+    """
+    host, _, port = address.rpartition(":")
+    if port.isdigit() and "/" not in address:
+        return host or server.DEFAULT_HOST, int(port)
+    return address
+
+
+class Partition(object):
+    """Prefix ranges of the shards, no prefix of a shard may
+    start with a prefix of any shard
+
+    Arguments:
+        shards {list} -- prefix ranges of each shard,
+                         as returned by parse_ranges()
+
+    Raises:
+        ValueError -- if prefixes overlap
+    """
+
+    def __init__(self, shards):
+        self.shards = shards
+        # prefix = position of its shard
+        self._owners = {}
+        # proper prefix of a prefix = positions of the shards
+        self._covering = {}
+        for position, ranges in enumerate(shards):
+            for low, high in ranges:
+                for value in xrange(int(low), int(high) + 1):
+                    prefix = str(value).zfill(len(low))
+                    if prefix in self._owners:
+                        raise ValueError("Prefix in two shards: {}".format(prefix))
+                    self._owners[prefix] = position
+        self._lengths = sorted(set(len(prefix) for prefix in self._owners))
+        for prefix, position in self._owners.iteritems():
+            for length in xrange(1, len(prefix)):
+                if prefix[:length] in self._owners:
+                    raise ValueError("Prefixes overlap: {} and {}".format(
+                        prefix[:length], prefix
+                    ))
+                covering = self._covering.setdefault(prefix[:length], [])
+                if position not in covering:
+                    covering.append(position)
+        for covering in self._covering.itervalues():
+            covering.sort()
+
+    def __len__(self):
+        return len(self.shards)
+
+    def _owner(self, digits):
+        """Shard owning a prefix of digits
+
+        Arguments:
+            digits {str} -- phone number or extension
+
+        Returns:
+            int -- position of the shard, None if no shard owns it
+        """
+        for length in self._lengths:
+            if length > len(digits):
+                break
+            position = self._owners.get(digits[:length])
+            if position is not None:
+                return position
+        return None
+
+    def shard_of(self, phoneno):
+        """Shard to look up a phone number in
+
+        Arguments:
+            phoneno {str} -- sanitized phone number
+
+        Returns:
+            int -- position of the shard, None if no shard can match it
+        """
+        position = self._owner(phoneno)
+        if position is None and phoneno in self._covering:
+            # shorter than the prefixes, any shard covering it
+            # has all the extensions it can match
+            position = self._covering[phoneno][0]
+        return position
+
+    def shards_of_extension(self, extension):
+        """Shards holding an extension
+
+        Arguments:
+            extension {str} -- extension
+
+        Returns:
+            list -- positions of the shards
+        """
+        position = self._owner(extension)
+        if position is not None:
+            return [position]
+        return self._covering.get(extension, [])
+
+
+def shard_path(outdir, position):
+    """Directory of a shard
+
+    Arguments:
+        outdir {str} -- directory holding the shards
+        position {int} -- position of the shard
+
+    Returns:
+        str -- path to the shard directory
+    """
+    return os.path.join(outdir, "shard{}".format(position))
+
+
+def _split_source(source, paths, partition, field):
+    """Write the lines of an open fileobj to the shards holding
+    their extension
+
+    Arguments:
+        source {obj} -- an open fileobj
+        paths {list} -- path of the file to write in each shard
+        partition {obj} -- Partition of the shards
+        field {int} -- position of the extension in the comma
+                       separated values of a line
+
+    Returns:
+        list -- number of lines written per shard
+    """
+    counts = [0] * len(partition)
+    outs = [open(path, "w") for path in paths]
+    try:
+        for line in source:
+            fields = line.split(",", field + 1)
+            # the extension as gen_lines() or gen_changes() reads it
+            extension = helpers.remove_leading_plus_and_zeros(
+                fields[field].strip() if len(fields) > field else ""
+            )
+            if not line.endswith("\n"):
+                line += "\n"
+            for position in partition.shards_of_extension(extension):
+                outs[position].write(line)
+                counts[position] += 1
+        return counts
+    finally:
+        for out in outs:
+            out.close()
+
+
+def _split_file(args):
+    """Write the lines of an operator file and of its delta files
+    to the shards holding their extension, may run in a worker process
+
+    Arguments:
+        args {tuple} -- (full path of the operator file,
+                         its path in a shard, relative to the shard,
+                         directory holding the shards,
+                         prefix ranges of each shard)
+
+    Returns:
+        list -- number of lines of the operator file written per shard,
+                None if it can not be opened
+    """
+    file_path, name, outdir, shards = args
+    partition = Partition(shards)
+    counts = None
+    for adict in helpers.open_files([file_path]):
+        counts = _split_source(adict["source"], [
+            os.path.join(shard_path(outdir, position), name)
+            for position in xrange(len(partition))
+        ], partition, 0)
+    if counts is None:
+        return None
+    # named after the operator file, they stay next to it
+    for delta_path in delta.find_deltas([file_path]).get(file_path, []):
+        delta_name = os.path.join(
+            os.path.dirname(name), os.path.basename(delta_path)
+        )
+        with open(delta_path) as source:
+            _split_source(source, [
+                os.path.join(shard_path(outdir, position), delta_name)
+                for position in xrange(len(partition))
+            ], partition, 1)
+    return counts
+
+
+def _shard_names(file_paths, top):
+    """Paths of operator files in a shard, the ones relative to the
+    directory they were found in, without compression suffix
+
+    Arguments:
+        file_paths {list} -- full paths of operator files
+        top {str} -- directory they were found in
+
+    Raises:
+        ValueError -- if two operator files have the same path in a shard
+
+    Returns:
+        list -- path of each operator file, relative to a shard
+    """
+    names = [
+        os.path.relpath(helpers.split_compression(file_path)[0], top)
+        for file_path in file_paths
+    ]
+    seen = {}
+    for file_path, name in zip(file_paths, names):
+        if name in seen:
+            raise ValueError("Operator files {} and {} are both {} in a shard".format(
+                seen[name], file_path, name
+            ))
+        seen[name] = file_path
+    return names
+
+
+def _make_shards(outdir, shards, directories):
+    """Create the shard directories, with a manifest of their ranges
+
+    Arguments:
+        outdir {str} -- directory to write the shards to
+        shards {list} -- prefix ranges of each shard,
+                         as returned by parse_ranges()
+        directories {obj} -- subdirectories of each shard to create
+    """
+    for position, ranges in enumerate(shards):
+        path = shard_path(outdir, position)
+        for directory in directories:
+            if not os.path.isdir(os.path.join(path, directory)):
+                os.makedirs(os.path.join(path, directory))
+        with open(os.path.join(path, MANIFEST_NAME), "w") as manifest:
+            json.dump({"ranges": format_ranges(ranges)}, manifest)
+
+
+def split(file_paths, top, outdir, shards, workers=1):
+    """Split operator files into shards, one directory per shard
+    holding a file per operator file, at the same path relative to
+    the shard as to top, with a manifest of its ranges
+
+    The delta files of an operator file are split along with it
+
+    Arguments:
+        file_paths {obj} -- a sequence of full paths of operator files
+        top {str} -- directory the operator files were found in
+        outdir {str} -- directory to write the shards to
+        shards {list} -- prefix ranges of each shard,
+                         as returned by parse_ranges()
+
+    Keyword Arguments:
+        workers {int} -- number of worker processes splitting files (default: {1})
+
+    Raises:
+        ValueError -- if prefixes overlap, or two operator files
+                      have the same path in a shard
+
+    Returns:
+        list -- number of lines written per shard
+    """
+    # checked before writing anything
+    Partition(shards)
+    file_paths = list(file_paths)
+    names = _shard_names(file_paths, top)
+    _make_shards(outdir, shards, set(os.path.dirname(name) for name in names))
+    totals = [0] * len(shards)
+    results = helpers.map_in_pool(
+        _split_file,
+        [(file_path, name, outdir, shards)
+         for file_path, name in zip(file_paths, names)],
+        workers
+    )
+    for counts in results:
+        if counts is not None:
+            totals = [total + count for total, count in zip(totals, counts)]
+    return totals
+
+
+class Router(object):
+    """Look up phone numbers in the shard servers owning them,
+    answering like a lookup server
+
+    Arguments:
+        addresses {list} -- address of each shard server
+        partition {obj} -- Partition of the prefixes among the shards
+
+    Keyword Arguments:
+        timeout {float} -- seconds to wait for a shard server (default: {None})
+    """
+
+    def __init__(self, addresses, partition, timeout=None):
+        self.partition = partition
+        self._addresses = addresses
+        self._timeout = timeout
+        self._clients = {}
+
+    def close(self):
+        """Close the connections to the shard servers
+        """
+        for client in self._clients.itervalues():
+            client.close()
+        self._clients.clear()
+
+    def _client(self, position):
+        """Connection to a shard server, opened on first use
+        """
+        if position not in self._clients:
+            self._clients[position] = server.Client(
+                self._addresses[position], self._timeout
+            )
+        return self._clients[position]
+
+    def lookup_lines(self, numbers):
+        """Look up phone numbers, all the shards are sent their
+        numbers before any answer is read
+
+        The answers of the shard servers are passed on as they wrote
+        them, they are not decoded
+
+        Arguments:
+            numbers {list} -- phone numbers, without whitespace
+
+        Returns:
+            list -- json lines of the result dicts, one per phone number,
+                    same as a lookup server writes
+        """
+        lines = [None] * len(numbers)
+        by_shard = {}
+        unrouted = []
+        for position, (phoneno, _) in enumerate(
+                normalize.gen_normalized(numbers)):
+            shard = None if phoneno is None else self.partition.shard_of(phoneno)
+            if shard is None:
+                unrouted.append(position)
+                continue
+            by_shard.setdefault(shard, []).append(position)
+        for shard, positions in by_shard.iteritems():
+            self._client(shard).send([numbers[position] for position in positions])
+        # invalid or no shard can match them, answered here meanwhile
+        # by an index of no operator
+        results = batch.gen_results(
+            index.PrefixIndex(), [numbers[position] for position in unrouted]
+        )
+        for position, result in zip(unrouted, results):
+            lines[position] = json.dumps(result, sort_keys=True) + "\n"
+        for shard, positions in by_shard.iteritems():
+            answers = self._client(shard).receive_lines(len(positions))
+            for position, line in zip(positions, answers):
+                lines[position] = line
+        return lines
+
+    def lookup_many(self, numbers):
+        """Look up phone numbers
+
+        Arguments:
+            numbers {list} -- phone numbers, without whitespace
+
+        Returns:
+            list -- result dicts, one per phone number,
+                    same as batch.gen_results()
+        """
+        return [json.loads(line) for line in self.lookup_lines(numbers)]
+
+
+class RouterHandler(SocketServer.StreamRequestHandler):
+    """Answer the request lines of one client connection,
+    with its own connections to the shard servers
+    """
+
+    def handle(self):
+        router = Router(
+            self.server.addresses, self.server.partition,
+            self.server.shard_timeout
+        )
+        try:
+            for line in iter(self.rfile.readline, ""):
+                numbers = line.split()
+                if not numbers:
+                    continue
+                self.wfile.write("".join(router.lookup_lines(numbers)))
+        except IOError as error:
+            # the client sees its connection closed
+            LOGGER.error("Failed to reach a shard server: %s", str(error))
+        finally:
+            router.close()
+
+
+class RouterServer(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+    """Router server handling each client in a thread, the partition
+    of the prefixes is shared by all the clients
+
+    Arguments:
+        shards {list} -- list of (shard server address, prefix ranges)
+        address {str|tuple} -- path to a unix socket or (host, port)
+
+    Keyword Arguments:
+        timeout {float} -- seconds to wait for a shard server (default: {None})
+
+    Raises:
+        ValueError -- if the prefix ranges of the shards are invalid
+    """
+    daemon_threads = True
+
+    def __init__(self, shards, address, timeout=None):
+        # checked before binding
+        self.partition = Partition([ranges for _, ranges in shards])
+        self.addresses = [shard_address for shard_address, _ in shards]
+        # timeout is the one of the socketserver
+        self.shard_timeout = timeout
+        if isinstance(address, tuple):
+            self.allow_reuse_address = True
+        else:
+            # same as a SocketServer.UnixStreamServer
+            self.address_family = SocketServer.UnixStreamServer.address_family
+        SocketServer.TCPServer.__init__(self, address, RouterHandler)
+
+
+def make_router(shards, address, timeout=None):
+    """Create a router server, not yet serving
+
+    Arguments:
+        shards {list} -- list of (shard server address, prefix ranges)
+        address {str|tuple} -- path to a unix socket or (host, port)
+
+    Keyword Arguments:
+        timeout {float} -- seconds to wait for a shard server (default: {None})
+
+    Raises:
+        ValueError -- if the prefix ranges of the shards are invalid
+
+    Returns:
+        obj -- RouterServer
+    """
+    if not isinstance(address, tuple) and os.path.exists(address):
+        # left behind by a previous router
+        os.remove(address)
+    router = RouterServer(shards, address, timeout)
+    LOGGER.debug("Router bound to: %s", router.server_address)
+    return router
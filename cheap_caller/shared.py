@@ -0,0 +1,573 @@
+"""
+Rates of all the operators in one shared prefix structure
+
+The extensions of all the operators are grouped by length, each length
+a sorted column of the extensions as integers in the smallest unsigned
+type they fit in, e.g. 2 bytes for the 4 digit ones. An extension known
+to several operators is kept once, with a slot per operator holding its
+position and the id of its price in a column of the distinct prices.
+
+A lookup searches each length once for all the operators, from the
+longest extension down, instead of every operator for every length.
+The columns are written to and read from a file as they are in memory,
+next to the index file they were merged from, with the path, size and
+mtime of that file and of the delta files overlaid on it, so a stale one
+is merged again.
+"""
+
+import os
+import sys
+import json
+import array
+import heapq
+import bisect
+import struct
+import logging
+
+from cheap_caller import helpers
+from cheap_caller import rates
+from cheap_caller import stats
+from cheap_caller import store
+
+
+LOGGER = logging.getLogger(__name__)
+
+MAGIC = "CCSHARE\x01"
+SHARED_SUFFIX = ".shared"
+_LENGTH = struct.Struct("=Q")
+
+DIGITS = "0123456789"
+
+# unsigned array typecodes, smallest first
+_TYPECODES = ("B", "H", "I", rates.KEY_TYPECODE)
+
+
+def _typecode(largest):
+    """Smallest unsigned array typecode holding values up to largest
+
+    Arguments:
+        largest {int} -- largest value
+
+    Returns:
+        str -- array typecode
+    """
+    for typecode in _TYPECODES:
+        if largest < 1 << (8 * array.array(typecode).itemsize):
+            return typecode
+    raise ValueError("Too large for an array: {}".format(largest))
+
+
+def _narrowed(column, largest):
+    """Copy of an unsigned array in the smallest typecode holding it
+
+    Arguments:
+        column {obj} -- array
+        largest {int} -- its largest value
+
+    Returns:
+        obj -- array
+    """
+    typecode = _typecode(largest)
+    if typecode == column.typecode:
+        return column
+    return array.array(typecode, column)
+
+
+def _gen_level(columns, position, length):
+    """Yield the extensions of one length of one operator
+
+    Arguments:
+        columns {tuple} -- (keys array, prices array) of the operator
+        position {int} -- position of the operator
+        length {int} -- extension length
+
+    Yields:
+        tuple -- (extension as an integer, position, price in micro-units)
+    """
+    keys, prices = columns
+    # encoded extensions of a length are 10 ** length + the extension
+    base = 10 ** length
+    start = bisect.bisect_left(keys, base)
+    stop = bisect.bisect_left(keys, 2 * base)
+    for offset in xrange(start, stop):
+        yield keys[offset] - base, position, prices[offset]
+
+
+def _merge_level(columns, length, slots, ids):
+    """Merge the extensions of one length of all the operators
+
+    Arguments:
+        columns {list} -- (keys array, prices array) per operator
+        length {int} -- extension length
+        slots {tuple} -- (operator position array, price id array)
+                         the slots of the extensions are appended to
+        ids {dict} -- key = price in micro-units; value = its id,
+                      new prices are added
+
+    Returns:
+        tuple -- (sorted extensions, start of their slots, one more
+                 than extensions), None if no operator has any
+    """
+    slot_operators, price_ids = slots
+    values = array.array(rates.KEY_TYPECODE)
+    starts = array.array(rates.KEY_TYPECODE)
+    merged = heapq.merge(*[
+        _gen_level(operator_columns, position, length)
+        for position, operator_columns in enumerate(columns)
+    ])
+    for value, position, price in merged:
+        if not values or values[-1] != value:
+            values.append(value)
+            starts.append(len(slot_operators))
+        slot_operators.append(position)
+        price_ids.append(ids.setdefault(price, len(ids)))
+    if not values:
+        return None
+    starts.append(len(slot_operators))
+    return (
+        _narrowed(values, 10 ** length - 1),
+        _narrowed(starts, len(slot_operators)),
+    )
+
+
+def _prices_column(ids):
+    """Column of the distinct prices, in the order of their ids
+
+    Arguments:
+        ids {dict} -- key = price in micro-units; value = its id
+
+    Returns:
+        obj -- array of prices in micro-units
+    """
+    prices = array.array(rates.PRICE_TYPECODE, [0]) * len(ids)
+    for price, price_id in ids.iteritems():
+        prices[price_id] = price
+    return prices
+
+
+class SharedTable(object):
+    """Rates of one operator in a SharedIndex, usable as a RateTable
+    """
+
+    __slots__ = ("_shared", "_position")
+
+    def __init__(self, shared, position):
+        self._shared = shared
+        self._position = position
+
+    def __len__(self):
+        return len(self._shared.columns(self._position)[0])
+
+    def column_buffers(self):
+        """Buffers holding the key and price columns
+
+        Returns:
+            tuple -- (keys buffer, keys offset, prices buffer,
+                      prices offset, count)
+        """
+        keys, prices = self._shared.columns(self._position)
+        return keys, 0, prices, 0, len(keys)
+
+    def longest_match(self, phoneno):
+        """Get the cheapest line of the longest extension matching phoneno
+
+        Arguments:
+            phoneno {str} -- sanitized phone number
+
+        Returns:
+            list -- [extension, price] or None if nothing matches
+        """
+        return self._shared.longest_match(self._position, phoneno)
+
+
+class SharedIndex(object):
+    """Rates of all the operators with their extensions shared,
+    it answers lookups the same way a PrefixIndex does
+
+    Arguments:
+        names {list} -- operator names
+        levels {list} -- per extension length, None or (sorted
+                         extensions, start of their slots, one more
+                         than extensions)
+        slots {tuple} -- (array, position of the operator of each slot,
+                          array, id of the price of each slot)
+        prices {obj} -- array, distinct prices in micro-units
+    """
+
+    def __init__(self, names, levels, slots, prices):
+        self.names = names
+        self._levels = levels
+        self._operators, self._price_ids = slots
+        self._prices = prices
+
+    def __len__(self):
+        return len(self.names)
+
+    @classmethod
+    def from_tables(cls, operators):
+        """Merge the rate tables of operators
+
+        Arguments:
+            operators {list} -- list of (operator name, table), table
+                                being anything with column_buffers()
+
+        Returns:
+            obj -- SharedIndex
+        """
+        names = [name for name, _ in operators]
+        columns = [rates.table_columns(table) for _, table in operators]
+        slot_operators, price_ids = slots = array.array("I"), array.array("I")
+        ids = {}
+        levels = [None] + [
+            _merge_level(columns, length, slots, ids)
+            for length in xrange(1, rates.MAX_EXTENSION_LENGTH + 1)
+        ]
+        shared = cls(
+            names, levels,
+            (_narrowed(slot_operators, len(names)), _narrowed(price_ids, len(ids))),
+            _prices_column(ids)
+        )
+        LOGGER.debug(
+            "Shared %s extensions of %s operators in %s bytes",
+            len(slot_operators), len(names), shared.nbytes()
+        )
+        return shared
+
+    def _arrays(self):
+        """Name and array of each column
+
+        Returns:
+            list -- list of (name, array)
+        """
+        arrays = [
+            ("operators", self._operators),
+            ("price_ids", self._price_ids),
+            ("prices", self._prices),
+        ]
+        for length, level in enumerate(self._levels):
+            if level is not None:
+                arrays.append(("values{}".format(length), level[0]))
+                arrays.append(("starts{}".format(length), level[1]))
+        return arrays
+
+    def nbytes(self):
+        """Get the size of the columns
+
+        Returns:
+            int -- bytes held by the columns
+        """
+        return sum(
+            column.itemsize * len(column) for _, column in self._arrays()
+        )
+
+    def write(self, path, sources=None):
+        """Write the index to a file
+
+        The index is written to a temporary file first and renamed,
+        so readers never see a half written one
+
+        Arguments:
+            path {str} -- path to the file
+
+        Keyword Arguments:
+            sources {list} -- [path, size, mtime] of the files it was
+                              merged from (default: {None})
+        """
+        arrays = self._arrays()
+        header = json.dumps({
+            "byteorder": sys.byteorder,
+            "sources": sources,
+            "names": self.names,
+            "arrays": [
+                [name, column.typecode, column.itemsize, len(column)]
+                for name, column in arrays
+            ],
+        })
+        tmp_path = "{}.{}.tmp".format(path, os.getpid())
+        with open(tmp_path, "wb") as shared_file:
+            shared_file.write(MAGIC)
+            shared_file.write(_LENGTH.pack(len(header)))
+            shared_file.write(header)
+            for _, column in arrays:
+                column.tofile(shared_file)
+        os.rename(tmp_path, path)
+
+    @classmethod
+    def read(cls, path, sources=None):
+        """Read an index written by write()
+
+        Arguments:
+            path {str} -- path to the file
+
+        Keyword Arguments:
+            sources {list} -- [path, size, mtime] of the files it must
+                              have been merged from, None not to check
+                              (default: {None})
+
+        Raises:
+            ValueError -- if it is not such a file, is truncated, was
+                          written on another platform or from other files
+
+        Returns:
+            obj -- SharedIndex
+        """
+        with open(path, "rb") as shared_file:
+            if shared_file.read(len(MAGIC)) != MAGIC:
+                raise ValueError("{} is not a shared index file".format(path))
+            try:
+                header_size = _LENGTH.unpack(shared_file.read(_LENGTH.size))[0]
+                header = json.loads(shared_file.read(header_size))
+            except struct.error:
+                raise ValueError("{} is truncated".format(path))
+            if header["byteorder"] != sys.byteorder:
+                raise ValueError("{} has a different byte order".format(path))
+            if sources is not None and header["sources"] != sources:
+                raise ValueError("{} was merged from other files".format(path))
+            columns = {}
+            for name, typecode, itemsize, count in header["arrays"]:
+                column = array.array(str(typecode))
+                if column.itemsize != itemsize:
+                    raise ValueError(
+                        "{} has other array item sizes".format(path)
+                    )
+                try:
+                    column.fromfile(shared_file, count)
+                except EOFError:
+                    raise ValueError("{} is truncated".format(path))
+                columns[name] = column
+        levels = [None] * (rates.MAX_EXTENSION_LENGTH + 1)
+        for length in xrange(1, rates.MAX_EXTENSION_LENGTH + 1):
+            if "values{}".format(length) in columns:
+                levels[length] = (
+                    columns["values{}".format(length)],
+                    columns["starts{}".format(length)],
+                )
+        return cls(
+            header["names"], levels,
+            (columns["operators"], columns["price_ids"]), columns["prices"]
+        )
+
+    def columns(self, position):
+        """Copy the rates of one operator out into columns
+
+        Arguments:
+            position {int} -- position of the operator
+
+        Returns:
+            tuple -- (keys array, prices array), as in a RateTable
+        """
+        keys = array.array(rates.KEY_TYPECODE)
+        prices = array.array(rates.PRICE_TYPECODE)
+        for length, level in enumerate(self._levels):
+            if level is None:
+                continue
+            values, starts = level
+            base = 10 ** length
+            for offset, value in enumerate(values):
+                for slot in xrange(starts[offset], starts[offset + 1]):
+                    if self._operators[slot] == position:
+                        keys.append(base + value)
+                        prices.append(self._prices[self._price_ids[slot]])
+        return keys, prices
+
+    def merge_keys(self):
+        """Merge the extensions of all the operators into one table,
+        same as cache.merge_keys() without copying out each operator
+
+        Returns:
+            obj -- RateTable with all the keys and zero prices
+        """
+        keys = array.array(rates.KEY_TYPECODE)
+        # encoded keys of a length are all below those of a longer one
+        for length, level in enumerate(self._levels):
+            if level is not None:
+                base = 10 ** length
+                keys.extend(base + value for value in level[0])
+        prices = array.array(rates.PRICE_TYPECODE, [0]) * len(keys)
+        return rates.RateTable(keys, prices)
+
+    def _slots(self, phoneno):
+        """Find the slots of the extensions matching phoneno,
+        of the longest one per operator
+
+        Arguments:
+            phoneno {str} -- sanitized phone number
+
+        Returns:
+            dict -- key = operator position; value = (extension length, slot)
+        """
+        # only the leading digits can be part of an extension
+        longest = min(
+            len(phoneno) - len(phoneno.lstrip(DIGITS)),
+            rates.MAX_EXTENSION_LENGTH
+        )
+        operators = self._operators
+        found = {}
+        tried = 0
+        for length in xrange(longest, 0, -1):
+            level = self._levels[length]
+            if level is None:
+                continue
+            tried += 1
+            values, starts = level
+            value = int(phoneno[:length])
+            offset = bisect.bisect_left(values, value)
+            if offset == len(values) or values[offset] != value:
+                continue
+            for slot in xrange(starts[offset], starts[offset + 1]):
+                if operators[slot] not in found:
+                    found[operators[slot]] = (length, slot)
+            if len(found) == len(self.names):
+                break
+        stats.count("lookups")
+        stats.count("extensions_tried", tried)
+        return found
+
+    def _format(self, phoneno, match):
+        """Format a slot found by _slots() as [extension, price]"""
+        length, slot = match
+        return [
+            phoneno[:length],
+            rates.format_price(self._prices[self._price_ids[slot]])
+        ]
+
+    def gen_matches(self, phoneno):
+        """Yield the longest match of each operator matching phoneno,
+        same as index.gen_matches()
+
+        Arguments:
+            phoneno {str} -- sanitized phone number
+
+        Yields:
+            tuple -- (operator name, [extension, price])
+        """
+        found = self._slots(phoneno)
+        for position in sorted(found):
+            yield self.names[position], self._format(phoneno, found[position])
+
+    def longest_match(self, position, phoneno):
+        """Get the cheapest line of the longest extension of one
+        operator matching phoneno
+
+        Arguments:
+            position {int} -- position of the operator
+            phoneno {str} -- sanitized phone number
+
+        Returns:
+            list -- [extension, price] or None if nothing matches
+        """
+        longest = min(
+            len(phoneno) - len(phoneno.lstrip(DIGITS)),
+            rates.MAX_EXTENSION_LENGTH
+        )
+        for length in xrange(longest, 0, -1):
+            level = self._levels[length]
+            if level is None:
+                continue
+            values, starts = level
+            value = int(phoneno[:length])
+            offset = bisect.bisect_left(values, value)
+            if offset == len(values) or values[offset] != value:
+                continue
+            for slot in xrange(starts[offset], starts[offset + 1]):
+                if self._operators[slot] == position:
+                    return self._format(phoneno, (length, slot))
+        return None
+
+    def lookup(self, phoneno):
+        """Get cheapest call rate per operator for a given phoneno
+
+        Arguments:
+            phoneno {str} -- sanitized phone number
+
+        Returns:
+            dict -- same as PrefixIndex.lookup()
+        """
+        return dict(self.gen_matches(phoneno))
+
+    def lookup_many(self, phonenos):
+        """Get cheapest call rate per operator for many phone numbers
+
+        Arguments:
+            phonenos {list} -- sanitized phone numbers
+
+        Returns:
+            list -- one dict per phone number, same as lookup()
+        """
+        return [self.lookup(phoneno) for phoneno in phonenos]
+
+    def lookup_top(self, phoneno, top):
+        """Get the top cheapest operators for a given phoneno
+
+        Arguments:
+            phoneno {str} -- sanitized phone number
+            top {int} -- number of operators to keep
+
+        Returns:
+            list -- same as PrefixIndex.lookup_top()
+        """
+        return helpers.get_top(self.gen_matches(phoneno), top)
+
+    def lookup_top_many(self, phonenos, top):
+        """Get the top cheapest operators for many phone numbers
+
+        Arguments:
+            phonenos {list} -- sanitized phone numbers
+            top {int} -- number of operators to keep
+
+        Returns:
+            list -- one list per phone number, same as lookup_top()
+        """
+        return [self.lookup_top(phoneno, top) for phoneno in phonenos]
+
+    def tables(self):
+        """Get a table per operator, in the order they were merged
+
+        Returns:
+            list -- list of (operator name, SharedTable)
+        """
+        return [
+            (name, SharedTable(self, position))
+            for position, name in enumerate(self.names)
+        ]
+
+
+def _gen_sources(stored_index):
+    """Stat the index file and the delta files overlaid on it
+
+    Arguments:
+        stored_index {obj} -- StoredIndex
+
+    Returns:
+        obj -- generator of [path, size, mtime], same as store.gen_sources()
+    """
+    delta_paths = sorted(
+        path
+        for paths in stored_index.delta_paths.itervalues()
+        for path in paths
+    )
+    return store.gen_sources([stored_index.path] + delta_paths)
+
+
+def open_shared(stored_index):
+    """Read the SharedIndex of a StoredIndex from the file next to its
+    index file, merging and writing it first if missing or stale
+
+    Arguments:
+        stored_index {obj} -- StoredIndex, with its deltas overlaid
+
+    Returns:
+        obj -- SharedIndex
+    """
+    shared_path = stored_index.path + SHARED_SUFFIX
+    sources = list(_gen_sources(stored_index))
+    if os.path.exists(shared_path):
+        try:
+            return SharedIndex.read(shared_path, sources)
+        except ValueError as error:
+            LOGGER.info(
+                "Merging shared index again: %s, %s", shared_path, str(error)
+            )
+    shared_index = SharedIndex.from_tables(stored_index.tables())
+    shared_index.write(shared_path, sources)
+    return shared_index
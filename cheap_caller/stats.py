@@ -0,0 +1,142 @@
+"""
+Per stage timers and counters of the lookup pipeline
+
+Disabled by default, enabled with the --profile option or the
+CHEAP_CALLER_PROFILE environment variable. When disabled timer() does
+not read the clock and count() returns right away, the hot loops keep
+their counts in local variables and call count() once at the end.
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+import contextlib
+
+
+LOGGER = logging.getLogger(__name__)
+
+ENV_VAR = "CHEAP_CALLER_PROFILE"
+
+ENABLED = bool(os.environ.get(ENV_VAR))
+
+_LOCK = threading.Lock()
+_COUNTERS = {}
+_TIMERS = {}
+
+
+def enable(enabled=True):
+    """Turn the instrumentation on or off, the recorded stats are kept
+
+    Keyword Arguments:
+        enabled {bool} -- True to record stats (default: {True})
+    """
+    global ENABLED  # pylint: disable=global-statement
+    ENABLED = enabled
+
+
+def reset():
+    """Forget all the recorded stats
+    """
+    with _LOCK:
+        _COUNTERS.clear()
+        _TIMERS.clear()
+
+
+def count(name, value=1):
+    """Add to a counter, no-op if disabled
+
+    Arguments:
+        name {str} -- counter name, e.g. "lines_read"
+
+    Keyword Arguments:
+        value {int} -- amount to add (default: {1})
+    """
+    if not ENABLED:
+        return
+    with _LOCK:
+        _COUNTERS[name] = _COUNTERS.get(name, 0) + value
+
+
+@contextlib.contextmanager
+def timer(stage):
+    """Context manager adding the wall time spent in the block to a stage,
+    no-op if disabled
+
+    Arguments:
+        stage {str} -- stage name, e.g. "find"
+    """
+    if not ENABLED:
+        yield
+        return
+    start = time.time()
+    try:
+        yield
+    finally:
+        elapsed = time.time() - start
+        with _LOCK:
+            seconds, calls = _TIMERS.get(stage, (0.0, 0))
+            _TIMERS[stage] = (seconds + elapsed, calls + 1)
+
+
+def call_recorded(function, item):
+    """Apply function to an item, recording the stats of this call only,
+    in a worker process, to be merged into the ones of the parent
+
+    Arguments:
+        function {obj} -- picklable function taking one argument
+        item {obj} -- its argument
+
+    Returns:
+        tuple -- (result, stats recorded as returned by summary())
+    """
+    # a forked worker starts with a copy of the stats of its parent
+    reset()
+    result = function(item)
+    return result, summary()
+
+
+def merge(recorded):
+    """Add stats recorded elsewhere, e.g. in a worker process
+
+    Arguments:
+        recorded {dict} -- stats as returned by summary()
+    """
+    if not ENABLED:
+        return
+    with _LOCK:
+        for name, value in recorded["counters"].iteritems():
+            _COUNTERS[name] = _COUNTERS.get(name, 0) + value
+        for stage, stage_stats in recorded["stages"].iteritems():
+            seconds, calls = _TIMERS.get(stage, (0.0, 0))
+            _TIMERS[stage] = (
+                seconds + stage_stats["seconds"], calls + stage_stats["calls"]
+            )
+
+
+def summary():
+    """Get the recorded stats
+
+    Returns:
+        dict -- {"stages": {stage: {"seconds": float, "calls": int}},
+                 "counters": {name: int}}
+    """
+    with _LOCK:
+        return {
+            "stages": dict(
+                (stage, {"seconds": seconds, "calls": calls})
+                for stage, (seconds, calls) in _TIMERS.iteritems()
+            ),
+            "counters": dict(_COUNTERS),
+        }
+
+
+def write_summary(out):
+    """Write the recorded stats as a json line
+
+    Arguments:
+        out {obj} -- an open fileobj to write to
+    """
+    out.write(json.dumps(summary(), sort_keys=True))
+    out.write("\n")
@@ -0,0 +1,688 @@
+"""
+Persistent precompiled index of the operator data
+
+The index file is laid out as:
+    magic {8 bytes}
+    header length {uint64}
+    header {json, padded with spaces to a multiple of 8 bytes}
+    per operator: sorted keys {uint64 * count} then prices {int64 * count}
+
+The header records the name, count, offset and source path of each
+operator and the path, size and mtime of each source operator file,
+so a stale index can be detected before it is used. Delta files are not
+compiled in, open_index() overlays them on the tables.
+Keys are extensions encoded by rates.encode_extension() and prices are
+in micro-units, both in native byte order.
+
+With a memory budget the index is built out of core: each operator file
+is parsed into sorted runs of at most the records fitting in the budget,
+spilled to temporary files in the directory of the index, then the runs
+are merged keeping the cheapest price per key.
+"""
+
+import os
+import sys
+import json
+import mmap
+import heapq
+import array
+import shutil
+import struct
+import logging
+import tempfile
+import itertools
+
+from cheap_caller import delta
+from cheap_caller import helpers
+from cheap_caller import index
+from cheap_caller import ingest
+from cheap_caller import rates
+from cheap_caller import stats
+
+
+LOGGER = logging.getLogger(__name__)
+
+MAGIC = "CCINDEX\x03"
+DEFAULT_INDEX_NAME = ".cheap_caller.index"
+_LENGTH = struct.Struct("=Q")
+_KEY = struct.Struct("=Q")
+_PRICE = struct.Struct("=q")
+
+# bytes held per record while a run is built, the record tuple and its
+# ints in a list then in the dict keeping the cheapest price per key,
+# rounded up for the allocator overhead
+RECORD_BYTES = 512
+
+# records written at once by a merge, and read back at most at once from
+# each run, all the runs together are read back within the memory budget
+MERGE_CHUNK = 1 << 14
+
+# runs merged at once, each is open twice, so merges stay well within
+# the open file limit, more runs are merged in several passes
+MERGE_FAN_IN = 64
+
+
+class StaleIndexError(Exception):
+    """Raised when an index file does not match its source operator files
+    """
+
+
+def default_index_path(operatordir):
+    """Path of the index file when none is given
+
+    Arguments:
+        operatordir {str} -- directory holding the operator files
+
+    Returns:
+        str -- path to the index file
+    """
+    return os.path.join(operatordir, DEFAULT_INDEX_NAME)
+
+
+def gen_sources(file_paths):
+    """Stat each file in the input sequence and yield [path, size, mtime]
+
+    Arguments:
+        file_paths {obj} -- a sequence of full file paths
+    """
+    for file_path in file_paths:
+        stat = os.stat(file_path)
+        yield [os.path.abspath(file_path), stat.st_size, stat.st_mtime]
+
+
+def _compile_file(file_path):
+    """Parse an operator file into sorted keys and prices,
+    may run in a worker process
+
+    Arguments:
+        file_path {str} -- full path of the operator file
+
+    Returns:
+        tuple -- (operator name, keys array, prices array, path),
+                 None if it can not be opened
+    """
+    for adict in helpers.open_files([file_path]):
+        table = ingest.build_table(adict["name"], adict["source"])
+        return adict["name"], table.keys, table.prices, file_path
+    return None
+
+
+def write_index(index_path, file_paths, sections):
+    """Write an index file
+
+    The index is written to a temporary file first and renamed,
+    so readers never see a half written index
+
+    Arguments:
+        index_path {str} -- path to the index file
+        file_paths {list} -- full paths of the source operator files
+        sections {list} -- per operator (name, count, write, path), write
+                           being a function writing the sorted keys then
+                           the prices to the open index file, path the
+                           one of its operator file
+    """
+    header = {
+        "byteorder": sys.byteorder,
+        "sources": list(gen_sources(file_paths)),
+        "operators": [
+            {"name": name, "count": count, "path": os.path.abspath(path)}
+            for name, count, _, path in sections
+        ],
+    }
+    # offsets depend on the header size and the header holds the offsets
+    # so grow the header size until the encoded header fits in it
+    header_size = 0
+    encoded_header = json.dumps(header)
+    while len(encoded_header) > header_size:
+        header_size = _padded(len(encoded_header))
+        offset = len(MAGIC) + _LENGTH.size + header_size
+        for operator in header["operators"]:
+            operator["offset"] = offset
+            offset += operator["count"] * (_KEY.size + _PRICE.size)
+        encoded_header = json.dumps(header)
+    encoded_header = encoded_header.ljust(header_size)
+    tmp_path = "{}.{}.tmp".format(index_path, os.getpid())
+    with open(tmp_path, "wb") as index_file:
+        index_file.write(MAGIC)
+        index_file.write(_LENGTH.pack(header_size))
+        index_file.write(encoded_header)
+        for _, _, write, _ in sections:
+            write(index_file)
+    os.rename(tmp_path, index_path)
+    LOGGER.debug(
+        "Compiled index: %s of %s operators",
+        index_path, len(sections)
+    )
+
+
+def _write_columns(keys, prices):
+    """Function writing key and price arrays to an open file
+    """
+    def write(index_file):
+        """Write the keys then the prices"""
+        keys.tofile(index_file)
+        prices.tofile(index_file)
+    return write
+
+
+def _spill_run(table, run_dir):
+    """Write the sorted keys then the prices of a table to a run file
+
+    Arguments:
+        table {obj} -- RateTable
+        run_dir {str} -- directory of the run files
+
+    Returns:
+        tuple -- (run file path, number of records)
+    """
+    run_fd, run_path = tempfile.mkstemp(suffix=".run", dir=run_dir)
+    with os.fdopen(run_fd, "wb") as run_file:
+        table.keys.tofile(run_file)
+        table.prices.tofile(run_file)
+    stats.count("runs_spilled")
+    return run_path, len(table)
+
+
+def _gen_run(run_path, count, chunk_size):
+    """Read back a run file written by _spill_run()
+
+    Arguments:
+        run_path {str} -- run file path
+        count {int} -- number of records
+        chunk_size {int} -- records read at once
+
+    Yields:
+        tuple -- (key, price in micro-units) in key order
+    """
+    with open(run_path, "rb") as keys_file, open(run_path, "rb") as prices_file:
+        prices_file.seek(count * _KEY.size)
+        while count:
+            size = min(count, chunk_size)
+            keys = array.array(rates.KEY_TYPECODE)
+            keys.fromfile(keys_file, size)
+            prices = array.array(rates.PRICE_TYPECODE)
+            prices.fromfile(prices_file, size)
+            count -= size
+            for record in itertools.izip(keys, prices):
+                yield record
+
+
+def _write_merged(merged, keys_file, prices_file):
+    """Write merged records, the cheapest price per key,
+    the keys and the prices to separate files
+
+    Arguments:
+        merged {obj} -- (key, price in micro-units) in key order,
+                        the records of a key cheapest first
+        keys_file {obj} -- an open file to write the keys to
+        prices_file {obj} -- an open file to write the prices to
+
+    Returns:
+        int -- number of records written
+    """
+    count = 0
+    keys = array.array(rates.KEY_TYPECODE)
+    prices = array.array(rates.PRICE_TYPECODE)
+    for key, group in itertools.groupby(merged, lambda record: record[0]):
+        keys.append(key)
+        prices.append(next(group)[1])
+        if len(keys) >= MERGE_CHUNK:
+            count += len(keys)
+            keys.tofile(keys_file)
+            prices.tofile(prices_file)
+            del keys[:], prices[:]
+    count += len(keys)
+    keys.tofile(keys_file)
+    prices.tofile(prices_file)
+    return count
+
+
+def _merge_group(runs, run_dir, max_records):
+    """Merge sorted runs, keeping the cheapest price per key,
+    the run files are removed
+
+    Arguments:
+        runs {list} -- list of (run file path, number of records),
+                       at most MERGE_FAN_IN
+        run_dir {str} -- directory of the run files
+        max_records {int} -- maximum number of records held in memory
+
+    Returns:
+        tuple -- (keys file path, prices file path, number of records)
+    """
+    keys_fd, keys_path = tempfile.mkstemp(suffix=".keys", dir=run_dir)
+    prices_fd, prices_path = tempfile.mkstemp(suffix=".prices", dir=run_dir)
+    chunk_size = min(max(max_records // len(runs), 1), MERGE_CHUNK)
+    with os.fdopen(keys_fd, "wb") as keys_file, \
+            os.fdopen(prices_fd, "wb") as prices_file:
+        count = _write_merged(
+            heapq.merge(*[
+                _gen_run(run_path, run_count, chunk_size)
+                for run_path, run_count in runs
+            ]),
+            keys_file,
+            prices_file
+        )
+    for run_path, _ in runs:
+        os.remove(run_path)
+    stats.count("runs_merged", len(runs))
+    return keys_path, prices_path, count
+
+
+def _merge_pass(runs, run_dir, max_records):
+    """Merge sorted runs MERGE_FAN_IN at a time into fewer runs
+
+    Arguments:
+        runs {list} -- list of (run file path, number of records)
+        run_dir {str} -- directory of the run files
+        max_records {int} -- maximum number of records held in memory
+
+    Returns:
+        list -- list of (run file path, number of records)
+    """
+    merged_runs = []
+    for group in helpers.gen_chunks(runs, MERGE_FAN_IN):
+        if len(group) == 1:
+            merged_runs.extend(group)
+            continue
+        keys_path, prices_path, count = _merge_group(group, run_dir, max_records)
+        # a run holds the keys then the prices
+        with open(keys_path, "ab") as keys_file, open(prices_path, "rb") as prices_file:
+            shutil.copyfileobj(prices_file, keys_file)
+        os.remove(prices_path)
+        merged_runs.append((keys_path, count))
+    return merged_runs
+
+
+def _merge_runs(runs, run_dir, max_records):
+    """Merge sorted runs into one run, keeping the cheapest price per key,
+    in passes of at most MERGE_FAN_IN runs, the run files are removed
+
+    Arguments:
+        runs {list} -- list of (run file path, number of records)
+        run_dir {str} -- directory of the run files
+        max_records {int} -- maximum number of records held in memory
+
+    Returns:
+        tuple -- (keys file path, prices file path, number of records)
+    """
+    while len(runs) > MERGE_FAN_IN:
+        runs = _merge_pass(runs, run_dir, max_records)
+    return _merge_group(runs, run_dir, max_records)
+
+
+def _compile_file_out_of_core(args):
+    """Parse an operator file into sorted keys and prices on disk,
+    within a memory budget, may run in a worker process
+
+    Arguments:
+        args {tuple} -- (full path of the operator file,
+                         directory of the run files,
+                         maximum number of records held in memory)
+
+    Returns:
+        tuple -- (operator name, number of records, paths of the files
+                 holding the keys then the prices, path), None if it can
+                 not be opened
+    """
+    file_path, run_dir, max_records = args
+    for adict in helpers.open_files([file_path]):
+        # the chunks of text read at once count in the budget too, their
+        # matches take tens of times the bytes of the text
+        records = ingest.gen_records(
+            adict["name"], adict["source"],
+            chunk_size=min(max_records * RECORD_BYTES // 128, ingest.CHUNK_SIZE)
+        )
+        runs = [
+            _spill_run(rates.RateTable.from_records(chunk), run_dir)
+            for chunk in helpers.gen_chunks(records, max_records)
+        ]
+        if not runs:
+            return adict["name"], 0, [], file_path
+        if len(runs) == 1:
+            # a single run already holds the keys then the prices
+            run_path, count = runs[0]
+            return adict["name"], count, [run_path], file_path
+        keys_path, prices_path, count = _merge_runs(runs, run_dir, max_records)
+        return adict["name"], count, [keys_path, prices_path], file_path
+    return None
+
+
+def _copy_files(paths):
+    """Function copying files to an open file one after the other
+    """
+    def write(index_file):
+        """Copy the files"""
+        for path in paths:
+            with open(path, "rb") as source:
+                shutil.copyfileobj(source, index_file)
+    return write
+
+
+def compile_index(index_path, file_paths, workers=1, memory_budget=None):
+    """Parse the operator files and write an index file
+
+    Without a memory budget all the operator data is held in memory,
+    otherwise at most the records fitting in the budget are, split between
+    the workers, and the rest is spilled to temporary files in the
+    directory of the index
+
+    Arguments:
+        index_path {str} -- path to the index file
+        file_paths {list} -- full paths of the operator files
+
+    Keyword Arguments:
+        workers {int} -- number of worker processes parsing files (default: {1})
+        memory_budget {int} -- bytes of records held in memory,
+                               None for no limit (default: {None})
+    """
+    file_paths = list(file_paths)
+    if memory_budget is None:
+        sections = []
+        for result in helpers.map_in_pool(_compile_file, file_paths, workers):
+            if result is None:
+                continue
+            name, keys, prices, path = result
+            sections.append(
+                (name, len(keys), _write_columns(keys, prices), path)
+            )
+        write_index(index_path, file_paths, sections)
+        return
+    max_records = max(memory_budget // (RECORD_BYTES * max(workers, 1)), 1)
+    run_dir = tempfile.mkdtemp(
+        prefix=".cheap_caller.", dir=os.path.dirname(os.path.abspath(index_path))
+    )
+    try:
+        sections = [
+            (name, count, _copy_files(paths), path)
+            for name, count, paths, path in (
+                result for result in helpers.map_in_pool(
+                    _compile_file_out_of_core,
+                    [(file_path, run_dir, max_records) for file_path in file_paths],
+                    workers
+                )
+                if result is not None
+            )
+        ]
+        write_index(index_path, file_paths, sections)
+    finally:
+        shutil.rmtree(run_dir, ignore_errors=True)
+
+
+def _padded(size):
+    """Round size up to a multiple of 8
+
+    Arguments:
+        size {int} -- size in bytes
+
+    Returns:
+        int -- padded size
+    """
+    return (size + 7) // 8 * 8
+
+
+class MappedTable(object):
+    """Sorted keys and prices of one operator in a memory mapped index
+    """
+
+    __slots__ = ("_mapped", "_keys_offset", "_prices_offset", "count")
+
+    def __init__(self, mapped, offset, count):
+        self._mapped = mapped
+        self._keys_offset = offset
+        self._prices_offset = offset + count * _KEY.size
+        self.count = count
+
+    def column_buffers(self):
+        """Buffers holding the key and price columns
+
+        Returns:
+            tuple -- (keys buffer, keys offset, prices buffer,
+                      prices offset, count)
+        """
+        return (
+            self._mapped, self._keys_offset,
+            self._mapped, self._prices_offset,
+            self.count
+        )
+
+    def _find(self, key):
+        """Binary search for an encoded extension
+
+        Arguments:
+            key {int} -- encoded extension
+
+        Returns:
+            int -- position of the key, -1 if not found
+        """
+        unpack_from = _KEY.unpack_from
+        mapped = self._mapped
+        base = self._keys_offset
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            value = unpack_from(mapped, base + middle * 8)[0]
+            if value < key:
+                low = middle + 1
+            elif value > key:
+                high = middle
+            else:
+                return middle
+        return -1
+
+    def longest_match(self, phoneno):
+        """Get the cheapest line of the longest extension matching phoneno
+
+        Arguments:
+            phoneno {str} -- sanitized phone number
+
+        Returns:
+            list -- [extension, price] or None if nothing matches
+        """
+        for length in xrange(min(len(phoneno), rates.MAX_EXTENSION_LENGTH), 0, -1):
+            extension = phoneno[:length]
+            key = rates.encode_extension(extension)
+            if key is None:
+                continue
+            position = self._find(key)
+            if position >= 0:
+                price = _PRICE.unpack_from(
+                    self._mapped, self._prices_offset + position * 8
+                )[0]
+                return [extension, rates.format_price(price)]
+        return None
+
+
+class StoredIndex(object):
+    """Read only index backed by a memory mapped index file,
+    it answers lookups the same way a PrefixIndex does
+    """
+
+    def __init__(self, index_path):
+        self.path = index_path
+        # operator file path: delta file paths, of the overlaid deltas
+        self.delta_paths = {}
+        try:
+            with open(index_path, "rb") as index_file:
+                self._mapped = mmap.mmap(
+                    index_file.fileno(), 0, access=mmap.ACCESS_READ
+                )
+        except (IOError, ValueError) as error:
+            # an empty file can not be mapped
+            raise StaleIndexError(
+                "{} can not be mapped, {}".format(index_path, str(error))
+            )
+        try:
+            self.header = self._read_header()
+        except (ValueError, KeyError, struct.error) as error:
+            self._mapped.close()
+            raise StaleIndexError(
+                "{} is not a complete index file, {}".format(index_path, str(error))
+            )
+        self._operators = [
+            (
+                operator["name"],
+                MappedTable(self._mapped, operator["offset"], operator["count"])
+            )
+            for operator in self.header["operators"]
+        ]
+
+    def _read_header(self):
+        """Read the header of the mapped index file, checking the
+        tables it records lie within the file
+
+        Raises:
+            ValueError -- if the file is not an index file or is truncated
+
+        Returns:
+            dict -- header
+        """
+        if self._mapped[:len(MAGIC)] != MAGIC:
+            raise ValueError("no index file magic")
+        start = len(MAGIC) + _LENGTH.size
+        header_size = _LENGTH.unpack_from(self._mapped, len(MAGIC))[0]
+        header = json.loads(self._mapped[start:start + header_size])
+        for operator in header["operators"]:
+            end = operator["offset"] + operator["count"] * (_KEY.size + _PRICE.size)
+            if end > len(self._mapped):
+                raise ValueError("truncated table of {}".format(operator["name"]))
+        return header
+
+    def __len__(self):
+        return len(self._operators)
+
+    def close(self):
+        """Unmap the index file
+        """
+        self._mapped.close()
+
+    def apply_deltas(self, delta_paths=None):
+        """Overlay the current delta files of the operator files on the
+        tables, replacing the ones overlaid before, the index file
+        itself is not changed
+
+        Keyword Arguments:
+            delta_paths {dict} -- returned by delta.find_deltas() if
+                                  already found, None to find them
+                                  (default: {None})
+        """
+        paths = [operator["path"] for operator in self.header["operators"]]
+        if delta_paths is None:
+            delta_paths = delta.find_deltas(paths)
+        self.delta_paths = delta_paths
+        # single assignment, lookups see either the old or the new tables
+        self._operators = [
+            (
+                name,
+                delta.apply_patch(table, delta.read_patch(
+                    path, delta_paths=delta_paths.get(path, [])
+                ))
+            )
+            for (name, table), path in zip(self._operators, paths)
+        ]
+
+    def check(self, file_paths):
+        """Check the index against the current operator files
+
+        Arguments:
+            file_paths {list} -- full paths of the operator files
+
+        Raises:
+            StaleIndexError -- if any file was added, removed or changed
+        """
+        if self.header.get("byteorder") != sys.byteorder:
+            raise StaleIndexError("Index has a different byte order")
+        if list(gen_sources(file_paths)) != self.header.get("sources"):
+            raise StaleIndexError("Operator files changed since indexed")
+
+    def lookup(self, phoneno):
+        """Get cheapest call rate per operator for a given phoneno
+
+        Arguments:
+            phoneno {str} -- sanitized phone number
+
+        Returns:
+            dict -- same as get_cheapest_per_operator()
+                    key = operator name; value = [extension, price]
+        """
+        return index.lookup_tables(self._operators, phoneno)
+
+    def tables(self):
+        """Get the memory mapped tables in the order they were indexed
+
+        Returns:
+            list -- list of (operator name, MappedTable or PatchedTable)
+        """
+        return list(self._operators)
+
+    def lookup_many(self, phonenos):
+        """Get cheapest call rate per operator for many phone numbers
+
+        Arguments:
+            phonenos {list} -- sanitized phone numbers
+
+        Returns:
+            list -- one dict per phone number, same as lookup()
+        """
+        return index.lookup_tables_many(self._operators, phonenos)
+
+    def lookup_top(self, phoneno, top):
+        """Get the top cheapest operators for a given phoneno
+
+        Arguments:
+            phoneno {str} -- sanitized phone number
+            top {int} -- number of operators to keep
+
+        Returns:
+            list -- same as get_top()
+        """
+        return index.lookup_tables_top(self._operators, phoneno, top)
+
+    def lookup_top_many(self, phonenos, top):
+        """Get the top cheapest operators for many phone numbers
+
+        Arguments:
+            phonenos {list} -- sanitized phone numbers
+            top {int} -- number of operators to keep
+
+        Returns:
+            list -- one list per phone number, same as lookup_top()
+        """
+        return index.lookup_tables_top_many(self._operators, phonenos, top)
+
+
+def open_index(index_path, file_paths, workers=1, memory_budget=None):
+    """Open an index file, compiling it first if missing or stale,
+    with the delta files of the operator files overlaid
+
+    Arguments:
+        index_path {str} -- path to the index file
+        file_paths {list} -- full paths of the operator files
+
+    Keyword Arguments:
+        workers {int} -- number of worker processes parsing files (default: {1})
+        memory_budget {int} -- bytes of records held in memory while
+                               compiling, None for no limit (default: {None})
+
+    Returns:
+        obj -- StoredIndex
+    """
+    file_paths = list(file_paths)
+    if os.path.exists(index_path):
+        stored_index = None
+        try:
+            stored_index = StoredIndex(index_path)
+            stored_index.check(file_paths)
+            stored_index.apply_deltas()
+            return stored_index
+        except StaleIndexError as error:
+            if stored_index is not None:
+                stored_index.close()
+            LOGGER.info(
+                "Rebuilding index: %s, %s",
+                index_path, str(error)
+            )
+    compile_index(index_path, file_paths, workers, memory_budget)
+    stored_index = StoredIndex(index_path)
+    stored_index.apply_deltas()
+    return stored_index
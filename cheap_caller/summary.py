@@ -0,0 +1,181 @@
+"""
+Per operator file summaries, written next to each file
+
+A summary holds, per leading digit of the extensions, the number of
+lines, the smallest and largest extension and the byte range spanning
+all the lines with that leading digit. A lookup only needs the lines
+starting with the first digit of the phone number, so it reads that
+range and nothing at all from the files without such lines.
+
+A summary records size and mtime of its operator file and is ignored
+once the file changed, until it is written again. Compressed operator
+files are not summarized, they can not be read from the middle.
+"""
+
+import os
+import json
+import logging
+
+from cheap_caller import helpers
+from cheap_caller import stats
+
+
+LOGGER = logging.getLogger(__name__)
+
+SUFFIX = ".summary"
+
+VERSION = 1
+
+
+def summary_path(file_path):
+    """Get the path of the summary of an operator file
+
+    Arguments:
+        file_path {str} -- full path of the operator file
+
+    Returns:
+        str -- path to the summary
+    """
+    return file_path + SUFFIX
+
+
+def summarize(file_path):
+    """Read an operator file and summarize it
+
+    Arguments:
+        file_path {str} -- full path of the operator file
+
+    Returns:
+        dict -- {"version", "size", "mtime", "rows",
+                 "digits": {digit: {"rows", "min", "max", "start", "end"}}}
+    """
+    stat = os.stat(file_path)
+    digits = {}
+    rows = 0
+    offset = 0
+    with open(file_path, "rb") as source:
+        for line in source:
+            rows += 1
+            # the extension as gen_lines() reads it
+            extension = helpers.remove_leading_plus_and_zeros(
+                line.strip().split(",", 1)[0]
+            )
+            digit = extension[:1]
+            if digit.isdigit():
+                region = digits.get(digit)
+                if region is None:
+                    region = digits[digit] = {
+                        "rows": 0, "min": extension, "max": extension,
+                        "start": offset,
+                    }
+                region["rows"] += 1
+                region["min"] = min(region["min"], extension)
+                region["max"] = max(region["max"], extension)
+                region["end"] = offset + len(line)
+            offset += len(line)
+    return {
+        "version": VERSION,
+        "size": stat.st_size,
+        "mtime": stat.st_mtime,
+        "rows": rows,
+        "digits": digits,
+    }
+
+
+def write_summary(file_path):
+    """Summarize an operator file and write the summary next to it
+
+    Arguments:
+        file_path {str} -- full path of the operator file
+
+    Returns:
+        dict -- summary written, see summarize()
+    """
+    summary = summarize(file_path)
+    tmp_path = summary_path(file_path) + ".tmp"
+    with open(tmp_path, "w") as summary_file:
+        json.dump(summary, summary_file, sort_keys=True)
+    os.rename(tmp_path, summary_path(file_path))
+    return summary
+
+
+def read_summary(file_path):
+    """Read the summary of an operator file
+
+    Arguments:
+        file_path {str} -- full path of the operator file
+
+    Returns:
+        dict -- summary, see summarize(), None if missing,
+                unreadable or the operator file changed since
+    """
+    try:
+        with open(summary_path(file_path)) as summary_file:
+            summary = json.load(summary_file)
+        stat = os.stat(file_path)
+    except (IOError, OSError, ValueError) as error:
+        LOGGER.debug("No summary for: %s, %s", file_path, str(error))
+        return None
+    if (summary.get("version"), summary.get("size"), summary.get("mtime")) != (
+            VERSION, stat.st_size, stat.st_mtime):
+        LOGGER.debug("Ignoring stale summary of: %s", file_path)
+        return None
+    return summary
+
+
+def get_region(file_path, digit):
+    """Get the byte range holding all the lines whose extension
+    starts with a digit, from the summary of an operator file
+
+    Arguments:
+        file_path {str} -- full path of the operator file
+        digit {str} -- leading digit
+
+    Returns:
+        tuple -- (start, end), empty if no line starts with digit,
+                 None if there is no valid summary
+    """
+    if helpers.is_compressed(file_path):
+        return None
+    summary = read_summary(file_path)
+    if summary is None:
+        return None
+    region = summary["digits"].get(digit)
+    if region is None:
+        stats.count("files_skipped")
+        start, end = 0, 0
+    else:
+        start, end = region["start"], region["end"]
+    stats.count("bytes_skipped", summary["size"] - (end - start))
+    return start, end
+
+
+class Region(object):
+    """Read only part of an open fileobj, from start up to end
+    """
+
+    def __init__(self, source, start, end):
+        source.seek(start)
+        self._source = source
+        self._remaining = end - start
+
+    def read(self, size=-1):
+        """Read up to size bytes, all the rest of the region if negative
+        """
+        if size < 0 or size > self._remaining:
+            size = self._remaining
+        data = self._source.read(size)
+        self._remaining -= len(data)
+        return data
+
+    def readline(self):
+        """Read a line, the region ends at the end of a line
+        """
+        if self._remaining <= 0:
+            return ""
+        line = self._source.readline(self._remaining)
+        self._remaining -= len(line)
+        return line
+
+    def __iter__(self):
+        return iter(self.readline, "")
@@ -0,0 +1,282 @@
+"""
+NumPy backed bulk lookup, resolves the longest prefix matches of
+a whole batch of phone numbers per operator with vectorized searchsorted
+over the sorted key columns, one pass per prefix length
+
+NumPy is optional, available() tells if this engine can be used. It is
+imported then, on first use, importing it takes longer than a single
+lookup, so the command line only pays for it when a batch is large enough.
+"""
+
+import heapq
+import logging
+
+from cheap_caller import rates
+
+
+LOGGER = logging.getLogger(__name__)
+
+# below this many phone numbers the per number lookup is as fast
+MIN_BATCH_SIZE = 256
+
+_NOT_IMPORTED = object()
+
+# the numpy module once available() imported it, None if not installed
+numpy = _NOT_IMPORTED  # pylint: disable=invalid-name
+
+
+def available():
+    """Check if NumPy is installed, importing it on the first call
+
+    Returns:
+        bool -- True if this engine can be used
+    """
+    global numpy  # pylint: disable=global-statement,invalid-name
+    if numpy is _NOT_IMPORTED:
+        try:
+            import numpy as imported  # pylint: disable=redefined-outer-name
+        except ImportError:  # pragma: no cover
+            imported = None
+        numpy = imported
+    return numpy is not None
+
+
+def _columns(table):
+    """NumPy views of the key and price columns of a table, no copy
+
+    Arguments:
+        table {obj} -- RateTable or MappedTable
+
+    Returns:
+        tuple -- (keys uint64 array, prices int64 array)
+    """
+    keys, keys_offset, prices, prices_offset, count = table.column_buffers()
+    return (
+        numpy.frombuffer(keys, numpy.uint64, count, keys_offset),
+        numpy.frombuffer(prices, numpy.int64, count, prices_offset),
+    )
+
+
+def _parse_numbers(phonenos):
+    """Convert phone numbers to integers, vectorized
+
+    Arguments:
+        phonenos {list} -- sanitized phone numbers
+
+    Returns:
+        tuple -- (values uint64 array, lengths int array,
+                  valid bool array, False if a number is not only
+                  digits or is longer than rates.MAX_EXTENSION_LENGTH)
+    """
+    width = rates.MAX_EXTENSION_LENGTH
+    encoded = numpy.array(phonenos, dtype="S{}".format(width + 1))
+    raw = encoded.view(numpy.uint8).reshape(len(phonenos), width + 1)
+    # strings are padded with NUL bytes, which phone numbers never have
+    in_number = raw != 0
+    lengths = numpy.count_nonzero(in_number, axis=1)
+    is_digit = (raw >= ord("0")) & (raw <= ord("9"))
+    valid = (lengths <= width) & numpy.all(is_digit | ~in_number, axis=1)
+    # anything but a digit counts as 0, its number is not valid anyway
+    digits = ((raw - ord("0")) * (in_number & is_digit)).astype(numpy.uint64)
+    values = numpy.zeros(len(phonenos), numpy.uint64)
+    for column in xrange(width):
+        numpy.multiply(
+            values, numpy.uint64(10), out=values, where=in_number[:, column]
+        )
+        values += digits[:, column]
+    values[~valid] = 0
+    return values, lengths, valid
+
+
+def _key_length_range(keys):
+    """Shortest and longest extension length in a sorted key column,
+    encoded keys grow with the extension length
+
+    Arguments:
+        keys {obj} -- sorted uint64 array, not empty
+
+    Returns:
+        tuple -- (shortest, longest)
+    """
+    return len(str(int(keys[0]))) - 1, len(str(int(keys[-1]))) - 1
+
+
+def _powers_of_ten():
+    """Powers of ten up to the longest extension
+
+    Returns:
+        obj -- uint64 array, 10 ** position
+    """
+    return numpy.array(
+        [10 ** power for power in xrange(rates.MAX_EXTENSION_LENGTH + 1)],
+        numpy.uint64
+    )
+
+
+def _sorted_numbers(phonenos):
+    """Parse phone numbers, sorted by length then value, i.e. by
+    encoded phone number, the prefixes of a given length are then
+    sorted runs, which makes searchsorted much more cache friendly
+
+    Arguments:
+        phonenos {list} -- sanitized phone numbers
+
+    Returns:
+        dict -- {"order": positions of the sorted numbers in phonenos,
+                 "values", "lengths", "valid": as returned by
+                 _parse_numbers() in sorted order,
+                 "pow10": returned by _powers_of_ten()}
+    """
+    values, lengths, valid = _parse_numbers(phonenos)
+    pow10 = _powers_of_ten()
+    order = numpy.argsort(pow10[numpy.minimum(lengths, len(pow10) - 1)] + values)
+    return {
+        "order": order,
+        "values": values[order],
+        "lengths": lengths[order],
+        "valid": valid[order],
+        "pow10": pow10,
+    }
+
+
+def _candidates(numbers, length, cache):
+    """Rows and encoded keys of the first length digits of the phone
+    numbers long enough, see rates.encode_extension(), computed once
+    per length for all the operators
+
+    Arguments:
+        numbers {dict} -- returned by _sorted_numbers()
+        length {int} -- prefix length
+        cache {dict} -- candidates computed so far, by length
+
+    Returns:
+        tuple -- (rows int array, keys uint64 array)
+    """
+    if length not in cache:
+        pow10 = numbers["pow10"]
+        rows = numpy.flatnonzero(numbers["valid"] & (numbers["lengths"] >= length))
+        cache[length] = (
+            rows,
+            pow10[length] +
+            numbers["values"][rows] // pow10[numbers["lengths"][rows] - length]
+        )
+    return cache[length]
+
+
+def _match_table(table, numbers, cache):
+    """Longest prefix match of the sorted phone numbers in one table
+
+    Arguments:
+        table {obj} -- RateTable or MappedTable
+        numbers {dict} -- returned by _sorted_numbers()
+        cache {dict} -- candidates by length, see _candidates()
+
+    Returns:
+        tuple -- (matched lengths int array, 0 if no match,
+                  prices int64 array in micro-units), in sorted order
+    """
+    keys, prices = _columns(table)
+    matched_lengths = numpy.zeros(len(numbers["order"]), numpy.int8)
+    matched_prices = numpy.zeros(len(numbers["order"]), numpy.int64)
+    if not keys.size or not numbers["valid"].any():
+        return matched_lengths, matched_prices
+    shortest, longest = _key_length_range(keys)
+    longest = min(int(numbers["lengths"][numbers["valid"]].max()), longest)
+    for length in xrange(longest, shortest - 1, -1):
+        rows, keys_of_length = _candidates(numbers, length, cache)
+        positions = keys.searchsorted(keys_of_length).clip(0, len(keys) - 1)
+        # a longer match found before wins
+        hits = (keys[positions] == keys_of_length) & (matched_lengths[rows] == 0)
+        matched_lengths[rows[hits]] = length
+        matched_prices[rows[hits]] = prices[positions[hits]]
+    return matched_lengths, matched_prices
+
+
+def match(operators, phonenos):
+    """Longest prefix match of each phone number per operator
+
+    Arguments:
+        operators {list} -- list of (operator name, table)
+        phonenos {list} -- sanitized phone numbers, only digits
+
+    Returns:
+        tuple -- (valid bool array, list of (operator name,
+                  matched lengths int array, 0 if no match,
+                  prices int64 array in micro-units))
+    """
+    numbers = _sorted_numbers(phonenos)
+    # back to the order of phonenos
+    unsort = numpy.argsort(numbers["order"])
+    cache = {}
+    matches = []
+    for name, table in operators:
+        lengths, prices = _match_table(table, numbers, cache)
+        matches.append((name, lengths[unsort], prices[unsort]))
+    return numbers["valid"][unsort], matches
+
+
+def lookup_many(operators, phonenos):
+    """Get cheapest call rate per operator for each phone number
+
+    Arguments:
+        operators {list} -- list of (operator name, table)
+        phonenos {list} -- sanitized phone numbers
+
+    Returns:
+        list -- one dict per phone number, None for the phone numbers
+                this engine can not look up (not only digits or too long)
+    """
+    valid, matches = match(operators, phonenos)
+    matches = [
+        (name, lengths.tolist(), prices.tolist())
+        for name, lengths, prices in matches
+    ]
+    results = []
+    for position, phoneno in enumerate(phonenos):
+        if not valid[position]:
+            results.append(None)
+            continue
+        cheapest_per_operator = {}
+        for name, lengths, prices in matches:
+            length = lengths[position]
+            if length:
+                cheapest_per_operator[name] = [
+                    phoneno[:length], rates.format_price(prices[position])
+                ]
+        results.append(cheapest_per_operator)
+    return results
+
+
+def lookup_top_many(operators, phonenos, top):
+    """Get the top cheapest operators for each phone number,
+    on equal prices the operator name first in alphabetical order
+
+    Arguments:
+        operators {list} -- list of (operator name, table)
+        phonenos {list} -- sanitized phone numbers
+        top {int} -- number of operators to keep
+
+    Returns:
+        list -- one list per phone number, same as helpers.get_top(),
+                None for the phone numbers this engine can not look up
+    """
+    valid, matches = match(operators, phonenos)
+    matches = [
+        (name, lengths.tolist(), prices.tolist())
+        for name, lengths, prices in matches
+    ]
+    results = []
+    for position, phoneno in enumerate(phonenos):
+        if not valid[position]:
+            results.append(None)
+            continue
+        ranked = heapq.nsmallest(top, (
+            (prices[position], name, lengths[position])
+            for name, lengths, prices in matches
+            if lengths[position]
+        ))
+        results.append([
+            [name, phoneno[:length], rates.format_price(price)]
+            for price, name, length in ranked
+        ])
+    return results
@@ -3,7 +3,9 @@ import sys
 import random
 import argparse
 
-def main(operator_name, number=1000):
+def main(operator_name, number=1000, seed=None):
+    if seed is not None:
+        random.seed(seed)
     file_path = os.path.join(
         os.path.dirname(__file__),
         "data",
@@ -51,10 +53,21 @@ if __name__ == "__main__":
             Number of entries.
             """
         )
+    parser.add_argument(
+        "--seed",
+        "-s",
+        metavar="<seed>",
+        type=int,
+        default=None,
+        help="""
+            Random seed, the same seed always gives the same entries.
+            """
+        )
     parsed = vars(
         parser.parse_args(sys.argv[1:])
     )
     main(
         parsed["name"],
-        parsed["number"]
+        parsed["number"],
+        parsed["seed"]
     )
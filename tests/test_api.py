@@ -0,0 +1,102 @@
+import os
+import time
+import shutil
+import logging
+import tempfile
+import threading
+import unittest
+
+from cheap_caller import store
+from cheap_caller.api import CheapCaller
+
+
+class TestApi(unittest.TestCase):
+    test_operatordir = os.path.abspath(
+        os.path.join(
+            os.path.dirname(__file__),
+            "data",
+        )
+    )
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        for name in ["test_data1", "test_data2"]:
+            shutil.copy(
+                os.path.join(self.test_operatordir, name + ".txt"),
+                os.path.join(self.tmpdir, name + ".operator")
+            )
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _write(self, name, content):
+        file_path = os.path.join(self.tmpdir, name + ".operator")
+        with open(file_path, "w") as operator_file:
+            operator_file.write(content)
+        # make sure the mtime changes on coarse grained filesystems
+        mtime = time.time() + 10
+        os.utime(file_path, (mtime, mtime))
+
+    def test_ok__lookup(self):
+        # Same results in memory, with an index file or a cache
+        for kwargs in [{}, {"index_path": store.default_index_path(self.tmpdir)},
+                       {"cache_size": 10}]:
+            caller = CheapCaller(self.tmpdir, **kwargs)
+            self.assertEqual(len(caller), 2)
+            self.assertDictEqual(
+                caller.lookup("+46-73-210"),
+                {"test_data1": ["467321", "0.5"], "test_data2": ["46732", "1.1"]}
+            )
+            self.assertListEqual(caller.cheapest("4673210"), ["test_data1", "467321", "0.5"])
+            self.assertIsNone(caller.cheapest("999"))
+            self.assertListEqual(
+                caller.lookup_many(["123", "abc", "999"]),
+                [{"test_data2": ["1", "0.123"]}, None, {}]
+            )
+            with self.assertRaises(ValueError):
+                caller.lookup("abc")
+
+    def test_raises_type_error__unknown_option(self):
+        with self.assertRaises(TypeError):
+            CheapCaller(self.tmpdir, cache=10)
+
+    def test_ok__reload(self):
+        # Reloads swap the data while other threads look up
+        caller = CheapCaller(self.tmpdir, cache_size=10)
+        self.assertFalse(caller.reload())
+        errors = []
+        stop = threading.Event()
+
+        def read():
+            while not stop.is_set():
+                try:
+                    result = caller.lookup("9991")
+                    if result not in ({}, {"test_data3": ["99", "0.2"]}):
+                        errors.append(result)
+                except Exception as error:  # pylint: disable=broad-except
+                    errors.append(error)
+
+        readers = [threading.Thread(target=read) for _ in xrange(4)]
+        for reader in readers:
+            reader.start()
+        self._write("test_data3", "99,0.2\n")
+        self.assertTrue(caller.reload())
+        stop.set()
+        for reader in readers:
+            reader.join()
+        self.assertListEqual(errors, [])
+        self.assertDictEqual(caller.lookup("9991"), {"test_data3": ["99", "0.2"]})
+
+    def test_ok__no_logging_config(self):
+        # Loading and looking up leaves the logging config alone
+        root = logging.getLogger()
+        handlers = list(root.handlers)
+        level = root.level
+        caller = CheapCaller(self.tmpdir)
+        caller.lookup("123")
+        self.assertListEqual(root.handlers, handlers)
+        self.assertEqual(root.level, level)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+import os
+import json
+import unittest
+from StringIO import StringIO
+
+from cheap_caller import helpers
+from cheap_caller import index
+from cheap_caller import batch
+
+
+class TestBatch(unittest.TestCase):
+    test_operator_file1 = os.path.abspath(
+        os.path.join(
+            os.path.dirname(__file__),
+            "data",
+            "test_data1.txt"
+        )
+    )
+
+    def setUp(self):
+        self.prefix_index = index.build_index([
+            {
+                "name": "test_data1",
+                "source": helpers.gen_lines("test_data1", open(self.test_operator_file1))
+            }
+        ])
+
+    def test_ok__gen_numbers(self):
+        # Blank lines are skipped, numbers are stripped
+        source = StringIO("4673210\n\n  +46-73 \n")
+        self.assertListEqual(list(batch.gen_numbers(source)), ["4673210", "+46-73"])
+
+    def test_ok__gen_results(self):
+        # Invalid and unmatched numbers are per row errors
+        results = list(batch.gen_results(self.prefix_index, ["4673210", "abc", "999"]))
+        self.assertEqual(len(results), 3)
+        self.assertEqual(results[0]["operator"], "test_data1")
+        self.assertEqual(results[0]["extension"], "467321")
+        self.assertEqual(results[0]["price"], "0.5")
+        self.assertIsNone(results[0]["error"])
+        self.assertEqual(results[1]["error"], batch.INVALID_PHONENO)
+        self.assertIsNone(results[1]["operator"])
+        self.assertEqual(results[2]["error"], batch.NO_MATCH)
+
+    def test_ok__write_csv(self):
+        out = StringIO()
+        batch.write_csv(
+            batch.gen_results(self.prefix_index, ["4673210", "abc"]),
+            out
+        )
+        self.assertListEqual(
+            out.getvalue().splitlines(),
+            [
+                "number,operator,extension,price,error",
+                "4673210,test_data1,467321,0.5,",
+                "abc,,,,\"{}\"".format(batch.INVALID_PHONENO),
+            ]
+        )
+
+    def test_ok__write_csv_ranked(self):
+        # One row per ranked operator
+        out = StringIO()
+        batch.write_csv(
+            batch.gen_results(self.prefix_index, ["4673210", "999"], top=2),
+            out,
+            ranked=True
+        )
+        self.assertListEqual(
+            out.getvalue().splitlines(),
+            [
+                "number,rank,operator,extension,price,error",
+                "4673210,1,test_data1,467321,0.5,",
+                "999,,,,,{}".format(batch.NO_MATCH),
+            ]
+        )
+
+    def test_ok__write_jsonl(self):
+        out = StringIO()
+        batch.write_jsonl(
+            batch.gen_results(self.prefix_index, ["4673210", "abc"]),
+            out
+        )
+        lines = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(lines[0]["per_operator"], {"test_data1": ["467321", "0.5"]})
+        self.assertEqual(lines[1]["error"], batch.INVALID_PHONENO)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,39 @@
+import shutil
+import tempfile
+import unittest
+
+from cheap_caller import helpers
+from benchmarks import generate
+
+
+class TestBenchmarks(unittest.TestCase):
+
+    def _read(self, outdir):
+        return [
+            open(file_path).read()
+            for file_path in sorted(helpers.gen_find("*.operator", outdir))
+        ]
+
+    def test_ok__generate(self):
+        # Same seed gives the same files, another seed other files
+        outdirs = [tempfile.mkdtemp() for _ in xrange(3)]
+        try:
+            for outdir, seed in zip(outdirs, [1, 1, 2]):
+                generate.generate(outdir, 1000, 3, seed)
+            first, second, third = [self._read(outdir) for outdir in outdirs]
+            self.assertEqual(len(first), 3)
+            self.assertEqual(sum(data.count("\n") for data in first), 1000)
+            self.assertListEqual(first, second)
+            self.assertNotEqual(first, third)
+        finally:
+            for outdir in outdirs:
+                shutil.rmtree(outdir)
+
+    def test_ok__gen_phonenos(self):
+        phonenos = list(generate.gen_phonenos(0, 10))
+        self.assertListEqual(phonenos, list(generate.gen_phonenos(0, 10)))
+        self.assertTrue(all(len(phoneno) == 10 for phoneno in phonenos))
+
+
+if __name__ == "__main__":
+    unittest.main()
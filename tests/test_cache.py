@@ -0,0 +1,92 @@
+import os
+import unittest
+
+from cheap_caller import cache
+from cheap_caller import index
+from cheap_caller import shared
+
+
+class TestCache(unittest.TestCase):
+    test_operator_file1 = os.path.abspath(
+        os.path.join(
+            os.path.dirname(__file__),
+            "data",
+            "test_data1.txt"
+        )
+    )
+    test_operator_file2 = os.path.abspath(
+        os.path.join(
+            os.path.dirname(__file__),
+            "data",
+            "test_data2.txt"
+        )
+    )
+
+    def test_ok__lru_cache(self):
+        # The least recently used entries are evicted first
+        lru = cache.LRUCache(2)
+        lru.put_many([("a", 1), ("b", 2)])
+        self.assertListEqual(lru.get_many(["a", "c"]), [1, None])
+        lru.put_many([("c", 3)])
+        self.assertListEqual(lru.get_many(["b", "a", "c"]), [None, 1, 3])
+        self.assertDictEqual(
+            lru.info(),
+            {"hits": 3, "misses": 2, "evictions": 1, "size": 2, "maxsize": 2}
+        )
+        lru.clear()
+        self.assertEqual(len(lru), 0)
+
+    def test_ok__cached_index(self):
+        # Same results as the index, numbers sharing the longest
+        # matched prefix share an entry
+        prefix_index = index.build_index_in_pool(
+            [self.test_operator_file1, self.test_operator_file2]
+        )
+        cached_index = cache.CachedIndex(prefix_index, 10)
+        phonenos = ["4673210", "4673219", "123", "999", "46732"] * 100
+        self.assertListEqual(
+            cached_index.lookup_many(phonenos),
+            prefix_index.lookup_many(phonenos)
+        )
+        self.assertDictEqual(
+            cached_index.lookup("4673211"), prefix_index.lookup("4673211")
+        )
+        info = cached_index.info()
+        # 467321, 1, 46732, 999 is not cached as nothing matches
+        self.assertEqual(info["size"], 3)
+        self.assertEqual(info["misses"], 3)
+        self.assertEqual(info["hits"], 1)
+
+    def test_ok__cached_shared_index(self):
+        # Same results in front of a SharedIndex, its prefixes are
+        # merged from the shared levels
+        prefix_index = index.build_index_in_pool(
+            [self.test_operator_file1, self.test_operator_file2]
+        )
+        cached_index = cache.CachedIndex(
+            shared.SharedIndex.from_tables(prefix_index.tables()), 10
+        )
+        phonenos = ["4673210", "4673219", "123", "999", "46732"] * 100
+        self.assertListEqual(
+            cached_index.lookup_many(phonenos),
+            prefix_index.lookup_many(phonenos)
+        )
+        self.assertEqual(cached_index.info()["size"], 3)
+
+    def test_ok__swap(self):
+        # Cached results are dropped when another index is swapped in
+        cached_index = cache.CachedIndex(
+            index.build_index_in_pool([self.test_operator_file1]), 10
+        )
+        self.assertDictEqual(
+            cached_index.lookup("4673210"), {"test_data1": ["467321", "0.5"]}
+        )
+        cached_index.swap(index.build_index_in_pool([self.test_operator_file2]))
+        self.assertEqual(len(cached_index.info()), 5)
+        self.assertDictEqual(
+            cached_index.lookup("4673210"), {"test_data2": ["46732", "1.1"]}
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+import os
+import random
+import StringIO
+import unittest
+
+from cheap_caller import cdr
+from cheap_caller import index
+from cheap_caller import vectorized
+
+
+class TestCdr(unittest.TestCase):
+    test_operator_file1 = os.path.abspath(
+        os.path.join(
+            os.path.dirname(__file__),
+            "data",
+            "test_data1.txt"
+        )
+    )
+    test_operator_file2 = os.path.abspath(
+        os.path.join(
+            os.path.dirname(__file__),
+            "data",
+            "test_data2.txt"
+        )
+    )
+
+    def _operators(self):
+        return index.build_index_in_pool(
+            [self.test_operator_file1, self.test_operator_file2]
+        ).tables()
+
+    def test_ok__gen_calls(self):
+        # The header is skipped, invalid lines yield None
+        source = StringIO.StringIO(
+            "number,duration\n4673210,60\n+46-73,1.5,extra\n"
+            "abc,10\n123,-1\n123\n\n"
+        )
+        self.assertListEqual(
+            list(cdr.gen_calls(source)),
+            [("4673210", 60000), ("4673", 1500), None, None, None]
+        )
+
+    def test_ok__aggregate(self):
+        # Costs per operator over the calls it can route,
+        # the least cost with the cheapest operator of each call
+        calls = [
+            ("4673210", 60000), ("1234", 30000), ("1", 1000), ("999", 60000), None
+        ]
+        totals = cdr.format_totals(cdr.aggregate(self._operators(), calls))
+        self.assertDictEqual(totals["operators"], {
+            # 0.5 + 0.2 / 2
+            "test_data1": {"calls": 2, "cost": "0.6"},
+            # 1.1 + 0.2 / 2 + 0.123 / 60
+            "test_data2": {"calls": 3, "cost": "1.20205"},
+        })
+        self.assertDictEqual(
+            totals["least_cost"], {"calls": 3, "cost": "0.60205"}
+        )
+        self.assertEqual(totals["calls"], 5)
+        self.assertEqual(totals["invalid"], 1)
+        self.assertEqual(totals["unmatched"], 1)
+        self.assertEqual(totals["seconds"], 151.0)
+        # prices per second
+        totals = cdr.format_totals(cdr.aggregate(self._operators(), calls), 1)
+        self.assertEqual(totals["least_cost"]["cost"], "36.123")
+
+    @unittest.skipUnless(vectorized.available(), "NumPy is not installed")
+    def test_ok__aggregate_vectorized(self):
+        # Chunks priced by the vectorized engine sum up the same
+        generator = random.Random(5)
+        calls = [
+            (
+                generator.choice(["4673", "1234", "1", "9", "46"]) +
+                str(generator.randint(0, 10 ** 6)),
+                generator.randint(0, 10 ** 6)
+            )
+            for _ in xrange(vectorized.MIN_BATCH_SIZE * 2)
+        ] + [("46.7", 1000)]
+        totals = cdr.aggregate(self._operators(), calls)
+        expected = cdr.new_totals(["test_data1", "test_data2"])
+        cdr._add_calls(
+            expected, self._operators(),
+            [phoneno for phoneno, _ in calls], [millis for _, millis in calls]
+        )
+        self.assertDictEqual(totals["operators"], expected["operators"])
+        self.assertDictEqual(totals["least_cost"], expected["least_cost"])
+        self.assertEqual(totals["unmatched"], expected["unmatched"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,160 @@
+import os
+import gzip
+import time
+import random
+import shutil
+import tempfile
+import unittest
+
+from cheap_caller import delta
+from cheap_caller import helpers
+from cheap_caller import index
+from cheap_caller import rates
+from cheap_caller import store
+
+
+class TestDelta(unittest.TestCase):
+    test_operatordir = os.path.abspath(
+        os.path.join(
+            os.path.dirname(__file__),
+            "data",
+        )
+    )
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        for name in ["test_data1", "test_data2"]:
+            shutil.copy(
+                os.path.join(self.test_operatordir, name + ".txt"),
+                os.path.join(self.tmpdir, name + ".operator")
+            )
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _write_delta(self, name, content):
+        with open(os.path.join(self.tmpdir, name), "w") as delta_file:
+            delta_file.write(content)
+
+    def _file_paths(self):
+        return sorted(helpers.gen_find("*.operator", self.tmpdir))
+
+    def test_ok__gen_changes(self):
+        # Invalid lines are ignored, deletes have no price
+        lines = [
+            "add,+4670,0.2\n", "update, 4673 ,0.35\n", "delete,46732\n",
+            "\n", "add,4674\n", "remove,4675\n", "update,abc,0.1\n",
+        ]
+        self.assertListEqual(
+            list(delta.gen_changes("test", lines)),
+            [(14670, 200000), (14673, 350000), (146732, None)]
+        )
+        self.assertListEqual(
+            list(delta.gen_changes("test", lines, "4673")),
+            [(14673, 350000), (146732, None)]
+        )
+
+    def test_ok__find_deltas(self):
+        # Deltas are found by operator file name, in name order
+        self._write_delta("test_data1.operator.0002.delta", "")
+        self._write_delta("test_data1.operator.0001.delta", "")
+        self._write_delta("test_data1.delta", "")
+        found = delta.find_deltas(self._file_paths())
+        self.assertListEqual(found.keys(), [self._file_paths()[0]])
+        self.assertListEqual(
+            [os.path.basename(path) for path in found[self._file_paths()[0]]],
+            ["test_data1.operator.0001.delta", "test_data1.operator.0002.delta"]
+        )
+
+    def test_ok__patched_table(self):
+        # A patched table answers like a table built with the patch merged
+        generator = random.Random(7)
+        for _ in xrange(200):
+            extensions = set(
+                "".join(generator.choice("123") for _ in xrange(generator.randint(1, 4)))
+                for _ in xrange(10)
+            )
+            table = rates.RateTable.from_records(
+                (rates.encode_extension(extension), generator.randint(1, 9))
+                for extension in extensions
+            )
+            patch = dict(
+                (
+                    rates.encode_extension("".join(
+                        generator.choice("123") for _ in xrange(generator.randint(1, 4))
+                    )),
+                    generator.choice([None, generator.randint(1, 9)])
+                )
+                for _ in xrange(5)
+            )
+            patched = delta.apply_patch(table, patch)
+            merged = rates.RateTable(*delta.merge_patch(table.keys, table.prices, patch))
+            self.assertListEqual(
+                list(rates.table_columns(patched)[0]), list(merged.keys)
+            )
+            for phoneno in ["1", "12", "123", "1231", "3213", "2222", "3"]:
+                self.assertEqual(
+                    patched.longest_match(phoneno), merged.longest_match(phoneno)
+                )
+
+    def test_ok__deltas_applied_to_indexes(self):
+        # Built and stored indexes overlay the deltas,
+        # the index file is not compiled again
+        self._write_delta(
+            "test_data1.operator.0001.delta",
+            "delete,467321\nadd,9,0.1\n"
+        )
+        self._write_delta("test_data1.operator.0002.delta", "update,4673,0.3\n")
+        expected = {"test_data1": ["46732", "1.1"], "test_data2": ["46732", "1.1"]}
+        prefix_index = index.build_index_in_pool(self._file_paths())
+        self.assertDictEqual(prefix_index.lookup("4673210"), expected)
+        self.assertDictEqual(prefix_index.lookup("99"), {"test_data1": ["9", "0.1"]})
+        self.assertListEqual(prefix_index.lookup("46739")["test_data1"], ["4673", "0.3"])
+        index_path = store.default_index_path(self.tmpdir)
+        store.compile_index(index_path, self._file_paths())
+        mtime = os.stat(index_path).st_mtime
+        stored_index = store.open_index(index_path, self._file_paths())
+        self.assertDictEqual(stored_index.lookup("4673210"), expected)
+        self.assertListEqual(stored_index.lookup_many(["4673210"] * 2), [expected] * 2)
+        stored_index.close()
+        self.assertEqual(os.stat(index_path).st_mtime, mtime)
+
+    def test_ok__compact(self):
+        # The operator file gets the deltas applied, the deltas are removed
+        file_path = self._file_paths()[0]
+        with open(file_path) as operator_file:
+            content = operator_file.read()
+        with gzip.GzipFile(file_path + ".gz", "wb") as compressed:
+            compressed.write(content)
+        os.remove(file_path)
+        self._write_delta(
+            "test_data1.operator.0001.delta",
+            "delete,467321\nadd,9,0.1\nupdate,4673,0.3\n"
+        )
+        self.assertEqual(delta.compact(file_path + ".gz"), 4)
+        with gzip.GzipFile(file_path + ".gz") as compressed:
+            self.assertEqual(
+                compressed.read(), "1234,0.2\n4673,0.3\n46732,1.1\n9,0.1\n"
+            )
+        self.assertDictEqual(delta.find_deltas([file_path + ".gz"]), {})
+
+    def test_ok__compact_refuses_lines_not_indexed(self):
+        # The operator file and its deltas are left as they are,
+        # rewriting it would drop the extension too long to index
+        file_path = self._file_paths()[0]
+        with open(file_path, "a") as operator_file:
+            operator_file.write("\n1234567890123456789,0.1\n")
+        with open(file_path) as operator_file:
+            content = operator_file.read()
+        self._write_delta("test_data1.operator.0001.delta", "add,9,0.1\n")
+        self.assertIsNone(delta.compact(file_path))
+        with open(file_path) as operator_file:
+            self.assertEqual(operator_file.read(), content)
+        self.assertListEqual(
+            delta.find_deltas([file_path])[file_path],
+            [os.path.join(self.tmpdir, "test_data1.operator.0001.delta")]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
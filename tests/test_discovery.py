@@ -0,0 +1,137 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+from cheap_caller import discovery
+from cheap_caller import stats
+
+
+class TestDiscovery(unittest.TestCase):
+    names = [
+        "a.operator",
+        "b.operator.gz",
+        "notes.txt",
+        "2025/c.operator",
+        "2025/old/d.operator",
+        "2026/e.operator",
+        "2026/e.operator.bak",
+    ]
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.top = os.path.join(self.tmpdir, "top")
+        self.manifest_path = os.path.join(self.tmpdir, "manifest.json")
+        for name in self.names:
+            self._touch(name)
+        stats.enable()
+        stats.reset()
+
+    def tearDown(self):
+        stats.enable(False)
+        stats.reset()
+        shutil.rmtree(self.tmpdir)
+
+    def _touch(self, name):
+        file_path = os.path.join(self.top, name)
+        if not os.path.isdir(os.path.dirname(file_path)):
+            os.makedirs(os.path.dirname(file_path))
+        open(file_path, "w").close()
+
+    def _found(self, *args, **kwargs):
+        return [
+            os.path.relpath(file_path, self.top)
+            for file_path in discovery.find(self.top, *args, **kwargs)
+        ]
+
+    def _age_manifest(self):
+        # as if listed well after the directories last changed
+        with open(self.manifest_path) as manifest:
+            content = json.load(manifest)
+        for listing in content["directories"].itervalues():
+            listing["listed"] = listing["mtime"] + 2 * discovery.RACY_SECONDS
+        with open(self.manifest_path, "w") as manifest:
+            json.dump(content, manifest)
+
+    def test_ok__patterns(self):
+        patterns = discovery.Patterns(["*.operator", "2025/old/*"])
+        self.assertTrue(patterns.by_relpath)
+        self.assertTrue(patterns.matches_file("a.operator", "a.operator"))
+        self.assertTrue(patterns.matches_file("a.operator.bz2", "a.operator.bz2"))
+        self.assertTrue(patterns.matches_file("x", "2025/old/x"))
+        self.assertFalse(patterns.matches_file("a.operator.bak", "a.operator.bak"))
+        self.assertFalse(patterns.matches_file("x", "2025/x"))
+        self.assertFalse(discovery.Patterns([]).matches_file("x", "x"))
+        # a directory has no compression suffix
+        self.assertTrue(patterns.matches_directory("a.operator", "a.operator"))
+        self.assertFalse(patterns.matches_directory("a.operator.gz", "a.operator.gz"))
+
+    def test_ok__find(self):
+        self.assertListEqual(self._found(["*.operator"]), [
+            "2025/c.operator",
+            "2025/old/d.operator",
+            "2026/e.operator",
+            "a.operator",
+            "b.operator.gz",
+        ])
+        self.assertEqual(stats.summary()["counters"]["files_found"], 5)
+
+    def test_ok__find_excluded(self):
+        # an excluded directory is not traversed
+        self.assertListEqual(
+            self._found(["*.operator"], ["2025/old", "b.*"]),
+            ["2025/c.operator", "2026/e.operator", "a.operator"]
+        )
+        self.assertListEqual(
+            self._found(["*.operator"], ["2025"]),
+            ["2026/e.operator", "a.operator", "b.operator.gz"]
+        )
+
+    def test_ok__find_threads(self):
+        self.assertListEqual(
+            self._found(["*"], threads=4),
+            self._found(["*"])
+        )
+
+    def test_ok__find_manifest(self):
+        first = self._found(["*.operator"], manifest_path=self.manifest_path)
+        self.assertTrue(os.path.exists(self.manifest_path))
+        self._age_manifest()
+        stats.reset()
+        self.assertListEqual(
+            self._found(["*.operator"], manifest_path=self.manifest_path), first
+        )
+        counters = stats.summary()["counters"]
+        self.assertEqual(counters["directories_cached"], 4)
+        self.assertNotIn("directories_listed", counters)
+
+    def test_ok__find_manifest_changed(self):
+        # a file added changes the directory mtime, it is listed again
+        self._found(["*.operator"], manifest_path=self.manifest_path)
+        self._age_manifest()
+        self._touch("2025/f.operator")
+        directory = os.path.join(self.top, "2025")
+        mtime = os.stat(directory).st_mtime + 10
+        os.utime(directory, (mtime, mtime))
+        stats.reset()
+        self.assertIn(
+            "2025/f.operator",
+            self._found(["*.operator"], manifest_path=self.manifest_path)
+        )
+        self.assertEqual(stats.summary()["counters"]["directories_listed"], 1)
+
+    def test_ok__find_manifest_of_another_directory(self):
+        other = os.path.join(self.top, "2025")
+        discovery.find(other, ["*"], manifest_path=self.manifest_path)
+        self.assertDictEqual(discovery.read_manifest(self.manifest_path, self.top), {})
+        self.assertEqual(len(self._found(["*.operator"], manifest_path=self.manifest_path)), 5)
+
+    def test_ok__find_manifest_not_writable(self):
+        manifest_path = os.path.join(self.tmpdir, "missing", "manifest.json")
+        self.assertEqual(len(self._found(["*.operator"], manifest_path=manifest_path)), 5)
+        self.assertFalse(os.path.exists(manifest_path))
+
+
+if __name__ == "__main__":
+    unittest.main()
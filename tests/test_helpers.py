@@ -1,6 +1,12 @@
 import os
+import bz2
+import json
+import gzip
 import types
+import shutil
 import logging
+import logging.config
+import tempfile
 import unittest
 
 from cheap_caller import helpers
@@ -36,6 +42,20 @@ class TestHelpers(unittest.TestCase):
         )
     )
 
+    def setUp(self):
+        # the file handlers write debug.log to the working directory
+        self.cwd = os.getcwd()
+        self.tmpdir = tempfile.mkdtemp()
+        os.chdir(self.tmpdir)
+
+    def tearDown(self):
+        for logger in (logging.getLogger("cheap_caller"), logging.getLogger("test")):
+            for handler in list(logger.handlers):
+                if isinstance(handler, logging.FileHandler):
+                    logger.removeHandler(handler)
+                    handler.close()
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmpdir)
 
     def test_ok__read_logging_conf_file_no_input(self):
         # Test the default behavior
@@ -62,6 +82,33 @@ class TestHelpers(unittest.TestCase):
         self.assertEqual(logger.handlers[0].level, logging.WARNING)
         self.assertEqual(logger.handlers[0].name, "screen")
 
+    def test_ok__read_logging_conf_file_without_file_handlers(self):
+        # Only the screen handler is created, without logging.config
+        helpers.read_logging_conf_file(file_handlers=False)
+        logger = logging.getLogger("cheap_caller")
+        self.assertEqual(logger.level, logging.DEBUG)
+        self.assertFalse(logger.propagate)
+        self.assertEqual(len(logger.handlers), 1)
+        self.assertNotIsInstance(logger.handlers[0], logging.FileHandler)
+        self.assertEqual(logger.handlers[0].level, logging.INFO)
+        self.assertEqual(logger.handlers[0].name, "screen")
+        self.assertFalse(logging.getLogger("cheap_caller.helpers").disabled)
+        # the file handlers are back when asked for
+        helpers.read_logging_conf_file(file_handlers=True)
+        self.assertEqual(len(logger.handlers), 2)
+
+    def test_ok__default_logging_without_file_handlers(self):
+        # Same screen handler as the default conf file applied by dictConfig
+        with open(helpers.DEFAULT_LOGGING_CONF) as conf_file:
+            conf = json.load(conf_file)
+        logging.config.dictConfig(helpers._without_file_handlers(conf))
+        expected = logging.getLogger("cheap_caller").handlers[0]
+        helpers.read_logging_conf_file(file_handlers=False)
+        handler = logging.getLogger("cheap_caller").handlers[0]
+        self.assertEqual(handler.level, expected.level)
+        self.assertEqual(handler.formatter._fmt, expected.formatter._fmt)
+        self.assertEqual(handler.formatter.datefmt, expected.formatter.datefmt)
+
     def test_ok__configure_logger_valid_log_level(self):
         # check if logging level of streamhandler changes
         # when configure_logger is called with a valid log level
@@ -106,6 +153,41 @@ class TestHelpers(unittest.TestCase):
             self.assertIn("source", adict)
             self.assertIsInstance(adict["source"], types.FileType)
 
+    def test_ok__open_files_compressed(self):
+        # Compressed files are found with the plain pattern, streamed
+        # decompressed and named without the compression suffix
+        tmpdir = tempfile.mkdtemp()
+        try:
+            with open(self.test_operator_file1) as operator_file:
+                content = operator_file.read()
+            for name, opener in [("a.operator.gz", gzip.GzipFile),
+                                 ("b.operator.bz2", bz2.BZ2File)]:
+                with opener(os.path.join(tmpdir, name), "wb") as compressed:
+                    compressed.write(content)
+            with open(os.path.join(tmpdir, "c.txt.gz"), "wb"):
+                pass
+            file_paths = sorted(helpers.gen_find("*.operator", tmpdir))
+            self.assertListEqual(
+                [os.path.basename(path) for path in file_paths],
+                ["a.operator.gz", "b.operator.bz2"]
+            )
+            file_dicts = list(helpers.open_files(file_paths))
+            self.assertListEqual(
+                [adict["name"] for adict in file_dicts], ["a", "b"]
+            )
+            for adict in helpers.open_files(file_paths):
+                self.assertEqual(adict["source"].read(), content)
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_ok__map_in_pool(self):
+        # Results come in the order of the input sequence
+        # in this process or in worker processes
+        for workers in [1, 3]:
+            out = helpers.map_in_pool(abs, xrange(0, -20, -1), workers)
+            self.assertIsInstance(out, types.GeneratorType)
+            self.assertListEqual(list(out), range(20))
+
     def test_ok__gen_right_triangle(self):
         # Test for expected output for a given string
         out = helpers.gen_right_triangle("1234")
@@ -126,11 +208,14 @@ class TestHelpers(unittest.TestCase):
     def test_raises_value_error__sanitize_phoneno(self):
         # Should raise ValueError with different messages
         # for different bogus input phone numbers
-        inputs = ["123akbkab", "akbkab", ""]
+        inputs = ["123akbkab", "akbkab", "", "1e5", "nan", "+"]
         error_messages = [
-            "invalid literal for float(): {}",
-            "could not convert string to float: {}",
-            "No phoneno provided{}"
+            "Not only digits, a leading + or 00 and -: {}",
+            "Not only digits, a leading + or 00 and -: {}",
+            "No phoneno provided{}",
+            "Not only digits, a leading + or 00 and -: {}",
+            "Not only digits, a leading + or 00 and -: {}",
+            "No digits: {}",
         ]
         zipped = zip(inputs, error_messages)
         for val in zipped:
@@ -174,6 +259,25 @@ class TestHelpers(unittest.TestCase):
         input_dict = {"test_data1": ["46","0.5"], "test_data2": ["462", "1.1"]}
         out = helpers.get_cheapest(input_dict)
         self.assertTupleEqual(out, ("test_data1", "0.5"))
+        # prices are compared as numbers, not strings
+        input_dict = {"test_data1": ["46", "10.5"], "test_data2": ["462", "9.1"]}
+        out = helpers.get_cheapest(input_dict)
+        self.assertTupleEqual(out, ("test_data2", "9.1"))
+        # on equal prices the first operator name wins
+        input_dict = {"b": ["46", "0.50"], "a": ["462", "0.5"], "c": ["4", "0.5"]}
+        self.assertTupleEqual(helpers.get_cheapest(input_dict), ("a", "0.5"))
+
+    def test_ok__get_top(self):
+        # Ranked by price then operator name, at most top operators
+        input_dict = {
+            "b": ["46", "0.5"], "a": ["462", "0.5"],
+            "c": ["4", "10.1"], "d": ["4", "9.9"]
+        }
+        self.assertListEqual(
+            helpers.get_top(input_dict.iteritems(), 3),
+            [["a", "462", "0.5"], ["b", "46", "0.5"], ["d", "4", "9.9"]]
+        )
+        self.assertListEqual(helpers.get_top(iter([]), 3), [])
 
 
 
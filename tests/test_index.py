@@ -0,0 +1,94 @@
+import os
+import unittest
+
+from cheap_caller import helpers
+from cheap_caller import index
+
+
+class TestIndex(unittest.TestCase):
+    test_operator_file1 = os.path.abspath(
+        os.path.join(
+            os.path.dirname(__file__),
+            "data",
+            "test_data1.txt"
+        )
+    )
+    test_operator_file2 = os.path.abspath(
+        os.path.join(
+            os.path.dirname(__file__),
+            "data",
+            "test_data2.txt"
+        )
+    )
+
+    def _dictseq(self):
+        inputs = [self.test_operator_file1, self.test_operator_file2]
+        names = ["test_data1", "test_data2"]
+        return (
+            {"source": helpers.gen_lines(names[index], open(inputs[index])), "name": names[index]}
+            for index in xrange(len(inputs))
+        )
+
+    def test_ok__lookup(self):
+        # Check that the index gives the same answer as
+        # get_cheapest_per_operator() for the test operator files
+        prefix_index = index.build_index(self._dictseq())
+        self.assertEqual(len(prefix_index), 2)
+        self.assertDictEqual(
+            prefix_index.lookup("4673210"),
+            {"test_data1": ["467321", "0.5"], "test_data2": ["46732", "1.1"]}
+        )
+        self.assertDictEqual(
+            prefix_index.lookup("123"),
+            {"test_data2": ["1", "0.123"]}
+        )
+        self.assertDictEqual(prefix_index.lookup("999"), {})
+
+    def test_ok__lookup_many(self):
+        # Same results as looking up one phone number at a time
+        prefix_index = index.build_index(self._dictseq())
+        phonenos = ["4673210", "123", "999"]
+        self.assertListEqual(
+            prefix_index.lookup_many(phonenos),
+            [prefix_index.lookup(phoneno) for phoneno in phonenos]
+        )
+
+    def test_ok__lookup_top(self):
+        # Ranked like get_top() over the per operator results
+        prefix_index = index.build_index(self._dictseq())
+        self.assertListEqual(
+            prefix_index.lookup_top("4673210", 2),
+            [["test_data1", "467321", "0.5"], ["test_data2", "46732", "1.1"]]
+        )
+        self.assertListEqual(
+            prefix_index.lookup_top("4673210", 1), [["test_data1", "467321", "0.5"]]
+        )
+        self.assertListEqual(prefix_index.lookup_top("999", 2), [])
+        self.assertListEqual(
+            prefix_index.lookup_top_many(["4673210", "123"], 1),
+            [[["test_data1", "467321", "0.5"]], [["test_data2", "1", "0.123"]]]
+        )
+
+    def test_ok__build_index_with_prefix(self):
+        # Only the lines starting with the prefix are indexed
+        prefix_index = index.build_index(self._dictseq(), "4")
+        self.assertDictEqual(prefix_index.lookup("123"), {})
+        self.assertDictEqual(
+            prefix_index.lookup("46732"),
+            {"test_data1": ["46732", "1.1"], "test_data2": ["46732", "1.1"]}
+        )
+
+    def test_ok__build_index_in_pool(self):
+        # Worker processes build the same index as build_index()
+        file_paths = [self.test_operator_file1, "somedummy.txt", self.test_operator_file2]
+        for workers in [1, 2]:
+            prefix_index = index.build_index_in_pool(file_paths, workers=workers)
+            self.assertEqual(len(prefix_index), 2)
+            self.assertDictEqual(
+                prefix_index.lookup("4673210"),
+                {"test_data1": ["467321", "0.5"], "test_data2": ["46732", "1.1"]}
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+import os
+import StringIO
+import unittest
+
+from cheap_caller import helpers
+from cheap_caller import ingest
+from cheap_caller import rates
+
+
+class TestIngest(unittest.TestCase):
+    test_operator_file1 = os.path.abspath(
+        os.path.join(
+            os.path.dirname(__file__),
+            "data",
+            "test_data1.txt"
+        )
+    )
+    test_operator_file2 = os.path.abspath(
+        os.path.join(
+            os.path.dirname(__file__),
+            "data",
+            "test_data2.txt"
+        )
+    )
+
+    def assertSameTable(self, first, second):
+        self.assertEqual(list(first.keys), list(second.keys))
+        self.assertEqual(list(first.prices), list(second.prices))
+
+    def test_ok__same_as_gen_lines(self):
+        # Same table as parsing line by line, for the test operator files,
+        # with or without a prefix, whatever the chunk size
+        for file_path in [self.test_operator_file1, self.test_operator_file2]:
+            for prefix in ["", "4", "1"]:
+                expected = rates.RateTable.from_lines(
+                    helpers.gen_lines("test", open(file_path)), prefix
+                )
+                self.assertSameTable(
+                    ingest.build_table("test", open(file_path), prefix),
+                    expected
+                )
+                for chunk_size in [1, 7, 1024]:
+                    self.assertSameTable(
+                        rates.RateTable.from_records(ingest.gen_records(
+                            "test", open(file_path), prefix, chunk_size
+                        )),
+                        expected
+                    )
+
+    def test_ok__acceptance_rules(self):
+        # Lines the fast path does not match follow the gen_lines() rules
+        text = "\n".join([
+            "+46,0.5",
+            "0046 , 0.25 ,ignored",
+            "+0047,1",
+            "046,2.",
+            "48,0.1234567",
+            "49,1e-1\r",
+            "50,inf",
+            "51,",
+            "",
+            "4.6,0.1",
+            "1234567890123456789,0.1",
+            "52,0.5 x",
+        ])
+        expected = rates.RateTable.from_lines(
+            helpers.gen_lines("test", StringIO.StringIO(text))
+        )
+        self.assertSameTable(
+            ingest.build_table("test", StringIO.StringIO(text)), expected
+        )
+        self.assertEqual(
+            [rates.decode_extension(key) for key in expected.keys],
+            ["46", "47", "48", "49", "046"]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+import os
+import csv
+import StringIO
+import unittest
+
+from cheap_caller import index
+from cheap_caller import lcr
+from cheap_caller import rates
+
+
+class TestLcr(unittest.TestCase):
+    test_operator_file1 = os.path.abspath(
+        os.path.join(
+            os.path.dirname(__file__),
+            "data",
+            "test_data1.txt"
+        )
+    )
+    test_operator_file2 = os.path.abspath(
+        os.path.join(
+            os.path.dirname(__file__),
+            "data",
+            "test_data2.txt"
+        )
+    )
+
+    def _operators(self):
+        return index.build_index_in_pool(
+            [self.test_operator_file1, self.test_operator_file2]
+        ).tables()
+
+    def test_ok__gen_routes(self):
+        # Every extension of any operator, with the cheapest longest match,
+        # on a tie the first operator name in alphabetical order
+        routes = [
+            (extension, name, rates.format_price(price))
+            for extension, name, price in lcr.gen_routes(self._operators())
+        ]
+        self.assertListEqual(routes, [
+            ("1", "test_data2", "0.123"),
+            ("1234", "test_data1", "0.2"),
+            ("4673", "test_data1", "0.9"),
+            ("46732", "test_data1", "1.1"),
+            ("467321", "test_data1", "0.5"),
+        ])
+
+    def test_ok__longest_prefix_resolved_across_operators(self):
+        # An operator with a shorter but cheaper match wins
+        operators = [
+            ("a", rates.RateTable.from_lines([["4", "0.1"]])),
+            ("b", rates.RateTable.from_lines([["46", "0.5"], ["467", "0.05"]])),
+        ]
+        self.assertListEqual(list(lcr.gen_routes(operators)), [
+            ("4", "a", 100000),
+            ("46", "a", 100000),
+            ("467", "b", 50000),
+        ])
+
+    def test_ok__write_csv(self):
+        # A header then a row per route, the price formatted
+        routes = list(lcr.gen_routes(self._operators()))
+        out = StringIO.StringIO()
+        self.assertEqual(lcr.write_csv(routes, out), len(routes))
+        out.seek(0)
+        rows = list(csv.reader(out))
+        self.assertListEqual(rows[0], list(lcr.CSV_FIELDS))
+        self.assertListEqual(rows[1:], [
+            [extension, name, rates.format_price(price)]
+            for extension, name, price in routes
+        ])
+
+
+if __name__ == "__main__":
+    unittest.main()
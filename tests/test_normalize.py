@@ -0,0 +1,49 @@
+import unittest
+
+from cheap_caller import normalize
+
+
+class TestNormalize(unittest.TestCase):
+    valid = [
+        ("4673212", "4673212"),
+        (" +46-73-212 ", "4673212"),
+        ("0046732", "46732"),
+        ("+0046732", "46732"),
+        ("00+46732", "46732"),
+        ("0732", "0732"),
+        (u"+46732", u"46732"),
+    ]
+    invalid = [
+        ("", normalize.EMPTY),
+        ("  ", normalize.EMPTY),
+        (None, normalize.EMPTY),
+        ("+", normalize.NO_DIGITS),
+        ("00-", normalize.NO_DIGITS),
+        ("1e5", normalize.NOT_DIGITS),
+        ("inf", normalize.NOT_DIGITS),
+        ("nan", normalize.NOT_DIGITS),
+        ("46.5", normalize.NOT_DIGITS),
+        ("46 73", normalize.NOT_DIGITS),
+        ("46+73", normalize.NOT_DIGITS),
+        (u"\u0664\u0666", normalize.NOT_DIGITS),
+    ]
+
+    def test_ok__normalize(self):
+        for number, digits in self.valid:
+            self.assertEqual(normalize.normalize(number), (digits, None))
+
+    def test_ok__normalize_rejected(self):
+        for number, reason in self.invalid:
+            self.assertEqual(normalize.normalize(number), (None, reason), number)
+
+    def test_ok__gen_normalized(self):
+        # same as normalize(), whatever path the number takes
+        numbers = [number for number, _ in self.valid + self.invalid if number is not None]
+        self.assertListEqual(
+            list(normalize.gen_normalized(numbers)),
+            [normalize.normalize(number) for number in numbers]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -59,5 +59,140 @@ class TestParser(unittest.TestCase):
         self.assertIn("pattern", parsed)
         self.assertEqual(parsed["pattern"], "something")
 
+    def test_ok__lookup_command(self):
+        # check that a single lookup is the default command
+        parsed = parser.parse(["12345", "data"])
+        self.assertEqual(parsed["command"], "lookup")
+
+    def test_ok__batch_command(self):
+        # check that batch command is parsed with default values
+        parsed = parser.parse(["batch", "data"])
+        self.assertEqual(parsed["command"], "batch")
+        self.assertEqual(parsed["operatordir"], "data")
+        self.assertEqual(parsed["input"], "-")
+        self.assertEqual(parsed["format"], "csv")
+        self.assertNotIn("phoneno", parsed)
+
+    def test_raises_system_exit__batch_input_doesnot_exist(self):
+        # negative test, check behavior when input file does not exist
+        args = ["batch", "data", "-i", "bullshit"]
+        with self.assertRaises(SystemExit):
+            parser.parse(args)
+
+    def test_ok__compile_command(self):
+        # check that compile command is parsed with default values
+        parsed = parser.parse(["compile", "data"])
+        self.assertEqual(parsed["command"], "compile")
+        self.assertIsNone(parsed["index"])
+        parsed = parser.parse(["compile", "data", "-x", "some.index"])
+        self.assertEqual(parsed["index"], "some.index")
+
+    def test_ok__lcr_command(self):
+        # check that lcr command writes to stdout by default
+        parsed = parser.parse(["lcr", "data"])
+        self.assertEqual(parsed["command"], "lcr")
+        self.assertEqual(parsed["output"], "-")
+
+    def test_ok__cdr_command(self):
+        # check that cdr command reads stdin and prices per minute by default
+        parsed = parser.parse(["cdr", "data"])
+        self.assertEqual(parsed["command"], "cdr")
+        self.assertEqual(parsed["input"], "-")
+        self.assertEqual(parsed["unit"], 60)
+        with self.assertRaises(SystemExit):
+            parser.parse(["cdr", "data", "-u", "0"])
+
+    def test_ok__compact_command(self):
+        parsed = parser.parse(["compact", "data"])
+        self.assertEqual(parsed["command"], "compact")
+
+    def test_ok__summarize_command(self):
+        parsed = parser.parse(["summarize", "data", "-w", "2"])
+        self.assertEqual(parsed["command"], "summarize")
+        self.assertEqual(parsed["workers"], 2)
+
+    def test_ok__serve_command(self):
+        # check that serve command listens on a tcp port by default
+        parsed = parser.parse(["serve", "data"])
+        self.assertEqual(parsed["command"], "serve")
+        self.assertIsNone(parsed["socket"])
+        self.assertEqual(parsed["port"], 8642)
+
+    def test_raises_system_exit__serve_socket_and_port(self):
+        # negative test, socket and port are mutually exclusive
+        args = ["serve", "data", "-s", "some.sock", "--port", "1234"]
+        with self.assertRaises(SystemExit):
+            parser.parse(args)
+
+    def test_ok__plain_lookup(self):
+        # a lookup without options is parsed the same without argparse
+        args = ["4673", "data"]
+        expected = vars(parser._lookup_parser().parse_args(args))
+        expected["command"] = "lookup"
+        self.assertIsNotNone(parser._parse_plain_lookup(args))
+        self.assertDictEqual(parser.parse(args), expected)
+        self.assertIsNone(parser._parse_plain_lookup(["4673", "data", "-w", "2"]))
+        self.assertIsNone(parser._parse_plain_lookup(["4673", "doesnotexist"]))
+
+    def test_ok__shard_command(self):
+        parsed = parser.parse(["shard", "data", "-o", "shards", "-S", "1-3", "-S", "4-9,0"])
+        self.assertEqual(parsed["command"], "shard")
+        self.assertListEqual(parsed["shards"], [[("1", "3")], [("4", "9"), ("0", "0")]])
+        with self.assertRaises(SystemExit):
+            parser.parse(["shard", "data", "-o", "shards", "-S", "1-33"])
+
+    def test_ok__route_command(self):
+        # the route command reads no operator files
+        parsed = parser.parse(["route", "-S", "8643=1-3", "-S", "/tmp/s1.sock=4"])
+        self.assertEqual(parsed["command"], "route")
+        self.assertListEqual(
+            parsed["shards"],
+            [(("127.0.0.1", 8643), [("1", "3")]), ("/tmp/s1.sock", [("4", "4")])]
+        )
+        self.assertEqual(parsed["port"], 8642)
+        with self.assertRaises(SystemExit):
+            parser.parse(["route", "-S", "1-3"])
+
+    def test_ok__workers(self):
+        # check that workers defaults to one and has to be positive
+        self.assertEqual(parser.parse(["12345", "data"])["workers"], 1)
+        self.assertEqual(parser.parse(["12345", "data", "-w", "4"])["workers"], 4)
+        with self.assertRaises(SystemExit):
+            parser.parse(["12345", "data", "-w", "0"])
+
+    def test_ok__profile(self):
+        # check that profiling is off by default for every command
+        self.assertFalse(parser.parse(["12345", "data"])["profile"])
+        self.assertTrue(parser.parse(["batch", "data", "--profile"])["profile"])
+
+    def test_ok__top(self):
+        # check that top is not set by default and has to be positive
+        self.assertIsNone(parser.parse(["12345", "data"])["top"])
+        self.assertEqual(parser.parse(["batch", "data", "--top", "3"])["top"], 3)
+        with self.assertRaises(SystemExit):
+            parser.parse(["12345", "data", "-t", "0"])
+
+    def test_ok__cache_size(self):
+        # check that batch and serve have no cache by default
+        self.assertEqual(parser.parse(["batch", "data"])["cache_size"], 0)
+        self.assertEqual(parser.parse(["serve", "data", "-c", "100"])["cache_size"], 100)
+        with self.assertRaises(SystemExit):
+            parser.parse(["serve", "data", "-c", "-1"])
+
+    def test_ok__memory_budget(self):
+        # check that the index is compiled in memory by default
+        self.assertIsNone(parser.parse(["compile", "data"])["memory_budget"])
+        self.assertEqual(parser.parse(["compile", "data", "-m", "256"])["memory_budget"], 256)
+        with self.assertRaises(SystemExit):
+            parser.parse(["compile", "data", "-m", "0"])
+
+    def test_ok__shared(self):
+        # check that the rate tables are merged only if asked to
+        self.assertFalse(parser.parse(["batch", "data"])["shared"])
+        self.assertTrue(parser.parse(["serve", "data", "--shared"])["shared"])
+        self.assertTrue(parser.parse(["compile", "data", "--shared"])["shared"])
+        with self.assertRaises(SystemExit):
+            parser.parse(["lcr", "data", "--shared"])
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,59 @@
+import pickle
+import unittest
+
+from cheap_caller import rates
+
+
+class TestRates(unittest.TestCase):
+
+    def test_ok__encode_extension(self):
+        # Leading zeros are kept, non digits can not be encoded
+        self.assertEqual(rates.encode_extension("046"), 1046)
+        self.assertEqual(rates.decode_extension(1046), "046")
+        self.assertIsNone(rates.encode_extension("4.6"))
+        self.assertIsNone(rates.encode_extension("1" * 19))
+
+    def test_ok__parse_and_format_price(self):
+        for price, micro, formatted in [
+                ("0.9", 900000, "0.9"),
+                ("0.8473", 847300, "0.8473"),
+                ("0", 0, "0.0"),
+                ("1.10", 1100000, "1.1"),
+                ("12", 12000000, "12.0"),
+                ("-0.5", -500000, "-0.5")]:
+            self.assertEqual(rates.parse_price(price), micro)
+            self.assertEqual(rates.format_price(micro), formatted)
+
+    def test_raises_value_error__parse_price(self):
+        for price in ["inf", "nan", "abc", "1e300"]:
+            with self.assertRaises(ValueError):
+                rates.parse_price(price)
+
+    def test_ok__rate_table(self):
+        # Longest extension wins, cheapest price per extension is kept,
+        # prices are compared as numbers
+        table = rates.RateTable.from_lines(
+            [["46", "0.5"], ["4673", "0.9"], ["4673", "10.7"], ["4673", "0.8"],
+             ["4.6", "0.1"], ["47", "inf"]]
+        )
+        self.assertEqual(len(table), 2)
+        self.assertListEqual(table.longest_match("4673210"), ["4673", "0.8"])
+        self.assertListEqual(table.longest_match("4612"), ["46", "0.5"])
+        self.assertIsNone(table.longest_match("1234"))
+        self.assertIsNone(table.longest_match("47"))
+
+    def test_ok__rate_table_with_prefix(self):
+        table = rates.RateTable.from_lines([["46", "0.5"], ["12", "0.9"]], "4")
+        self.assertEqual(len(table), 1)
+        self.assertIsNone(table.longest_match("12"))
+
+    def test_ok__rate_table_pickle(self):
+        table = rates.RateTable.from_lines([["46", "0.5"], ["4673", "0.9"]])
+        for protocol in [0, 2]:
+            copied = pickle.loads(pickle.dumps(table, protocol))
+            self.assertEqual(copied.keys, table.keys)
+            self.assertEqual(copied.prices, table.prices)
+
+
+if __name__ == "__main__":
+    unittest.main()
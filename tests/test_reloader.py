@@ -0,0 +1,135 @@
+import os
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+
+from cheap_caller import store
+from cheap_caller import reloader
+
+
+class TestReloader(unittest.TestCase):
+    test_operatordir = os.path.abspath(
+        os.path.join(
+            os.path.dirname(__file__),
+            "data",
+        )
+    )
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        for name in ["test_data1", "test_data2"]:
+            shutil.copy(
+                os.path.join(self.test_operatordir, name + ".txt"),
+                os.path.join(self.tmpdir, name + ".operator")
+            )
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _write(self, name, content):
+        file_path = os.path.join(self.tmpdir, name + ".operator")
+        with open(file_path, "w") as operator_file:
+            operator_file.write(content)
+        # make sure the mtime changes on coarse grained filesystems
+        mtime = time.time() + 10
+        os.utime(file_path, (mtime, mtime))
+
+    def test_ok__index_reloader(self):
+        index_reloader = reloader.IndexReloader("*.operator", self.tmpdir)
+        self.assertTrue(index_reloader.reload())
+        first_index = index_reloader.prefix_index
+        self.assertEqual(len(first_index), 2)
+        # nothing changed, nothing reloaded
+        self.assertFalse(index_reloader.reload())
+        self.assertIs(index_reloader.prefix_index, first_index)
+        # changed and added files are parsed, unchanged tables are reused
+        self._write("test_data1", "999,0.3\n")
+        self._write("test_data3", "99,0.2\n")
+        self.assertTrue(index_reloader.reload())
+        second_index = index_reloader.prefix_index
+        self.assertEqual(len(second_index), 3)
+        self.assertDictEqual(
+            second_index.lookup("9991"),
+            {"test_data1": ["999", "0.3"], "test_data3": ["99", "0.2"]}
+        )
+        unchanged = os.path.join(self.tmpdir, "test_data2.operator")
+        self.assertIs(
+            first_index.tables_by_path()[unchanged][1],
+            second_index.tables_by_path()[unchanged][1]
+        )
+        # the old index is left untouched
+        self.assertDictEqual(first_index.lookup("9991"), {})
+        # removed files are dropped
+        os.remove(os.path.join(self.tmpdir, "test_data3.operator"))
+        self.assertTrue(index_reloader.reload())
+        self.assertEqual(len(index_reloader.prefix_index), 2)
+
+    def test_ok__stored_index_reloader(self):
+        # compiled out of core, as the serve command does with -m
+        index_reloader = reloader.StoredIndexReloader(
+            "*.operator", self.tmpdir, store.default_index_path(self.tmpdir),
+            memory_budget=3 * store.RECORD_BYTES
+        )
+        self.assertTrue(index_reloader.reload())
+        self.assertFalse(index_reloader.reload())
+        self._write("test_data1", "999,0.3\n")
+        self.assertTrue(index_reloader.reload())
+        self.assertDictEqual(
+            index_reloader.prefix_index.lookup("9991"),
+            {"test_data1": ["999", "0.3"]}
+        )
+
+    def test_ok__reload_deltas(self):
+        # Changed deltas are overlaid again without parsing the operator file
+        index_reloader = reloader.IndexReloader("*.operator", self.tmpdir)
+        index_reloader.reload()
+        first_index = index_reloader.prefix_index
+        delta_path = os.path.join(self.tmpdir, "test_data1.operator.0001.delta")
+        with open(delta_path, "w") as delta_file:
+            delta_file.write("add,999,0.3\n")
+        self.assertTrue(index_reloader.reload())
+        second_index = index_reloader.prefix_index
+        self.assertDictEqual(
+            second_index.lookup("9991"), {"test_data1": ["999", "0.3"]}
+        )
+        changed = os.path.join(self.tmpdir, "test_data1.operator")
+        self.assertIs(
+            first_index.tables_by_path()[changed][1],
+            second_index.tables_by_path()[changed][1].table
+        )
+        self.assertFalse(index_reloader.reload())
+        os.remove(delta_path)
+        self.assertTrue(index_reloader.reload())
+        self.assertDictEqual(index_reloader.prefix_index.lookup("9991"), {})
+        # the stored index too
+        index_reloader = reloader.StoredIndexReloader(
+            "*.operator", self.tmpdir, store.default_index_path(self.tmpdir)
+        )
+        index_reloader.reload()
+        with open(delta_path, "w") as delta_file:
+            delta_file.write("add,999,0.3\n")
+        self.assertTrue(index_reloader.reload())
+        self.assertDictEqual(
+            index_reloader.prefix_index.lookup("9991"),
+            {"test_data1": ["999", "0.3"]}
+        )
+
+    def test_ok__watcher(self):
+        index_reloader = reloader.IndexReloader("*.operator", self.tmpdir)
+        index_reloader.reload()
+        reloaded = threading.Event()
+        watcher = reloader.Watcher(
+            index_reloader, 0.01, lambda prefix_index: reloaded.set()
+        )
+        watcher.start()
+        self._write("test_data3", "99,0.2\n")
+        self.assertTrue(reloaded.wait(5))
+        watcher.stop()
+        watcher.join()
+        self.assertEqual(len(index_reloader.prefix_index), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
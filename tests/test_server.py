@@ -0,0 +1,81 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from cheap_caller import helpers
+from cheap_caller import index
+from cheap_caller import server
+
+
+class TestServer(unittest.TestCase):
+    test_operator_file1 = os.path.abspath(
+        os.path.join(
+            os.path.dirname(__file__),
+            "data",
+            "test_data1.txt"
+        )
+    )
+
+    def setUp(self):
+        prefix_index = index.build_index([
+            {
+                "name": "test_data1",
+                "source": helpers.gen_lines("test_data1", open(self.test_operator_file1))
+            }
+        ])
+        self.tmpdir = tempfile.mkdtemp()
+        self.address = os.path.join(self.tmpdir, "cheap_caller.sock")
+        self.server = server.make_server(prefix_index, self.address)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        shutil.rmtree(self.tmpdir)
+
+    def test_ok__lookup(self):
+        client = server.Client(self.address, timeout=5)
+        result = client.lookup("+46-73210")
+        self.assertEqual(result["operator"], "test_data1")
+        self.assertEqual(result["price"], "0.5")
+        self.assertEqual(result["per_operator"], {"test_data1": ["467321", "0.5"]})
+        client.close()
+
+    def test_ok__lookup_many_in_order(self):
+        # A batched request gets one result per number, errors included
+        client = server.Client(self.address, timeout=5)
+        results = client.lookup_many(["4673210", "abc", "999", "1234"])
+        self.assertListEqual(
+            [result["price"] for result in results],
+            ["0.5", None, None, "0.2"]
+        )
+        self.assertIsNotNone(results[1]["error"])
+        client.close()
+
+    def test_ok__concurrent_clients(self):
+        # Several clients at once, each pipelining its requests
+        errors = []
+
+        def run():
+            try:
+                client = server.Client(self.address, timeout=5)
+                for _ in xrange(20):
+                    self.assertEqual(client.lookup("4673")["price"], "0.9")
+                client.close()
+            except Exception as error:  # pylint: disable=broad-except
+                errors.append(error)
+
+        threads = [threading.Thread(target=run) for _ in xrange(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertListEqual(errors, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
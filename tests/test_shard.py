@@ -0,0 +1,158 @@
+import os
+import json
+import shutil
+import tempfile
+import threading
+import unittest
+
+from cheap_caller import batch
+from cheap_caller import helpers
+from cheap_caller import index
+from cheap_caller import server
+from cheap_caller import shard
+
+
+class TestShard(unittest.TestCase):
+    test_data_dir = os.path.abspath(
+        os.path.join(
+            os.path.dirname(__file__),
+            "data"
+        )
+    )
+    test_file_paths = [
+        os.path.join(test_data_dir, "test_data1.txt"),
+        os.path.join(test_data_dir, "test_data2.txt"),
+    ]
+    # the extension 1 of test_data2 can match numbers of the first two
+    shards = [[("10", "11")], [("12", "19")], [("46", "46")]]
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.servers = []
+
+    def tearDown(self):
+        for lookup_server, thread in self.servers:
+            lookup_server.shutdown()
+            lookup_server.server_close()
+            thread.join()
+        shutil.rmtree(self.tmpdir)
+
+    def _start(self, lookup_server):
+        thread = threading.Thread(target=lookup_server.serve_forever)
+        thread.start()
+        self.servers.append((lookup_server, thread))
+
+    def test_ok__parse_ranges(self):
+        self.assertListEqual(
+            shard.parse_ranges("1-3,44, 200-219"),
+            [("1", "3"), ("44", "44"), ("200", "219")]
+        )
+        self.assertEqual(shard.format_ranges(shard.parse_ranges("1-3,44")), "1-3,44")
+        for spec in ("", "1-22", "3-1", "4a", "1-"):
+            with self.assertRaises(ValueError):
+                shard.parse_ranges(spec)
+
+    def test_ok__parse_address(self):
+        self.assertEqual(shard.parse_address("8643"), (server.DEFAULT_HOST, 8643))
+        self.assertEqual(shard.parse_address("host:8643"), ("host", 8643))
+        self.assertEqual(shard.parse_address("/tmp/s0.sock"), "/tmp/s0.sock")
+
+    def test_raises_value_error__prefixes_overlap(self):
+        with self.assertRaises(ValueError):
+            shard.Partition([[("1", "3")], [("3", "4")]])
+        with self.assertRaises(ValueError):
+            shard.Partition([[("1", "1")], [("12", "13")]])
+        address = os.path.join(self.tmpdir, "router.sock")
+        with self.assertRaises(ValueError):
+            shard.make_router([("s0.sock", [("1", "3")]), ("s1.sock", [("3", "4")])], address)
+        # checked before binding
+        self.assertFalse(os.path.exists(address))
+
+    def test_ok__partition(self):
+        partition = shard.Partition(self.shards)
+        self.assertEqual(partition.shard_of("4673210"), 2)
+        self.assertEqual(partition.shard_of("1234"), 1)
+        self.assertEqual(partition.shard_of("1"), 0)
+        self.assertIsNone(partition.shard_of("999"))
+        self.assertListEqual(partition.shards_of_extension("1"), [0, 1])
+        self.assertListEqual(partition.shards_of_extension("1234"), [1])
+        self.assertListEqual(partition.shards_of_extension("999"), [])
+
+    def test_ok__split(self):
+        counts = shard.split(self.test_file_paths, self.test_data_dir, self.tmpdir, self.shards)
+        self.assertListEqual(counts, [1, 5, 5])
+        shard0 = shard.shard_path(self.tmpdir, 0)
+        with open(os.path.join(shard0, "test_data2.txt")) as source:
+            self.assertEqual(source.read(), "1,0.123\n")
+        with open(os.path.join(shard0, shard.MANIFEST_NAME)) as manifest:
+            self.assertDictEqual(json.load(manifest), {"ranges": "10-11"})
+
+    def test_ok__split_paths_and_deltas(self):
+        # Operator files keep their relative path, their deltas follow them
+        top = os.path.join(self.tmpdir, "top")
+        file_paths = []
+        for name, content in [("2025/a.operator", "46,1\n12,2\n"),
+                              ("2026/a.operator", "46,3\n")]:
+            file_paths.append(os.path.join(top, name))
+            os.makedirs(os.path.dirname(file_paths[-1]))
+            with open(file_paths[-1], "w") as operator_file:
+                operator_file.write(content)
+        with open(os.path.join(top, "2025", "a.operator.0001.delta"), "w") as delta_file:
+            delta_file.write("update, 46, 0.5\nadd,1234,0.1\n")
+        outdir = os.path.join(self.tmpdir, "shards")
+        self.assertListEqual(shard.split(file_paths, top, outdir, self.shards), [0, 1, 2])
+        shard2 = shard.shard_path(outdir, 2)
+        with open(os.path.join(shard2, "2026", "a.operator")) as source:
+            self.assertEqual(source.read(), "46,3\n")
+        with open(os.path.join(shard2, "2025", "a.operator.0001.delta")) as source:
+            self.assertEqual(source.read(), "update, 46, 0.5\n")
+        shard1 = shard.shard_path(outdir, 1)
+        with open(os.path.join(shard1, "2025", "a.operator.0001.delta")) as source:
+            self.assertEqual(source.read(), "add,1234,0.1\n")
+        self.assertDictEqual(
+            index.build_index_in_pool(
+                sorted(helpers.gen_find("*.operator", shard2))
+            ).lookup("4673"),
+            index.build_index_in_pool(file_paths).lookup("4673")
+        )
+
+    def test_raises_value_error__same_path_in_shard(self):
+        file_paths = [
+            os.path.join(self.tmpdir, "a.operator"),
+            os.path.join(self.tmpdir, "a.operator.gz"),
+        ]
+        with self.assertRaises(ValueError):
+            shard.split(file_paths, self.tmpdir, self.tmpdir, self.shards)
+        self.assertListEqual(os.listdir(self.tmpdir), [])
+
+    def test_ok__router(self):
+        # The router answers like a server of all the operator data
+        shard.split(self.test_file_paths, self.test_data_dir, self.tmpdir, self.shards)
+        shard_servers = []
+        for position, ranges in enumerate(self.shards):
+            address = os.path.join(self.tmpdir, "shard{}.sock".format(position))
+            self._start(server.make_server(
+                index.build_index_in_pool(list(helpers.gen_find(
+                    "*.txt", shard.shard_path(self.tmpdir, position)
+                ))),
+                address
+            ))
+            shard_servers.append((address, ranges))
+        address = os.path.join(self.tmpdir, "router.sock")
+        router = shard.make_router(shard_servers, address)
+        self.assertListEqual(router.addresses, [path for path, _ in shard_servers])
+        self._start(router)
+        numbers = ["+46-73210", "1", "1034", "1234", "abc", "999", "46", "4"]
+        expected = batch.gen_results(
+            index.build_index_in_pool(self.test_file_paths), numbers
+        )
+        client = server.Client(address, timeout=5)
+        self.assertListEqual(
+            client.lookup_many(numbers),
+            [json.loads(json.dumps(result)) for result in expected]
+        )
+        client.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,146 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from cheap_caller import cache
+from cheap_caller import index
+from cheap_caller import rates
+from cheap_caller import shared
+from cheap_caller import store
+
+
+class TestShared(unittest.TestCase):
+    test_data_dir = os.path.abspath(
+        os.path.join(
+            os.path.dirname(__file__),
+            "data"
+        )
+    )
+    test_file_paths = [
+        os.path.join(test_data_dir, "test_data1.txt"),
+        os.path.join(test_data_dir, "test_data2.txt"),
+    ]
+    phonenos = [
+        "4673210", "46732", "4673", "1", "1234", "999", "0046", "46a", "",
+        "1234567890123456789012",
+    ]
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.prefix_index = index.build_index_in_pool(self.test_file_paths)
+        self.shared_index = shared.SharedIndex.from_tables(self.prefix_index.tables())
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_ok__lookup(self):
+        # Same answers as the rate tables it was merged from
+        self.assertEqual(len(self.shared_index), 2)
+        self.assertDictEqual(
+            self.shared_index.lookup("4673210"),
+            {"test_data1": ["467321", "0.5"], "test_data2": ["46732", "1.1"]}
+        )
+        self.assertListEqual(
+            self.shared_index.lookup_many(self.phonenos),
+            self.prefix_index.lookup_many(self.phonenos)
+        )
+        self.assertListEqual(
+            self.shared_index.lookup_top_many(self.phonenos, 1),
+            self.prefix_index.lookup_top_many(self.phonenos, 1)
+        )
+
+    def test_ok__tables(self):
+        for (name, table), (shared_name, shared_table) in zip(
+                self.prefix_index.tables(), self.shared_index.tables()):
+            self.assertEqual(name, shared_name)
+            self.assertEqual(len(table), len(shared_table))
+            self.assertEqual(rates.table_columns(table), rates.table_columns(shared_table))
+            for phoneno in self.phonenos:
+                self.assertEqual(table.longest_match(phoneno), shared_table.longest_match(phoneno))
+
+    def test_ok__merge_keys(self):
+        # The keys of all the operators, read from the shared levels
+        merged = cache.merge_keys(self.prefix_index.tables())
+        self.assertEqual(
+            rates.table_columns(self.shared_index.merge_keys()),
+            rates.table_columns(merged)
+        )
+
+    def test_ok__smaller(self):
+        # each extension is kept once, in the fewest bytes it fits in
+        table_bytes = sum(
+            len(table) * (table.keys.itemsize + table.prices.itemsize)
+            for _, table in self.prefix_index.tables()
+        )
+        self.assertLess(self.shared_index.nbytes(), table_bytes)
+
+    def test_ok__write_read(self):
+        path = os.path.join(self.tmpdir, "shared.bin")
+        self.shared_index.write(path)
+        read_index = shared.SharedIndex.read(path)
+        self.assertListEqual(read_index.names, self.shared_index.names)
+        self.assertEqual(read_index.nbytes(), self.shared_index.nbytes())
+        self.assertListEqual(
+            read_index.lookup_many(self.phonenos),
+            self.shared_index.lookup_many(self.phonenos)
+        )
+
+    def test_raises_value_error__not_shared_index_file(self):
+        path = os.path.join(self.tmpdir, "shared.bin")
+        with open(path, "w") as shared_file:
+            shared_file.write("4673,0.9\n")
+        with self.assertRaises(ValueError):
+            shared.SharedIndex.read(path)
+
+    def test_raises_value_error__truncated(self):
+        path = os.path.join(self.tmpdir, "shared.bin")
+        self.shared_index.write(path)
+        with open(path, "rb") as shared_file:
+            content = shared_file.read()
+        with open(path, "wb") as shared_file:
+            shared_file.write(content[:-1])
+        with self.assertRaises(ValueError):
+            shared.SharedIndex.read(path)
+
+    def test_raises_value_error__other_sources(self):
+        path = os.path.join(self.tmpdir, "shared.bin")
+        self.shared_index.write(path, [["test_data1.operator", 1, 1.0]])
+        shared.SharedIndex.read(path, [["test_data1.operator", 1, 1.0]])
+        with self.assertRaises(ValueError):
+            shared.SharedIndex.read(path, [["test_data1.operator", 2, 1.0]])
+
+    def test_ok__open_shared(self):
+        # Written next to the index file, read back as long as the
+        # index and its delta files are unchanged
+        file_paths = []
+        for file_path in self.test_file_paths:
+            file_paths.append(os.path.join(
+                self.tmpdir,
+                os.path.basename(file_path).replace(".txt", ".operator")
+            ))
+            shutil.copy(file_path, file_paths[-1])
+        index_path = os.path.join(self.tmpdir, "index")
+        shared_path = index_path + shared.SHARED_SUFFIX
+        stored_index = store.open_index(index_path, file_paths)
+        shared_index = shared.open_shared(stored_index)
+        self.assertTrue(os.path.exists(shared_path))
+        self.assertListEqual(
+            shared_index.lookup_many(self.phonenos),
+            self.shared_index.lookup_many(self.phonenos)
+        )
+        written = os.stat(shared_path).st_mtime
+        shared.open_shared(stored_index)
+        self.assertEqual(os.stat(shared_path).st_mtime, written)
+        with open(file_paths[0] + ".0001.delta", "w") as delta_file:
+            delta_file.write("update,4673,0.3\n")
+        stored_index.apply_deltas()
+        self.assertDictEqual(
+            shared.open_shared(stored_index).lookup("4673"),
+            {"test_data1": ["4673", "0.3"], "test_data2": ["4673", "0.9"]}
+        )
+        stored_index.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+import unittest
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+RUNNER = os.path.join(ROOT, "cheap_caller.py")
+
+# seconds a single lookup may take over the bare interpreter startup,
+# best of STARTUP_RUNS, it took about 0.135 with numpy and
+# logging.config imported up front, 0.02 without
+STARTUP_TARGET = 0.1
+
+STARTUP_RUNS = 5
+
+# run the runner, then write the names of the imported modules to stderr
+_RUN_AND_LIST_MODULES = """
+import sys, runpy
+sys.path.insert(0, {root!r})
+sys.argv = sys.argv[1:]
+try:
+    runpy.run_path(sys.argv[0], run_name="__main__")
+finally:
+    sys.stderr.write("\\n" + " ".join(sorted(sys.modules)) + "\\n")
+""".format(root=ROOT)
+
+
+class TestStartup(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        with open(os.path.join(self.tmpdir, "abc.operator"), "w") as operator_file:
+            operator_file.write("4673,0.9\n46732,1.1\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _run(self, command):
+        process = subprocess.Popen(
+            command, cwd=self.tmpdir,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+        _, err = process.communicate()
+        self.assertEqual(process.returncode, 0, err)
+        return err
+
+    def _best_of(self, command):
+        best = None
+        for _ in xrange(STARTUP_RUNS):
+            start = time.time()
+            self._run(command)
+            elapsed = time.time() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best
+
+    def test_ok__lookup_imports(self):
+        # A single lookup imports none of the modules it does not run
+        err = self._run([
+            sys.executable, "-c", _RUN_AND_LIST_MODULES, RUNNER, "4673", self.tmpdir
+        ])
+        modules = set(err.splitlines()[-1].split())
+        self.assertIn("cheap_caller.index", modules)
+        for module in ("numpy", "logging.config", "argparse", "multiprocessing",
+                       "cheap_caller.server", "cheap_caller.cdr"):
+            self.assertNotIn(module, modules)
+
+    def test_ok__debug_log_only_at_debug_level(self):
+        debug_log = os.path.join(self.tmpdir, "debug.log")
+        self._run([sys.executable, RUNNER, "4673", self.tmpdir])
+        self.assertFalse(os.path.exists(debug_log))
+        self._run([sys.executable, RUNNER, "4673", self.tmpdir, "-ll", "debug"])
+        self.assertTrue(os.path.exists(debug_log))
+
+    def test_ok__startup_time(self):
+        # A single lookup starts within STARTUP_TARGET of the interpreter
+        bare = self._best_of([sys.executable, "-c", "pass"])
+        lookup = self._best_of([sys.executable, RUNNER, "4673", self.tmpdir])
+        self.assertLess(
+            lookup - bare, STARTUP_TARGET,
+            "lookup took {:.3f}s, the interpreter {:.3f}s".format(lookup, bare)
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
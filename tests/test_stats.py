@@ -0,0 +1,106 @@
+import os
+import unittest
+
+from cheap_caller import helpers
+from cheap_caller import index
+from cheap_caller import stats
+
+
+class TestStats(unittest.TestCase):
+    test_operator_file1 = os.path.abspath(
+        os.path.join(
+            os.path.dirname(__file__),
+            "data",
+            "test_data1.txt"
+        )
+    )
+
+    def setUp(self):
+        stats.reset()
+
+    def tearDown(self):
+        stats.enable(False)
+        stats.reset()
+
+    def test_ok__disabled(self):
+        # Nothing is recorded when disabled
+        stats.enable(False)
+        stats.count("lines_read", 10)
+        with stats.timer("find"):
+            pass
+        self.assertDictEqual(stats.summary(), {"stages": {}, "counters": {}})
+
+    def test_ok__enabled(self):
+        stats.enable()
+        stats.count("lines_read", 10)
+        stats.count("lines_read")
+        for _ in xrange(2):
+            with stats.timer("find"):
+                pass
+        summary = stats.summary()
+        self.assertDictEqual(summary["counters"], {"lines_read": 11})
+        self.assertEqual(summary["stages"]["find"]["calls"], 2)
+        self.assertGreaterEqual(summary["stages"]["find"]["seconds"], 0)
+
+    def test_ok__pipeline_counters(self):
+        # The pipeline counts the lines read, rejected, kept after the
+        # first digit filter and the extensions tried by a lookup
+        stats.enable()
+        dictseq = helpers.map_from_fileobj_to_lines(
+            helpers.open_files([self.test_operator_file1, "somedummy.txt"])
+        )
+        prefix_index = index.build_index(dictseq, "4")
+        self.assertDictEqual(
+            prefix_index.lookup("4673210"), {"test_data1": ["467321", "0.5"]}
+        )
+        summary = stats.summary()
+        self.assertEqual(summary["counters"]["files_opened"], 1)
+        self.assertEqual(summary["counters"]["files_missing"], 1)
+        lines = open(self.test_operator_file1).read().splitlines()
+        self.assertEqual(summary["counters"]["lines_read"], len(lines))
+        stats.enable(False)
+        parsed = list(helpers.gen_lines("test_data1", lines))
+        self.assertEqual(
+            summary["counters"]["lines_rejected"], len(lines) - len(parsed)
+        )
+        self.assertEqual(
+            summary["counters"]["candidate_lines"],
+            len([line for line in parsed if line[0].startswith("4")])
+        )
+        # 4673210, 467321 matched
+        self.assertEqual(summary["counters"]["extensions_tried"], 2)
+        self.assertEqual(summary["counters"]["lookups"], 1)
+        self.assertEqual(summary["stages"]["parse"]["calls"], 1)
+        self.assertEqual(summary["stages"]["index"]["calls"], 1)
+
+    def test_ok__pool_stats(self):
+        # The stats of the worker processes are added to the ones
+        # of this process, each stage of the ingest is timed
+        stats.enable()
+        recorded = []
+        for workers in [1, 2]:
+            stats.reset()
+            index.build_index_in_pool(
+                [self.test_operator_file1] * 3, "4", workers
+            )
+            recorded.append(stats.summary())
+        self.assertDictEqual(recorded[0]["counters"], recorded[1]["counters"])
+        self.assertEqual(recorded[1]["counters"]["files_opened"], 3)
+        for summary in recorded:
+            for stage in ["open", "region", "parse", "filter", "extensions", "delta"]:
+                self.assertEqual(summary["stages"][stage]["calls"], 3)
+
+    def test_ok__merge(self):
+        stats.enable()
+        stats.count("lines_read", 2)
+        stats.merge({
+            "stages": {"find": {"seconds": 1.5, "calls": 2}},
+            "counters": {"lines_read": 3, "lookups": 1},
+        })
+        summary = stats.summary()
+        self.assertDictEqual(summary["counters"], {"lines_read": 5, "lookups": 1})
+        self.assertDictEqual(summary["stages"], {"find": {"seconds": 1.5, "calls": 2}})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,156 @@
+import os
+import time
+import shutil
+import tempfile
+import unittest
+
+from cheap_caller import helpers
+from cheap_caller import stats
+from cheap_caller import store
+
+
+class TestStore(unittest.TestCase):
+    test_operatordir = os.path.abspath(
+        os.path.join(
+            os.path.dirname(__file__),
+            "data",
+        )
+    )
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        for name in ["test_data1", "test_data2"]:
+            shutil.copy(
+                os.path.join(self.test_operatordir, name + ".txt"),
+                os.path.join(self.tmpdir, name + ".operator")
+            )
+        self.index_path = store.default_index_path(self.tmpdir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _file_paths(self):
+        return sorted(helpers.gen_find("*.operator", self.tmpdir))
+
+    def test_ok__compile_and_lookup(self):
+        # The stored index answers like get_cheapest_per_operator()
+        store.compile_index(self.index_path, self._file_paths())
+        stored_index = store.StoredIndex(self.index_path)
+        self.assertEqual(len(stored_index), 2)
+        self.assertDictEqual(
+            stored_index.lookup("4673210"),
+            {"test_data1": ["467321", "0.5"], "test_data2": ["46732", "1.1"]}
+        )
+        self.assertDictEqual(
+            stored_index.lookup("123"),
+            {"test_data2": ["1", "0.123"]}
+        )
+        self.assertDictEqual(stored_index.lookup("999"), {})
+        stored_index.close()
+
+    def test_raises_stale_index_error__check(self):
+        # Changed, added or removed operator files make the index stale
+        file_paths = self._file_paths()
+        store.compile_index(self.index_path, file_paths)
+        stored_index = store.StoredIndex(self.index_path)
+        stored_index.check(file_paths)
+        with self.assertRaises(store.StaleIndexError):
+            stored_index.check(file_paths[:1])
+        with open(file_paths[0], "a") as operator_file:
+            operator_file.write("\n9,0.1\n")
+        with self.assertRaises(store.StaleIndexError):
+            stored_index.check(file_paths)
+        stored_index.close()
+
+    def test_ok__open_index_rebuilds_broken(self):
+        # An empty or truncated index, e.g. left by a crashed compile,
+        # is compiled again on open
+        file_paths = self._file_paths()
+        store.compile_index(self.index_path, file_paths)
+        with open(self.index_path, "rb") as index_file:
+            content = index_file.read()
+        for broken in ("", content[:12], content[:40], content[:-8]):
+            with open(self.index_path, "wb") as index_file:
+                index_file.write(broken)
+            with self.assertRaises(store.StaleIndexError):
+                store.StoredIndex(self.index_path)
+            stored_index = store.open_index(self.index_path, file_paths)
+            self.assertDictEqual(
+                stored_index.lookup("4673210"),
+                {"test_data1": ["467321", "0.5"], "test_data2": ["46732", "1.1"]}
+            )
+            stored_index.close()
+
+    def test_ok__open_index_rebuilds_stale(self):
+        # A missing or stale index is compiled on open
+        file_paths = self._file_paths()
+        stored_index = store.open_index(self.index_path, file_paths)
+        self.assertDictEqual(stored_index.lookup("999"), {})
+        stored_index.close()
+        with open(file_paths[0], "a") as operator_file:
+            operator_file.write("\n9,0.1\n")
+        # make sure the mtime changes on coarse grained filesystems
+        mtime = time.time() + 10
+        os.utime(file_paths[0], (mtime, mtime))
+        stored_index = store.open_index(self.index_path, file_paths)
+        self.assertDictEqual(stored_index.lookup("999"), {"test_data1": ["9", "0.1"]})
+        stored_index.close()
+
+    def test_ok__compile_out_of_core(self):
+        # Spilled runs merge into the same index as the in memory build,
+        # with the cheapest price of a key found in several runs
+        file_paths = self._file_paths()
+        with open(file_paths[0], "a") as operator_file:
+            operator_file.write("\n467321,0.25\n46732,3\n")
+        store.compile_index(self.index_path, file_paths)
+        with open(self.index_path, "rb") as index_file:
+            expected = index_file.read()
+        out_of_core_path = os.path.join(self.tmpdir, "out_of_core.index")
+        store.compile_index(
+            out_of_core_path, file_paths, memory_budget=3 * store.RECORD_BYTES
+        )
+        with open(out_of_core_path, "rb") as index_file:
+            self.assertEqual(index_file.read(), expected)
+        stored_index = store.StoredIndex(out_of_core_path)
+        self.assertEqual(stored_index.lookup("4673210")["test_data1"], ["467321", "0.25"])
+        stored_index.close()
+        # the run files are removed
+        self.assertItemsEqual(
+            os.listdir(self.tmpdir),
+            [os.path.basename(path) for path in file_paths] +
+            [os.path.basename(self.index_path), "out_of_core.index"]
+        )
+
+    def test_ok__compile_out_of_core_in_passes(self):
+        # More runs than merged at once are merged in several passes
+        file_paths = self._file_paths()
+        store.compile_index(self.index_path, file_paths)
+        with open(self.index_path, "rb") as index_file:
+            expected = index_file.read()
+        out_of_core_path = os.path.join(self.tmpdir, "out_of_core.index")
+        merge_fan_in = store.MERGE_FAN_IN
+        store.MERGE_FAN_IN = 2
+        stats.enable()
+        stats.reset()
+        try:
+            store.compile_index(
+                out_of_core_path, file_paths, memory_budget=store.RECORD_BYTES
+            )
+        finally:
+            store.MERGE_FAN_IN = merge_fan_in
+            stats.enable(False)
+        counters = stats.summary()["counters"]
+        stats.reset()
+        # each pass merges the runs of the previous one again
+        self.assertGreater(counters["runs_merged"], counters["runs_spilled"])
+        with open(out_of_core_path, "rb") as index_file:
+            self.assertEqual(index_file.read(), expected)
+        self.assertItemsEqual(
+            os.listdir(self.tmpdir),
+            [os.path.basename(path) for path in file_paths] +
+            [os.path.basename(self.index_path), "out_of_core.index"]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
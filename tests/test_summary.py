@@ -0,0 +1,76 @@
+import os
+import time
+import shutil
+import tempfile
+import unittest
+
+from cheap_caller import index
+from cheap_caller import summary
+
+
+class TestSummary(unittest.TestCase):
+    test_operator_file1 = os.path.abspath(
+        os.path.join(
+            os.path.dirname(__file__),
+            "data",
+            "test_data1.txt"
+        )
+    )
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.file_path = os.path.join(self.tmpdir, "test_data1.operator")
+        shutil.copy(self.test_operator_file1, self.file_path)
+        with open(self.file_path, "a") as operator_file:
+            operator_file.write("\n+0047,0.1\n9,0.2\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_ok__summarize(self):
+        written = summary.write_summary(self.file_path)
+        self.assertDictEqual(summary.read_summary(self.file_path), written)
+        self.assertEqual(written["rows"], 9)
+        self.assertListEqual(sorted(written["digits"]), ["1", "4", "9"])
+        self.assertEqual(written["digits"]["4"]["rows"], 4)
+        self.assertEqual(written["digits"]["4"]["min"], "4673")
+        self.assertEqual(written["digits"]["4"]["max"], "47")
+        self.assertEqual(written["digits"]["4"]["start"], 0)
+
+    def test_ok__stale_summary(self):
+        # A summary is ignored once the operator file changed
+        summary.write_summary(self.file_path)
+        later = time.time() + 10
+        os.utime(self.file_path, (later, later))
+        self.assertIsNone(summary.read_summary(self.file_path))
+        self.assertIsNone(summary.get_region(self.file_path, "4"))
+
+    def test_ok__region(self):
+        # Only the lines starting with the digit are read
+        summary.write_summary(self.file_path)
+        start, end = summary.get_region(self.file_path, "9")
+        with open(self.file_path) as source:
+            self.assertListEqual(
+                list(summary.Region(source, start, end)), ["9,0.2\n"]
+            )
+        self.assertEqual(summary.get_region(self.file_path, "5"), (0, 0))
+
+    def test_ok__index_with_summary(self):
+        # Same lookups with or without a summary
+        phonenos = ["4673210", "4712", "1234", "9", "5"]
+        expected = [
+            index.build_index_in_pool([self.file_path], phoneno[0]).lookup(phoneno)
+            for phoneno in phonenos
+        ]
+        summary.write_summary(self.file_path)
+        self.assertListEqual(
+            [
+                index.build_index_in_pool([self.file_path], phoneno[0]).lookup(phoneno)
+                for phoneno in phonenos
+            ],
+            expected
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from cheap_caller import helpers
+from cheap_caller import index
+from cheap_caller import store
+from cheap_caller import vectorized
+
+
+@unittest.skipUnless(vectorized.available(), "NumPy is not installed")
+class TestVectorized(unittest.TestCase):
+    test_operatordir = os.path.abspath(
+        os.path.join(
+            os.path.dirname(__file__),
+            "data",
+        )
+    )
+    phonenos = [
+        "4673210", "46732", "4673", "467", "1234", "123", "1", "999",
+        "0046", "4" * 18, "4" * 19, "46.7", ""
+    ]
+
+    def setUp(self):
+        self.file_paths = [
+            os.path.join(self.test_operatordir, name)
+            for name in ["test_data1.txt", "test_data2.txt"]
+        ]
+        self.prefix_index = index.build_index_in_pool(self.file_paths)
+
+    def test_ok__lookup_many(self):
+        # Same results as the per number lookup, None when a number
+        # is not only digits or too long
+        results = vectorized.lookup_many(self.prefix_index.tables(), self.phonenos)
+        for phoneno, result in zip(self.phonenos, results):
+            if phoneno in ["4" * 19, "46.7"]:
+                self.assertIsNone(result)
+            else:
+                self.assertDictEqual(result, self.prefix_index.lookup(phoneno))
+
+    def test_ok__match(self):
+        valid, matches = vectorized.match(self.prefix_index.tables(), ["4673210", "1"])
+        self.assertListEqual(valid.tolist(), [True, True])
+        self.assertEqual(matches[0][0], "test_data1")
+        self.assertListEqual(matches[0][1].tolist(), [6, 0])
+        self.assertListEqual(matches[0][2].tolist(), [500000, 0])
+        self.assertListEqual(matches[1][1].tolist(), [5, 1])
+
+    def test_ok__lookup_many_stored_index(self):
+        # The key and price columns of a stored index are used in place
+        tmpdir = tempfile.mkdtemp()
+        try:
+            index_path = os.path.join(tmpdir, "test.index")
+            store.compile_index(index_path, self.file_paths)
+            stored_index = store.StoredIndex(index_path)
+            results = vectorized.lookup_many(stored_index.tables(), self.phonenos[:10])
+            for phoneno, result in zip(self.phonenos, results):
+                self.assertDictEqual(result, stored_index.lookup(phoneno))
+            stored_index.close()
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_ok__lookup_tables_many(self):
+        # Large batches go through the vectorized engine
+        phonenos = self.phonenos * vectorized.MIN_BATCH_SIZE
+        self.assertListEqual(
+            self.prefix_index.lookup_many(phonenos),
+            [self.prefix_index.lookup(phoneno) for phoneno in phonenos]
+        )
+
+    def test_ok__lookup_top_many(self):
+        # Same ranking as the per number lookup
+        phonenos = self.phonenos * vectorized.MIN_BATCH_SIZE
+        self.assertListEqual(
+            self.prefix_index.lookup_top_many(phonenos, 2),
+            [self.prefix_index.lookup_top(phoneno, 2) for phoneno in phonenos]
+        )
+        self.assertIsNone(
+            vectorized.lookup_top_many(self.prefix_index.tables(), ["46.7"], 1)[0]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()